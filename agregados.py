@@ -0,0 +1,364 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import carregamento
+from armazenamento import desserializar_df, serializar_df
+from consultas import CuboConsultas
+from normalizacao import COLUNA_ORDEM_MES, COLUNAS_BENEFICIARIOS, centavos
+from vidas import BaseVidas
+
+# ==============================================================================
+# Agregados derivados das planilhas (compartilhados entre sessões)
+# ==============================================================================
+# Cada agregado é memorizado pela versão dos dados de origem: quando o
+# carregamento troca a versão de um GID, a chave muda e o agregado é refeito
+# uma única vez para todo o processo. As funções recebem a Folha servida
+# (carregamento.load_folha*): a chave é a versão do DataFrame usado na
+# montagem, mesmo que o cache já tenha trocado de versão nesse meio-tempo.
+MAX_DERIVADOS = 128
+# Figuras, pivôs e estilos por filtro têm um LRU próprio: percorrer
+# combinações de filtros não tira da memória os cubos e índices dos dados.
+MAX_APRESENTACOES = 256
+# Formato dos agregados compartilhados entre réplicas (estado() das classes
+# abaixo). Vai na chave e no conteúdo: numa troca gradual de versão, réplicas
+# de código diferente não leem o agregado uma da outra, cada uma monta o seu.
+# Aumente ao mudar o estado() de qualquer tipo compartilhado.
+VERSAO_DERIVADOS = 1
+
+_derivados = OrderedDict()
+_apresentacoes = OrderedDict()
+_trava = threading.Lock()
+_AUSENTE = object()
+
+
+def chave_dados(*folhas):
+    return tuple((f.chave, f.versao) for f in folhas if f is not None)
+
+
+def _lembrar(memoria, chave):
+    with _trava:
+        if chave not in memoria: return _AUSENTE
+        memoria.move_to_end(chave)
+        return memoria[chave]
+
+
+def _guardar(memoria, limite, chave, valor):
+    with _trava:
+        memoria[chave] = valor
+        while len(memoria) > limite: memoria.popitem(last=False)
+    return valor
+
+
+def derivado(chave, construir, compartilhar=False):
+    # compartilhar: com o cache entre réplicas (carregamento.ARMAZEM), o
+    # agregado montado por uma réplica é lido pelas outras em vez de refeito.
+    # Só para agregados de dados; figuras e tabelas de tela vão em apresentacao().
+    valor = _lembrar(_derivados, chave)
+    if valor is not _AUSENTE: return valor
+    armazem = carregamento.ARMAZEM
+    if compartilhar and armazem.compartilhado:
+        # Trava entre réplicas: só uma monta, as outras esperam e leem.
+        chave_armazem = (VERSAO_DERIVADOS, chave)
+        with armazem.travar_derivado(chave_armazem):
+            valor = _de_arrays(armazem.ler_derivado(chave_armazem))
+            if valor is None:
+                valor = construir()
+                arrays = _para_arrays(valor)
+                if arrays is not None: armazem.gravar_derivado(chave_armazem, arrays)
+    else:
+        valor = construir()
+    return _guardar(_derivados, MAX_DERIVADOS, chave, valor)
+
+
+def apresentacao(chave, construir):
+    # Objetos de tela por filtro (figuras, pivôs, textos/estilos da matriz),
+    # sempre por processo e no LRU próprio.
+    valor = _lembrar(_apresentacoes, chave)
+    if valor is not _AUSENTE: return valor
+    return _guardar(_apresentacoes, MAX_APRESENTACOES, chave, construir())
+
+
+def _para_arrays(valor):
+    # Valor compartilhado -> arrays numpy (sem objetos Python): DataFrame como
+    # Arrow IPC, classes pelo seu estado(). Outros tipos ficam só no processo.
+    if isinstance(valor, pd.DataFrame): estado = {"arrow": np.frombuffer(serializar_df(valor), dtype=np.uint8)}
+    elif type(valor).__name__ in _COMPARTILHAVEIS: estado = valor.estado()
+    else: return None
+    return {"versao": np.array(VERSAO_DERIVADOS), "tipo": np.array(type(valor).__name__), **estado}
+
+
+def _de_arrays(arrays):
+    # Conteúdo de outra versão, de tipo desconhecido ou corrompido: None (remonta).
+    if not arrays or "versao" not in arrays or int(arrays["versao"]) != VERSAO_DERIVADOS: return None
+    try:
+        tipo = str(arrays["tipo"])
+        if tipo == "DataFrame": return desserializar_df(arrays["arrow"].tobytes())
+        return _COMPARTILHAVEIS[tipo].do_estado(arrays) if tipo in _COMPARTILHAVEIS else None
+    except Exception:
+        return None
+
+
+def _textos(valores):
+    return np.array([str(v) for v in valores], dtype=str)
+
+
+# ==============================================================================
+# Cubo (benefício x mês) do Orçamento de Benefícios
+# ==============================================================================
+def _montar_cubo_orcamento(df, papeis):
+    chaves = [c for c in (papeis["beneficio"], COLUNA_ORDEM_MES, papeis["mes"]) if c and c in df.columns]
+    valores = list(dict.fromkeys(c for c in (papeis["realizado"], papeis["orcado"]) if c))
+    if not chaves: return df
+    if not valores: return df[chaves].drop_duplicates().reset_index(drop=True)
+    return df.groupby(chaves, observed=True, dropna=False)[valores].sum().reset_index()
+
+
+def cubo_orcamento(folha, papeis):
+    # Soma de Realizado/Orçado por (benefício, mês), com as mesmas colunas da
+    # planilha original: os filtros e gráficos da visão rodam sobre o cubo, cujo
+    # tamanho depende de benefícios x meses e não do número de lançamentos.
+    return derivado(("cubo_orcamento", chave_dados(folha)), lambda: _montar_cubo_orcamento(folha.df, papeis), compartilhar=True)
+
+
+# ==============================================================================
+# Índice ano a ano (ano, mês, benefício) -> realizado
+# ==============================================================================
+MESES_DO_ANO = 12
+
+
+class IndiceAnual:
+    # Realizado alinhado num array denso [ano, mês, benefício], montado a partir
+    # dos cubos de orçamento de todos os anos carregados. Mês sem ordem
+    # reconhecida e benefício vazio ficam numa posição extra no fim do eixo:
+    # contam nos totais sem filtro, mas não aparecem como opção nem no gráfico.
+    # Trocar de mês ou de benefício vira indexação sobre o array.
+    def __init__(self, cubos):
+        # cubos: lista de (ano, cubo, papeis), do ano mais antigo ao mais recente.
+        self.anos = [str(ano) for ano, _, _ in cubos]
+        nomes = set()
+        for _, cubo, p in cubos:
+            if p["beneficio"] in cubo.columns: nomes.update(cubo[p["beneficio"]].dropna().astype(str))
+        self.beneficios = pd.Index(sorted(nomes), dtype=object)
+        forma = (len(self.anos), MESES_DO_ANO + 1, len(self.beneficios) + 1)
+        self.realizado = np.zeros(forma)
+        self.presente = np.zeros(forma, dtype=bool)
+        for i, (_, cubo, p) in enumerate(cubos):
+            if not p["realizado"] or p["realizado"] not in cubo.columns or cubo.empty: continue
+            meses = cubo[COLUNA_ORDEM_MES].to_numpy(np.int64) if COLUNA_ORDEM_MES in cubo.columns else np.full(len(cubo), 99)
+            meses = np.where((meses >= 1) & (meses <= MESES_DO_ANO), meses - 1, MESES_DO_ANO)
+            if p["beneficio"] in cubo.columns:
+                nomes_cubo = cubo[p["beneficio"]]
+                bens = self.beneficios.get_indexer(nomes_cubo.astype(str).to_numpy())
+                bens[nomes_cubo.isna().to_numpy()] = -1
+            else:
+                bens = np.full(len(cubo), -1)
+            bens = np.where(bens >= 0, bens, forma[2] - 1)
+            np.add.at(self.realizado[i], (meses, bens), np.nan_to_num(cubo[p["realizado"]].to_numpy(np.float64)))
+            self.presente[i, meses, bens] = True
+
+    def estado(self):
+        return {"anos": _textos(self.anos), "beneficios": _textos(self.beneficios), "realizado": self.realizado, "presente": self.presente}
+
+    @classmethod
+    def do_estado(cls, estado):
+        indice = cls.__new__(cls)
+        indice.anos = list(estado["anos"].astype(object))
+        indice.beneficios = pd.Index(estado["beneficios"].astype(object), dtype=object)
+        indice.realizado, indice.presente = estado["realizado"], estado["presente"]
+        return indice
+
+    def _colunas(self, beneficios=None):
+        if not beneficios: return slice(None)
+        posicoes = self.beneficios.get_indexer(list(beneficios))
+        return posicoes[posicoes >= 0]
+
+    def beneficios_do_mes(self, ordem_mes):
+        # Benefícios com lançamento no mês em qualquer um dos anos.
+        if not 1 <= ordem_mes <= MESES_DO_ANO: return []
+        return list(self.beneficios[self.presente[:, ordem_mes - 1, :-1].any(axis=0)])
+
+    def totais(self, ordem_mes, beneficios=None):
+        # Realizado do mês por ano (na ordem de self.anos).
+        if not 1 <= ordem_mes <= MESES_DO_ANO: return np.zeros(len(self.anos))
+        return self.realizado[:, ordem_mes - 1, self._colunas(beneficios)].sum(axis=1)
+
+    def por_beneficio(self, ordem_mes, beneficios=None):
+        # Formato longo (Benefício, Valor, Ano) para o gráfico agrupado; cada
+        # ano traz só os benefícios que têm lançamento no mês.
+        colunas = ['Benefício', 'Valor', 'Ano']
+        if not 1 <= ordem_mes <= MESES_DO_ANO: return pd.DataFrame(columns=colunas)
+        posicoes = np.arange(len(self.beneficios))[self._colunas(beneficios)]
+        presentes = self.presente[:, ordem_mes - 1, posicoes]
+        anos, bens = np.nonzero(presentes)
+        return pd.DataFrame({'Benefício': self.beneficios[posicoes[bens]], 'Valor': self.realizado[anos, ordem_mes - 1, posicoes[bens]],
+                             'Ano': np.array(self.anos, dtype=object)[anos]}, columns=colunas).sort_values('Valor', ascending=False)
+
+    def serie_mensal(self, beneficios=None):
+        # Tendência de vários anos: realizado por (ano, mês), meses reconhecidos.
+        valores = self.realizado[:, :MESES_DO_ANO, self._colunas(beneficios)].sum(axis=2)
+        return pd.DataFrame(valores, index=pd.Index(self.anos, name='Ano'), columns=pd.RangeIndex(1, MESES_DO_ANO + 1, name='Mês'))
+
+
+def indice_anual(fontes):
+    # fontes: lista de (ano, folha, papeis). Refeito só quando a versão de
+    # algum dos GIDs muda; os cubos de cada ano também são reaproveitados.
+    chave = ("indice_anual", tuple(str(ano) for ano, _, _ in fontes), chave_dados(*[folha for _, folha, _ in fontes]))
+    return derivado(chave, lambda: IndiceAnual([(ano, cubo_orcamento(folha, p), p) for ano, folha, p in fontes]), compartilhar=True)
+
+
+# ==============================================================================
+# Tendência executiva por período (tela Início)
+# ==============================================================================
+class TendenciaPeriodos:
+    # Visão materializada do custo realizado por período (mês), com acumulado,
+    # variação período a período e os KPIs da tela inicial já calculados: a
+    # página só lê atributos, seja qual for o tamanho do razão.
+    def __init__(self, ordens, custos):
+        self.ordens = np.asarray(ordens, dtype=np.int64)
+        self.custo = np.asarray(custos, dtype=np.float64)
+        self.periodos = [f"P{o}" for o in self.ordens]
+        self.acumulado = np.cumsum(self.custo)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.variacao = np.concatenate([[0.0], np.where(self.custo[:-1] > 0, self.custo[1:] / self.custo[:-1] - 1, 0.0)]) if len(self.custo) else self.custo
+        self.total = float(self.acumulado[-1]) if len(self.custo) else 0.0
+        self.media = self.total / len(self.custo) if len(self.custo) else 0.0
+        self.crescimento = float(self.custo[-1] / self.custo[0] - 1) if len(self.custo) and self.custo[0] > 0 else 0.0
+
+    def vazio(self):
+        return len(self.custo) == 0
+
+    def estado(self):
+        return {"ordens": self.ordens, "custos": self.custo}
+
+    @classmethod
+    def do_estado(cls, estado):
+        return cls(estado["ordens"], estado["custos"])
+
+    @classmethod
+    def do_cubo(cls, cubo, papeis):
+        if not papeis["realizado"] or COLUNA_ORDEM_MES not in cubo.columns or cubo.empty: return cls([], [])
+        ordens = cubo[COLUNA_ORDEM_MES].to_numpy(np.int64)
+        validos = (ordens >= 1) & (ordens <= MESES_DO_ANO)
+        custos = np.bincount(ordens[validos], weights=np.nan_to_num(cubo[papeis["realizado"]].to_numpy(np.float64)[validos]), minlength=MESES_DO_ANO + 1)
+        presentes = np.flatnonzero(np.bincount(ordens[validos], minlength=MESES_DO_ANO + 1))
+        return cls(presentes, custos[presentes])
+
+
+def tendencia_periodos(folha, papeis):
+    # Montada uma vez por versão da planilha (carga ou atualização), a partir do
+    # cubo benefício x mês que as outras visões já usam.
+    return derivado(("tendencia_periodos", chave_dados(folha)), lambda: TendenciaPeriodos.do_cubo(cubo_orcamento(folha, papeis), papeis), compartilhar=True)
+
+
+# Tipos que derivado(compartilhar=True) grava entre réplicas, além de DataFrame.
+_COMPARTILHAVEIS = {tipo.__name__: tipo for tipo in (IndiceAnual, TendenciaPeriodos, CuboConsultas)}
+
+
+# ==============================================================================
+# Agregados por Razão Social do Benefits Efficiency Map
+# ==============================================================================
+class ArmazemEmpresas:
+    # Guarda, por planilha de origem, o resumo por empresa (vidas, custo,
+    # benefícios) e as posições das vidas ativas de cada empresa para o
+    # drill-down, tudo tirado da BaseVidas. Só a fonte cuja
+    # versão mudou é reprocessada; o consolidado junta resumos já pequenos.
+    def __init__(self):
+        self._trava = threading.Lock()
+        self._fontes = {}
+        self._consolidado = None
+        self._geracao = 0
+
+    def atualizar_fonte(self, chave, versao, construir):
+        # versao: a da folha cujo DataFrame o construir devolve. As versões de
+        # uma chave só crescem: uma sessão que ainda segura a folha anterior
+        # não troca a fonte por dados mais velhos.
+        with self._trava:
+            fonte = self._fontes.get(chave)
+            if fonte is not None and fonte["versao"] >= versao: return
+        resumo = self._resumir(versao, construir())
+        with self._trava:
+            fonte = self._fontes.get(chave)
+            if fonte is not None and fonte["versao"] >= versao: return
+            self._fontes[chave] = resumo
+            self._consolidado = None
+            self._geracao += 1
+
+    def versoes(self):
+        # Versão de cada fonte no consolidado: chave das figuras do mapa.
+        with self._trava:
+            return tuple(sorted((chave, f["versao"]) for chave, f in self._fontes.items()))
+
+    @staticmethod
+    def _resumir(versao, detalhe):
+        if detalhe is None or detalhe.empty: return {"versao": versao, "detalhe": None}
+        base = BaseVidas(detalhe)
+        ativas = np.flatnonzero(base.mascara(ativo=True))
+        if not len(ativas) or 'Razão Social' not in base.codigos: return {"versao": versao, "detalhe": None}
+        # Vidas e custo por empresa direto dos códigos (bincount), acumulando o
+        # custo float32 em float64 já arredondado a centavos.
+        razoes = base.categorias['Razão Social']
+        codigos = base.codigos['Razão Social'][ativas]
+        ativas, codigos = ativas[codigos >= 0], codigos[codigos >= 0]
+        vidas = np.bincount(codigos, minlength=len(razoes))
+        custo = np.bincount(codigos, weights=centavos(base.custo[ativas]), minlength=len(razoes))
+        presentes = np.flatnonzero(vidas)
+        resumo = pd.DataFrame({'Vidas': vidas[presentes], 'Custo_Total': centavos(custo[presentes])}, index=razoes[presentes].astype(str))
+        beneficios = pd.Categorical.from_codes(base.codigos['Benefício'][ativas], base.categorias['Benefício']) if 'Benefício' in base.codigos else 'N/D'
+        pares = pd.DataFrame({'Razão Social': razoes[codigos].astype(str), 'Benefício': beneficios}).astype(str).drop_duplicates()
+        # Posições (no DataFrame da fonte) das vidas ativas de cada empresa.
+        ordem = np.argsort(codigos, kind="stable")
+        cortes = np.cumsum(vidas[presentes])[:-1]
+        indices = dict(zip(resumo.index, np.split(ativas[ordem], cortes)))
+        return {"versao": versao, "detalhe": detalhe, "resumo": resumo, "pares": pares, "indices": indices}
+
+    def _ativas(self):
+        return [f for f in self._fontes.values() if f["detalhe"] is not None]
+
+    def vazio(self):
+        with self._trava:
+            return not self._ativas()
+
+    def consolidado(self):
+        with self._trava:
+            if self._consolidado is not None: return self._consolidado
+            fontes, geracao = self._ativas(), self._geracao
+        if not fontes: return pd.DataFrame(columns=['Razão Social', 'Vidas', 'Custo_Total', 'Lista_Beneficios', 'Per Capita'])
+        resumo = pd.concat([f["resumo"] for f in fontes]).groupby(level=0).sum()
+        pares = pd.concat([f["pares"] for f in fontes]).drop_duplicates()
+        resumo['Lista_Beneficios'] = pares.groupby('Razão Social')['Benefício'].agg(list)
+        resumo['Per Capita'] = np.where(resumo['Vidas'] > 0, resumo['Custo_Total'] / resumo['Vidas'].clip(lower=1), 0.0)
+        consolidado = resumo.rename_axis('Razão Social').reset_index()
+        with self._trava:
+            if geracao == self._geracao: self._consolidado = consolidado
+        return consolidado
+
+    def detalhe(self, razao):
+        with self._trava:
+            fontes = self._ativas()
+        partes = [f["detalhe"].iloc[f["indices"][razao]] for f in fontes if razao in f["indices"]]
+        if not partes: return pd.DataFrame(columns=COLUNAS_BENEFICIARIOS)
+        # Custo em centavos (float64), como entra no Custo_Total da empresa.
+        detalhe = pd.concat(partes, ignore_index=True)
+        return detalhe.assign(Custo_Calculado=centavos(detalhe['Custo_Calculado']))
+
+
+ARMAZEM_EMPRESAS = ArmazemEmpresas()
+
+
+# ==============================================================================
+# Figuras e tabelas de tela por (visão, versão dos dados, filtros)
+# ==============================================================================
+def filtro(selecao):
+    # Seleção normalizada para a chave: a ordem dos cliques no multiselect não
+    # gera uma figura nova.
+    if isinstance(selecao, (list, tuple, set)): return tuple(sorted(map(str, selecao)))
+    return None if selecao is None else str(selecao)
+
+
+def figura(visao, nome, chave, construir):
+    # O go.Figure montado é reaproveitado por qualquer rerun/sessão com a mesma
+    # chave; o construir (groupby + plotly.express) só roda na primeira vez.
+    return apresentacao(("figura", visao, nome, chave), construir)
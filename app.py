@@ -1,11 +1,11 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import unicodedata
 import os
-import base64
-import numpy as np
+import time
+
+# A tela de login só precisa do Streamlit e dos ativos estáticos; pandas,
+# numpy, plotly e os módulos de dados são importados depois da autenticação
+# (seção 3).
+from ativos import ESTILO_BASE, ESTILO_LOGIN, LARGURA_FUNDO, url_do_ativo
 
 # ==============================================================================
 # 1. Configuração da Página
@@ -16,87 +16,16 @@ st.set_page_config(
     page_icon="favicon.png",
     initial_sidebar_state="expanded"
 )
+st.markdown(ESTILO_BASE, unsafe_allow_html=True)
 
 # ==============================================================================
 # 2. FUNÇÕES GERAIS E AUXILIARES
 # ==============================================================================
-def get_base64_of_bin_file(bin_file):
-    try:
-        with open(bin_file, 'rb') as f:
-            data = f.read()
-        return base64.b64encode(data).decode()
-    except:
-        return ""
-
 def set_png_as_page_bg(png_file):
-    bin_str = get_base64_of_bin_file(png_file)
-    if bin_str:
-        page_bg_img = '''
-        <style>
-        [data-testid="stAppViewContainer"] {
-            background-image: url("data:image/jpg;base64,%s");
-            background-size: cover;
-            background-position: center center;
-            background-repeat: no-repeat;
-            background-attachment: fixed;
-        }
-        [data-testid="stSidebar"] {
-            background-color: rgba(255, 255, 255, 0.95);
-        }
-        .login-box {
-            background-color: rgba(0, 0, 0, 0.85);
-            padding: 40px;
-            border-radius: 15px;
-            color: white;
-            text-align: center;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.5);
-            border: 1px solid rgba(255,255,255,0.1);
-        }
-        .login-box h1 { font-size: 26px; color: white !important; margin-bottom: 10px; }
-        .login-box h3 { font-size: 18px; color: #ff4b4b !important; margin-top: 0; font-weight: 500; margin-bottom: 20px; }
-        .login-box p { font-size: 14px; color: #cccccc !important; }
-        
-        .stProgress > div > div > div > div { background-color: #ff4b4b; }
-        .home-title {
-            margin-bottom: 0px;
-            display: flex;
-            align-items: center;
-            gap: 15px;
-            flex-wrap: wrap; 
-        }
-        button[data-baseweb="tab"] {
-            font-size: 16px !important;
-            font-weight: 600 !important;
-        }
-        .dataframe { font-size: 14px !important; }
-        
-        /* Estilos das Tags de Benefícios */
-        .badge-base { padding: 4px 10px; border-radius: 12px; font-size: 12px; font-weight: 600; color: white; display: inline-block; margin-right: 5px; margin-bottom: 5px; }
-        .bg-saude { background-color: #cc0000; }
-        .bg-educacao { background-color: #0044cc; }
-        .bg-outros { background-color: #ff9900; color: black !important; }
-        </style>
-        ''' % bin_str
-        st.markdown(page_bg_img, unsafe_allow_html=True)
-
-def formatar_moeda(valor):
-    try:
-        if pd.isna(valor): return "R$ 0,00"
-        return f"R$ {float(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
-        return "R$ 0,00"
-
-def remover_acentos(texto):
-    try:
-        nfkd = unicodedata.normalize('NFKD', str(texto))
-        return "".join([c for c in nfkd if not unicodedata.combining(c)]).lower()
-    except:
-        return str(texto).lower()
-
-def get_mes_ordem(nome_mes):
-    MAPA_MESES = {'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
-                  'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12}
-    return MAPA_MESES.get(str(nome_mes).lower()[:3], 99)
+    # Fundo reduzido e publicado uma vez por processo: a página recebe só a URL
+    # (ou o data URI memorizado, se o static serving estiver desligado).
+    url = url_do_ativo(png_file, largura_max=LARGURA_FUNDO, estatico=st.get_option("server.enableStaticServing"))
+    if url: st.markdown(ESTILO_LOGIN % url, unsafe_allow_html=True)
 
 def limpar_nome_mes(nome_sujo):
     try:
@@ -104,82 +33,10 @@ def limpar_nome_mes(nome_sujo):
     except:
         return str(nome_sujo)
 
-def achar_coluna(df, termos):
-    colunas_normalizadas = {col: remover_acentos(col) for col in df.columns}
-    for termo in termos:
-        termo_limpo = remover_acentos(termo)
-        for col_original, col_limpa in colunas_normalizadas.items():
-            if termo_limpo in col_limpa:
-                return col_original
-    return None
-
-@st.cache_data(ttl=600)
-def load_data(gid):
-    if not gid: return None
-    PUB_ID = "2PACX-1vRDOYmkYSNo7Ttbw0GM5YhDH3nYafq-Jg2o-fk1LaFOYjRw9oKQhwVe8YvBTdrmtOdzVsQdw-koM2oz"
-    url = f"https://docs.google.com/spreadsheets/d/e/{PUB_ID}/pub?gid={gid}&single=true&output=csv"
-    
-    try:
-        df = pd.read_csv(url)
-        termos_financeiros = ["custo", "valor", "total", "orçado", "realizado", "budget", "soma", "mensalidade", "preço"]
-        for col in df.columns:
-            col_norm = remover_acentos(col)
-            eh_financeiro = any(t in col_norm for t in termos_financeiros)
-            
-            primeiro_valor = df[col].dropna().iloc[0] if not df[col].dropna().empty else ""
-            tem_cifrao = "R$" in str(primeiro_valor)
-            
-            if eh_financeiro or tem_cifrao:
-                 if df[col].dtype == "object":
-                    df[col] = df[col].astype(str).str.replace("R$", "", regex=False)
-                    df[col] = df[col].str.replace(" ", "", regex=False)
-                    df[col] = df[col].str.replace(".", "", regex=False) 
-                    df[col] = df[col].str.replace(",", ".", regex=False) 
-                 df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
-        return df
-    except:
-        return None
-
-def padronizar_colunas(df, nome_beneficio):
-    if df is None or df.empty: return None
-
-    col_razao = achar_coluna(df, ["razão social", "razao social", "empresa", "cliente", "nome fantasia", "unidade"])
-    col_status = achar_coluna(df, ["status", "situacao"])
-    col_plano = achar_coluna(df, ["plano", "produto"])
-    col_tipo_usuario = achar_coluna(df, ["usuário", "usuario", "tipo"]) 
-    col_nome = achar_coluna(df, ["nome", "beneficiario", "colaborador"])
-    col_valor_titular = achar_coluna(df, ["valor titular", "custo titular"])
-    col_valor_dep = achar_coluna(df, ["valor dependente", "custo dependente"])
-    col_valor_unico = achar_coluna(df, ["valor", "custo", "preço", "mensalidade"])
-
-    if not col_razao: return None 
-    if col_status: df = df[df[col_status].astype(str).str.lower() == 'active'].copy()
-    
-    df['Custo_Calculado'] = 0.0
-    if col_tipo_usuario and col_valor_titular and col_valor_dep:
-        df['Custo_Calculado'] = np.where(df[col_tipo_usuario].astype(str).str.lower().str.contains('titular'), df[col_valor_titular], df[col_valor_dep])
-    elif col_valor_unico:
-        df['Custo_Calculado'] = df[col_valor_unico]
-    df['Custo_Calculado'] = df['Custo_Calculado'].fillna(0)
-
-    if col_plano: df['Benefício_Final'] = df[col_plano]
-    else: df['Benefício_Final'] = nome_beneficio
-
-    df = df.rename(columns={col_razao: 'Razão Social', col_nome: 'Nome', 'Benefício_Final': 'Benefício'})
-    
-    if 'Regional' not in df.columns:
-        col_reg = achar_coluna(df, ["regional", "região", "estado"])
-        df['Regional'] = df[col_reg] if col_reg else 'Geral'
-        
-    cols_uteis = ['Razão Social', 'Benefício', 'Custo_Calculado', 'Nome', 'Regional']
-    if 'Nome' not in df.columns: df['Nome'] = 'Colaborador'
-    return df[cols_uteis]
-
 def processar_consultas(df):
     if df is None or df.empty: return None
-    col_razao = achar_coluna(df, ["razão social", "razao social", "empresa"])
-    col_status = achar_coluna(df, ["status consulta", "status"])
-    col_especialidade = achar_coluna(df, ["especialidade", "tipo consulta"])
+    c = resolver_papeis(df, PAPEIS_CONSULTAS)
+    col_razao, col_status, col_especialidade = c["razao"], c["status"], c["especialidade"]
     if not col_razao: return None
     
     mapping = {col_razao: 'Razão Social'}
@@ -190,7 +47,7 @@ def processar_consultas(df):
     if 'Status_Consulta' not in df.columns: df['Status_Consulta'] = 'Realizada'
     if 'Especialidade' not in df.columns: df['Especialidade'] = 'Geral'
     
-    return df[['Razão Social', 'Status_Consulta', 'Especialidade']]
+    return df[['Razão Social', 'Status_Consulta', 'Especialidade']].astype("category")
 
 def recarregar_app():
     if hasattr(st, "rerun"): st.rerun()
@@ -230,6 +87,74 @@ def check_password():
     return False
 
 if not check_password(): st.stop()
+inicio_rerun = time.perf_counter()
+
+# Bibliotecas pesadas: carregadas uma vez por processo, no primeiro rerun
+# autenticado (depois ficam em sys.modules e o import é só uma consulta).
+import pandas as pd
+import numpy as np
+import plotly.express as px
+import plotly.graph_objects as go
+
+from agregados import ARMAZEM_EMPRESAS, ArmazemEmpresas, TendenciaPeriodos, apresentacao, chave_dados, cubo_orcamento, derivado, figura, filtro, indice_anual, tendencia_periodos
+from carregamento import QUARENTENA, TEMPOS, atualizar, chave_beneficiarios, definir_contratos, load_folha, load_many_beneficiarios, load_many_folhas
+from contratos import CONTRATO_CONSULTAS, CONTRATO_ORCAMENTO
+from consultas import CuboConsultas
+from formatacao import ESTILO_TOTAL, formatar_moeda, gradiente, moeda_brl, percentual, rotulos, tabela_moeda_brl
+from normalizacao import COLUNA_ORDEM_MES, PAPEIS_CONSULTAS, PAPEIS_ORCAMENTO, get_mes_ordem, resolver_papeis
+from telemetria import amostras, contadores, contar, medir, registrar, resumo_cache, resumo_etapas
+from exportacao import formatos_disponiveis, obter, solicitar
+
+# Regiões com filtros rodam como fragmentos: um clique nelas reexecuta só o
+# bloco, não o script inteiro. Sem st.fragment, viram funções comuns.
+fragmento = st.fragment if hasattr(st, "fragment") else (lambda funcao: funcao)
+
+def contar_regiao(regiao):
+    # Execuções por sessão ("completa" = script inteiro) e no processo.
+    execucoes = st.session_state.setdefault("execucoes", {})
+    execucoes[regiao] = execucoes.get(regiao, 0) + 1
+    contar(regiao)
+
+contar_regiao("completa")
+
+# Exportações: o rerun só agenda o trabalho no pool de exportacao.py e mostra
+# o progresso; com st.fragment, só o bloco de progresso é reexecutado até o
+# arquivo ficar pronto.
+INTERVALO_EXPORTACAO = 1
+
+def acompanhar_exportacao(id_trabalho):
+    trabalho = obter(id_trabalho)
+    if trabalho is None: return
+    if trabalho.estado == "pronto":
+        st.download_button(f"⬇️ Baixar {trabalho.nome_arquivo} ({trabalho.linhas} linhas)", trabalho.dados, file_name=trabalho.nome_arquivo, mime=trabalho.mime, key=f"baixar_{trabalho.id}")
+    elif trabalho.estado == "erro":
+        st.error(f"🚫 Falha ao gerar {trabalho.nome_arquivo}. {trabalho.erro}")
+    else:
+        st.progress(trabalho.progresso, text=f"Gerando {trabalho.nome_arquivo}... {trabalho.progresso:.0%}")
+        if not hasattr(st, "fragment"): st.button("🔄 Atualizar progresso", key=f"progresso_{trabalho.id}")
+
+if hasattr(st, "fragment"):
+    @st.fragment(run_every=INTERVALO_EXPORTACAO)
+    def acompanhar_exportacao_ao_vivo(id_trabalho):
+        acompanhar_exportacao(id_trabalho)
+        trabalho = obter(id_trabalho)
+        # Concluído: um rerun completo troca para o bloco estático (sem polling).
+        if trabalho is None or trabalho.concluido(): recarregar_app()
+else:
+    acompanhar_exportacao_ao_vivo = acompanhar_exportacao
+
+def painel_exportacao(nome, chave, nome_arquivo, construir):
+    c1, c2 = st.columns([1, 2])
+    formato = c1.selectbox("Formato:", formatos_disponiveis(), key=f"formato_{nome}", label_visibility="collapsed")
+    if c2.button("📤 Gerar arquivo", key=f"gerar_{nome}"):
+        st.session_state[f"exportacao_{nome}"] = solicitar(chave, nome_arquivo, formato, construir).id
+    id_trabalho = st.session_state.get(f"exportacao_{nome}")
+    trabalho = obter(id_trabalho) if id_trabalho else None
+    # Arquivo de outros dados/filtros (a seleção ou a versão mudou desde o
+    # pedido): não é oferecido; o usuário gera de novo.
+    if trabalho is None or trabalho.chave[0] != chave: return
+    if trabalho.concluido(): acompanhar_exportacao(id_trabalho)
+    else: acompanhar_exportacao_ao_vivo(id_trabalho)
 
 # ==============================================================================
 # 4. NAVEGAÇÃO LATERAL (SIDEBAR)
@@ -241,13 +166,34 @@ if role == "admin": st.sidebar.caption("🔧 Modo Admin Ativo")
 st.sidebar.markdown("---")
 
 # 🔴🔴🔴 GIDS DA BASE DE DADOS 🔴🔴🔴
-GID_2026 = "1350897026"
-GID_2025 = "1743422062"
-GID_BASE_COMPLETA = "1919747553" # Saúde
-GID_WYDEN = "" 
-GID_EP = "" 
-GID_STAAGE = ""
-GID_CONSULTAS = "" # Consultas
+# Cada GID pode ser trocado por variável de ambiente (DASHBOARD_GID_<NOME>),
+# o que permite apontar o painel para planilhas de teste ou sintéticas.
+GID_2026 = os.environ.get("DASHBOARD_GID_2026", "1350897026")
+GID_2025 = os.environ.get("DASHBOARD_GID_2025", "1743422062")
+GID_BASE_COMPLETA = os.environ.get("DASHBOARD_GID_BASE_COMPLETA", "1919747553") # Saúde
+GID_WYDEN = os.environ.get("DASHBOARD_GID_WYDEN", "")
+GID_EP = os.environ.get("DASHBOARD_GID_EP", "")
+GID_STAAGE = os.environ.get("DASHBOARD_GID_STAAGE", "")
+GID_CONSULTAS = os.environ.get("DASHBOARD_GID_CONSULTAS", "") # Consultas
+
+# Planilhas de orçamento por ano, do mais antigo ao mais recente. A Análise
+# Financeira compara todos os anos listados (o último contra o penúltimo).
+GIDS_ORCAMENTO_ANUAL = {"2025": GID_2025, "2026": GID_2026}
+
+# Bases de vidas do Benefits Efficiency Map: (GID, nome do benefício).
+FONTES_BENEFICIARIOS = [(GID_BASE_COMPLETA, "V4 - Starbem"), (GID_WYDEN, "Wyden"), (GID_EP, "English Pass"), (GID_STAAGE, "Staage")]
+
+# Contratos de esquema (contratos.py): planilha com o cabeçalho esperado é lida
+# já tipada e as linhas fora do contrato vão para a quarentena; cabeçalho
+# diferente cai na detecção heurística das colunas. As colunas dos contratos
+# ainda não foram conferidas com o cabeçalho das planilhas de produção: só
+# valem com DASHBOARD_CONTRATOS=1 (ex.: planilhas sintéticas do benchmark).
+if os.environ.get("DASHBOARD_CONTRATOS", "").lower() in ("1", "true", "sim"):
+    definir_contratos({**{gid: CONTRATO_ORCAMENTO for gid in GIDS_ORCAMENTO_ANUAL.values()}, GID_CONSULTAS: CONTRATO_CONSULTAS})
+
+def aviso_quarentena(*gids):
+    recusadas = sum(QUARENTENA[g].total for g in gids if g in QUARENTENA)
+    if recusadas: st.caption(f"⚠️ {recusadas} linha(s) fora do contrato da planilha foram deixadas de fora (detalhes no Painel de Latência).")
 
 OPCOES_MENU = [
     "Início", 
@@ -256,13 +202,30 @@ OPCOES_MENU = [
     "Benefits Efficiency Map"
 ]
 
+GID_ANO_CORRENTE = list(GIDS_ORCAMENTO_ANUAL.values())[-1]
+
+# Planilhas lidas por cada visão.
+GIDS_POR_VISAO = {
+    "Início": [GID_ANO_CORRENTE],
+    "Orçamento de Benefícios": list(reversed(GIDS_ORCAMENTO_ANUAL.values())),
+    "Análise Financeira": list(GIDS_ORCAMENTO_ANUAL.values()),
+    # Bases de vidas entram pela chave da ingestão em lotes, não pelo GID: o
+    # "Atualizar" revalida a base padronizada, nunca baixa a planilha bruta.
+    "Benefits Efficiency Map": [chave_beneficiarios(gid, nome) for gid, nome in FONTES_BENEFICIARIOS if gid] + [GID_CONSULTAS],
+}
+
 st.sidebar.header("Navegação Estratégica")
 aba_selecionada = st.sidebar.radio("Escolha a Visão:", OPCOES_MENU, label_visibility="collapsed")
 
 st.sidebar.markdown("<br><br><br>", unsafe_allow_html=True) 
 
 if st.sidebar.button("🔄 Atualizar Dados", use_container_width=True):
-    st.cache_data.clear()
+    # Revalida só as planilhas da visão atual (ou todas, na tela inicial) sem
+    # derrubar o cache das demais sessões.
+    if aba_selecionada == "Início": gids_visao = list(dict.fromkeys(g for gids in GIDS_POR_VISAO.values() for g in gids))
+    else: gids_visao = GIDS_POR_VISAO[aba_selecionada]
+    with st.spinner("Atualizando planilhas..."):
+        atualizar(gids_visao)
     recarregar_app()
 
 if st.sidebar.button("Sair / Logout", use_container_width=True):
@@ -275,9 +238,8 @@ if st.sidebar.button("Sair / Logout", use_container_width=True):
 
 if aba_selecionada == "Início":
     st.markdown("<br>", unsafe_allow_html=True)
-    logo_b64 = ""
-    if os.path.exists("favicon.png"): logo_b64 = get_base64_of_bin_file("favicon.png")
-    logo_html = f'<img src="data:image/png;base64,{logo_b64}" style="height: 65px;">' if logo_b64 else ""
+    logo_src = url_do_ativo("favicon.png", estatico=st.get_option("server.enableStaticServing"))
+    logo_html = f'<img src="{logo_src}" style="height: 65px;">' if logo_src else ""
     st.markdown(f"""
         <div style="background-color: #1e1e1e; padding: 35px; border-radius: 12px; border-left: 6px solid #ff4b4b; box-shadow: 0 4px 10px rgba(0,0,0,0.4); margin-bottom: 30px;">
             <h1 class="home-title" style="color: white; margin-top: 0px;">{logo_html} Benefits Platform</h1>
@@ -288,55 +250,122 @@ if aba_selecionada == "Início":
 
     st.markdown("---")
     st.subheader("📈 Visão Executiva: Evolução do Custo Anual de Benefícios")
-    st.caption("Acompanhamento da estabilização de custos (Períodos 1 a 12).")
+    st.caption("Acompanhamento do custo realizado por período do ano corrente.")
     
-    dados_totais = {
-        "Período": ["P1", "P2", "P3", "P4", "P5", "P6", "P7", "P8", "P9", "P10", "P11", "P12"],
-        "Custo": [261554.66, 267902.94, 272756.06, 281187.74, 283075.06, 282339.74, 286653.62, 288124.26, 288859.58, 290330.22, 290330.22, 290330.22]
-    }
-    df_trend = pd.DataFrame(dados_totais)
-    total_ano = df_trend["Custo"].sum()
-    media_mes = df_trend["Custo"].mean()
-    crescimento = (df_trend["Custo"].iloc[-1] / df_trend["Custo"].iloc[0]) - 1
+    # Custo realizado por período do ano mais recente, lido da visão
+    # materializada (refeita só quando a planilha muda). Sem a planilha, o
+    # painel mostra a série de referência fixa.
+    TENDENCIA_REFERENCIA = TendenciaPeriodos(range(1, 13), [261554.66, 267902.94, 272756.06, 281187.74, 283075.06, 282339.74, 286653.62, 288124.26, 288859.58, 290330.22, 290330.22, 290330.22])
+    gid_atual = GID_ANO_CORRENTE
+    with medir("Início", "carga"): folha_atual = load_folha(gid_atual)
+    tendencia, chave_tendencia = None, "referencia"
+    if folha_atual is not None and folha_atual.df is not None and not folha_atual.df.empty:
+        with medir("Início", "tendencia"):
+            tendencia = tendencia_periodos(folha_atual, resolver_papeis(folha_atual.df, PAPEIS_ORCAMENTO))
+            chave_tendencia = chave_dados(folha_atual)
+    aviso_quarentena(gid_atual)
+    if tendencia is None or tendencia.vazio():
+        st.caption("ℹ️ Planilha do ano corrente indisponível: exibindo a série de referência.")
+        tendencia, chave_tendencia = TENDENCIA_REFERENCIA, "referencia"
 
     col1, col2, col3 = st.columns(3)
-    col1.metric("Custo Total Anual", f"R$ {total_ano/1000000:.2f} Milhões")
-    col2.metric("Média por Período", f"R$ {media_mes/1000:.1f}k")
-    col3.metric("Inflação da Carteira (P1 a P12)", f"+{crescimento*100:.1f}%", delta="Aumento estabilizado", delta_color="inverse")
-
-    df_trend['Texto_Exibicao'] = df_trend['Custo'].apply(lambda x: f"R$ {x/1000:.0f}k")
-    fig_executivo = px.bar(df_trend, x="Período", y="Custo", text='Texto_Exibicao')
-    fig_executivo.add_scatter(x=df_trend['Período'], y=df_trend['Custo'], mode='lines+markers', name='Curva', line=dict(color='#cc0000', width=3), marker=dict(size=8, color='#cc0000'), showlegend=False)
-    fig_executivo.update_traces(marker_color='#d3d3d3', textposition='outside')
-    fig_executivo.update_layout(template="plotly_white", yaxis_visible=False, xaxis_title="", height=350, margin=dict(t=30, b=0, l=0, r=0))
-    st.plotly_chart(fig_executivo, use_container_width=True)
+    col1.metric("Custo Total Anual", f"R$ {tendencia.total/1000000:.2f} Milhões")
+    col2.metric("Média por Período", f"R$ {tendencia.media/1000:.1f}k")
+    # Variação do custo do primeiro ao último período: alta em vermelho, queda em verde.
+    variacao_periodo = float(tendencia.custo[-1] - tendencia.custo[0])
+    delta_inflacao = f"{'+' if variacao_periodo > 0 else '-'}R$ {abs(variacao_periodo)/1000:.1f}k vs. {tendencia.periodos[0]}" if variacao_periodo else None
+    col3.metric(f"Inflação da Carteira ({tendencia.periodos[0]} a {tendencia.periodos[-1]})", f"{tendencia.crescimento*100:+.1f}%", delta=delta_inflacao, delta_color="inverse")
+
+    def montar_executivo():
+        texto = rotulos(tendencia.custo / 1000, "R$ {:.0f}k")
+        acumulado = rotulos(tendencia.acumulado, "R$ {:,.2f}")
+        fig_executivo = go.Figure(go.Bar(x=tendencia.periodos, y=tendencia.custo, text=texto, textposition='outside', marker_color='#d3d3d3',
+                                         customdata=acumulado, hovertemplate="%{x}<br>Custo: R$ %{y:,.2f}<br>Acumulado: %{customdata}<extra></extra>"))
+        fig_executivo.add_scatter(x=tendencia.periodos, y=tendencia.custo, mode='lines+markers', name='Curva', line=dict(color='#cc0000', width=3), marker=dict(size=8, color='#cc0000'), showlegend=False)
+        fig_executivo.update_layout(template="plotly_white", yaxis_visible=False, xaxis_title="", height=350, margin=dict(t=30, b=0, l=0, r=0))
+        return fig_executivo
+
+    with medir("Início", "grafico_executivo"):
+        fig_executivo = figura("Início", "executivo", chave_tendencia, montar_executivo)
+        st.plotly_chart(fig_executivo, use_container_width=True)
 
 elif aba_selecionada == "Orçamento de Benefícios":
     st.header("🎯 Orçamento de Benefícios")
     st.markdown("<br>", unsafe_allow_html=True)
     
+    def montar_evolucao_mensal(df_filt, col_mes, col_real, col_orc):
+        vars_p = [col_real]
+        if col_orc: vars_p.insert(0, col_orc)
+        df_c = df_filt.groupby([COLUNA_ORDEM_MES, col_mes], observed=True)[vars_p].sum().reset_index()
+        df_c = df_c.rename(columns={COLUNA_ORDEM_MES: 'ordem'}).sort_values('ordem')
+        df_c['Mes_Clean'] = df_c[col_mes].apply(limpar_nome_mes)
+        if df_c.empty: return None
+        df_m = df_c.melt(id_vars=['Mes_Clean', 'ordem'], value_vars=vars_p, var_name="Tipo", value_name="Valor")
+        cores = {col_real: '#CC0000'}; 
+        if col_orc: cores[col_orc] = '#D3D3D3'
+        fig = px.bar(df_m, x="Mes_Clean", y="Valor", color="Tipo", barmode="group", text_auto='.2s', color_discrete_map=cores)
+        fig.add_scatter(x=df_c['Mes_Clean'], y=df_c[col_real], mode='lines+markers', name='Tendência', line=dict(color='#ffffff', width=2.5, shape='spline'), marker=dict(size=8, color='#ffffff', line=dict(width=1, color='#000000')), showlegend=False)
+        fig.update_layout(template="plotly_white", yaxis_tickprefix="R$ ", xaxis_title="", xaxis={'categoryorder':'array', 'categoryarray': df_c['Mes_Clean'].unique()})
+        return fig
+
+    def montar_distribuicao(df_filt, col_ben, col_real):
+        df_p = df_filt.groupby(col_ben, observed=True)[col_real].sum().reset_index()
+        total_real = df_p[col_real].sum()
+        if total_real <= 0: return None
+        df_p['Percentual'] = df_p[col_real] / total_real
+        df_final_p = df_p.sort_values(col_real, ascending=True)
+        df_final_p['Cor'] = np.where(df_final_p[col_real] == df_final_p[col_real].max(), '#990000', '#ff4b4b')
+        df_final_p['Texto'] = moeda_brl(df_final_p[col_real], casas=0) + " (" + percentual(df_final_p['Percentual']) + ")"
+        fig_p = px.bar(df_final_p, y=col_ben, x=col_real, orientation='h', text='Texto')
+        fig_p.update_traces(marker_color=df_final_p['Cor'], textposition='inside', insidetextanchor='middle', textfont=dict(color='white', size=13))
+        fig_p.update_layout(template="plotly_white", xaxis_visible=False, yaxis_title="", margin=dict(l=0, r=0, t=10, b=0), height=400)
+        return fig_p
+
+    def montar_pivot(df_filt, col_ben, col_mes, col_real):
+        piv = df_filt.pivot_table(index=col_ben, columns=col_mes, values=col_real, aggfunc='sum', fill_value=0, observed=True)
+        piv = piv[sorted(piv.columns, key=get_mes_ordem)]
+        piv.columns = [limpar_nome_mes(c) for c in piv.columns]
+        piv["Total Anual"] = piv.sum(axis=1)
+        piv = piv.sort_values("Total Anual", ascending=False)
+        lin_tot = piv.sum(); lin_tot.name = "TOTAL GERAL"
+        return pd.concat([piv, lin_tot.to_frame().T])
+
+    def montar_matriz(piv):
+        # Textos em R$ e CSS de cada célula saem prontos em arrays: o Styler só
+        # recebe o resultado, sem background_gradient/matplotlib por célula.
+        texto = tabela_moeda_brl(piv)
+        estilos = np.full(piv.shape, "", dtype=object)
+        cols = [i for i, c in enumerate(piv.columns) if c != "Total Anual"]
+        estilos[:-1, cols] = gradiente(piv.iloc[:-1, cols].to_numpy(), vmin=0)
+        estilos[:, piv.columns.get_loc("Total Anual")] = ESTILO_TOTAL
+        return texto, estilos
+
+    @fragmento
     def renderizar_aba_orcamento(ano, gid_atual):
+        contar_regiao(f"orcamento_{ano}")
         try:
-            df = load_data(gid_atual)
+            with medir("Orçamento de Benefícios", "carga"): folha = load_folha(gid_atual)
+            df = folha.df if folha is not None else None
             if df is None or df.empty:
                 st.warning(f"Os dados de {ano} não foram encontrados ou estão vazios.")
                 return
+            aviso_quarentena(gid_atual)
 
-            f1, f2 = st.columns(2)
-            df_filt = df.copy()
-            col_mes = achar_coluna(df, ["mês", "mes", "data"])
-            col_ben = achar_coluna(df, ["beneficio", "benefício"])
-            col_real = achar_coluna(df, ["realizado", "executado", "soma", "custo", "valor"])
-            col_orc = achar_coluna(df, ["orçado", "orcado", "budget"])
-
-            if col_mes:
-                meses = sorted(df[col_mes].astype(str).unique(), key=get_mes_ordem)
-                sel_m = f1.multiselect("Filtrar por Mês:", meses, key=f"m_{ano}")
-                if sel_m: df_filt = df_filt[df_filt[col_mes].isin(sel_m)]
-            if col_ben:
-                bens = sorted(df[col_ben].astype(str).unique())
-                sel_b = f2.multiselect("Filtrar por Benefício:", bens, key=f"b_{ano}")
-                if sel_b: df_filt = df_filt[df_filt[col_ben].isin(sel_b)]
+            c = resolver_papeis(df, PAPEIS_ORCAMENTO)
+            col_mes, col_ben, col_real, col_orc = c["mes"], c["beneficio"], c["realizado"], c["orcado"]
+            with medir("Orçamento de Benefícios", "cubo"): df_filt = cubo_orcamento(folha, c)
+
+            # Meses e benefícios são escolhidos juntos e só valem no "Aplicar":
+            # as opções vêm do cubo inteiro, para não mudarem no meio da escolha.
+            with st.form(key=f"filtros_{ano}", border=False):
+                f1, f2 = st.columns(2)
+                meses = sorted(map(str, df_filt[col_mes].dropna().unique()), key=get_mes_ordem) if col_mes else []
+                bens = sorted(map(str, df_filt[col_ben].dropna().unique())) if col_ben else []
+                sel_m = f1.multiselect("Filtrar por Mês:", meses, key=f"m_{ano}") if col_mes else []
+                sel_b = f2.multiselect("Filtrar por Benefício:", bens, key=f"b_{ano}") if col_ben else []
+                st.form_submit_button("Aplicar filtros")
+            if sel_m: df_filt = df_filt[df_filt[col_mes].isin(sel_m)]
+            if sel_b: df_filt = df_filt[df_filt[col_ben].isin(sel_b)]
 
             realizado = df_filt[col_real].sum() if col_real else 0
             BUDGET_ANUAL = 3432000.00
@@ -352,146 +381,143 @@ elif aba_selecionada == "Orçamento de Benefícios":
             
             st.markdown("---")
             g1, g2 = st.columns(2)
-            with g1:
+            # Figuras memorizadas por (versão da planilha, filtros): interações que
+            # não mudam os filtros reaproveitam o go.Figure já montado.
+            chave_filtros = (chave_dados(folha), filtro(sel_m), filtro(sel_b))
+            with g1, medir("Orçamento de Benefícios", "evolucao_mensal"):
                 st.subheader("Evolução Mensal")
                 if col_mes and col_real:
-                    vars_p = [col_real]
-                    if col_orc: vars_p.insert(0, col_orc)
-                    df_c = df_filt.groupby(col_mes)[vars_p].sum().reset_index()
-                    df_c['ordem'] = df_c[col_mes].apply(get_mes_ordem)
-                    df_c = df_c.sort_values('ordem')
-                    df_c['Mes_Clean'] = df_c[col_mes].apply(limpar_nome_mes)
-                    if not df_c.empty:
-                        df_m = df_c.melt(id_vars=['Mes_Clean', 'ordem'], value_vars=vars_p, var_name="Tipo", value_name="Valor")
-                        cores = {col_real: '#CC0000'}; 
-                        if col_orc: cores[col_orc] = '#D3D3D3'
-                        fig = px.bar(df_m, x="Mes_Clean", y="Valor", color="Tipo", barmode="group", text_auto='.2s', color_discrete_map=cores)
-                        fig.add_scatter(x=df_c['Mes_Clean'], y=df_c[col_real], mode='lines+markers', name='Tendência', line=dict(color='#ffffff', width=2.5, shape='spline'), marker=dict(size=8, color='#ffffff', line=dict(width=1, color='#000000')), showlegend=False)
-                        fig.update_layout(template="plotly_white", yaxis_tickprefix="R$ ", xaxis_title="", xaxis={'categoryorder':'array', 'categoryarray': df_c['Mes_Clean'].unique()})
-                        st.plotly_chart(fig, use_container_width=True)
-            with g2:
+                    fig = figura(aba_selecionada, "evolucao_mensal", chave_filtros, lambda: montar_evolucao_mensal(df_filt, col_mes, col_real, col_orc))
+                    if fig is not None: st.plotly_chart(fig, use_container_width=True)
+            with g2, medir("Orçamento de Benefícios", "distribuicao"):
                 st.subheader("Distribuição Estratégica")
                 if col_ben and col_real:
-                    df_p = df_filt.groupby(col_ben)[col_real].sum().reset_index()
-                    total_real = df_p[col_real].sum()
-                    if total_real > 0:
-                        df_p['Percentual'] = df_p[col_real] / total_real
-                        df_final_p = df_p.sort_values(col_real, ascending=True)
-                        df_final_p['Cor'] = df_final_p.apply(lambda x: '#990000' if x[col_real] == df_final_p[col_real].max() else '#ff4b4b', axis=1)
-                        df_final_p['Texto'] = df_final_p.apply(lambda x: f"R$ {x[col_real]:,.0f}".replace(',','_').replace('.',',').replace('_','.') + f" ({x['Percentual']*100:.1f}%)", axis=1)
-                        fig_p = px.bar(df_final_p, y=col_ben, x=col_real, orientation='h', text='Texto')
-                        fig_p.update_traces(marker_color=df_final_p['Cor'], textposition='inside', insidetextanchor='middle', textfont=dict(color='white', size=13))
-                        fig_p.update_layout(template="plotly_white", xaxis_visible=False, yaxis_title="", margin=dict(l=0, r=0, t=10, b=0), height=400)
-                        st.plotly_chart(fig_p, use_container_width=True)
+                    fig_p = figura(aba_selecionada, "distribuicao", chave_filtros, lambda: montar_distribuicao(df_filt, col_ben, col_real))
+                    if fig_p is not None: st.plotly_chart(fig_p, use_container_width=True)
             
             st.markdown("---")
             st.subheader("📑 Visão Matricial Detalhada")
-            if col_ben and col_mes and col_real and not df_filt.empty:
-                piv = df_filt.pivot_table(index=col_ben, columns=col_mes, values=col_real, aggfunc='sum', fill_value=0)
-                piv = piv[sorted(piv.columns, key=get_mes_ordem)]
-                piv.columns = [limpar_nome_mes(c) for c in piv.columns]
-                piv["Total Anual"] = piv.sum(axis=1)
-                piv = piv.sort_values("Total Anual", ascending=False)
-                lin_tot = piv.sum(); lin_tot.name = "TOTAL GERAL"
-                piv = pd.concat([piv, lin_tot.to_frame().T])
-                sty = piv.style.format("R$ {:,.2f}")
-                cols = [c for c in piv.columns if c != "Total Anual"]
-                sty = sty.background_gradient(cmap="Reds", subset=(piv.index[:-1], cols), vmin=0)
-                sty = sty.applymap(lambda x: "background-color: #f0f2f6; color: black; font-weight: bold;", subset=["Total Anual"])
-                st.dataframe(sty, use_container_width=True)
+            with medir("Orçamento de Benefícios", "visao_matricial"):
+                if col_ben and col_mes and col_real and not df_filt.empty:
+                    piv = apresentacao(("pivot_orcamento", chave_filtros), lambda: montar_pivot(df_filt, col_ben, col_mes, col_real))
+                    texto, estilos = apresentacao(("visao_matricial", chave_filtros), lambda: montar_matriz(piv))
+                    st.dataframe(texto.style.apply(lambda _: estilos, axis=None), use_container_width=True)
+                    with st.expander("📤 Exportar Visão Matricial"):
+                        painel_exportacao(f"matriz_{ano}", ("pivot_orcamento", chave_filtros), f"visao_matricial_{ano}", lambda: piv.rename_axis("Benefício").reset_index())
         except Exception as e:
             st.error(f"Erro ao renderizar a visão de orçamento. {e}")
 
-    tab_2026, tab_2025 = st.tabs(["📅 Visão 2026", "📅 Visão 2025"])
-    with tab_2026: renderizar_aba_orcamento("2026", GID_2026)
-    with tab_2025: renderizar_aba_orcamento("2025", GID_2025)
+    # Só a aba aberta baixa a sua planilha e monta os gráficos (on_change="rerun"
+    # dá o .open de cada aba). Versões sem abas preguiçosas usam um seletor.
+    # Uma aba por ano de GIDS_ORCAMENTO_ANUAL, do mais recente ao mais antigo.
+    anos = list(reversed(GIDS_ORCAMENTO_ANUAL.items()))
+    rotulos_anos = [f"📅 Visão {ano}" for ano, _ in anos]
+    try:
+        abas = st.tabs(rotulos_anos, key="aba_orcamento", on_change="rerun")
+        abertas = [aba.open is not False for aba in abas]
+    except TypeError:
+        escolhido = st.radio("Ano:", rotulos_anos, horizontal=True, label_visibility="collapsed", key="aba_orcamento")
+        abas = [st.container() for _ in anos]
+        abertas = [r == escolhido for r in rotulos_anos]
+    for aba, aberta, (ano, gid) in zip(abas, abertas, anos):
+        if not aberta: continue
+        with aba, medir(aba_selecionada, f"aba_{ano}"): renderizar_aba_orcamento(ano, gid)
 
 elif aba_selecionada == "Análise Financeira":
     st.header("⚖️ Análise Financeira (Mês a Mês)")
-    st.caption("Selecione o mês abaixo para comparar o desempenho exato entre 2025 e 2026.")
-    try:
-        with st.spinner("Carregando dados..."):
-            df_2025 = load_data(GID_2025)
-            df_2026 = load_data(GID_2026)
-        
-        if df_2025 is not None and df_2026 is not None:
-            col_real_25 = achar_coluna(df_2025, ["realizado", "executado", "soma", "custo", "valor"])
-            col_real_26 = achar_coluna(df_2026, ["realizado", "executado", "soma", "custo", "valor"])
-            col_mes_25 = achar_coluna(df_2025, ["mês", "mes", "data"])
-            col_mes_26 = achar_coluna(df_2026, ["mês", "mes", "data"])
-            col_ben_25 = achar_coluna(df_2025, ["beneficio", "benefício"])
-            col_ben_26 = achar_coluna(df_2026, ["beneficio", "benefício"])
-
-            if all([col_real_25, col_real_26, col_mes_25, col_mes_26, col_ben_25, col_ben_26]):
-                f1, f2 = st.columns(2)
-                LISTA_MESES_EXTENSO = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-                mes_selecionado = f1.selectbox("📅 Selecione o Mês:", LISTA_MESES_EXTENSO, index=0)
-                
-                ordem_mes = get_mes_ordem(mes_selecionado)
-                df_25_m = df_2025[df_2025[col_mes_25].apply(get_mes_ordem) == ordem_mes]
-                df_26_m = df_2026[df_2026[col_mes_26].apply(get_mes_ordem) == ordem_mes]
-                
-                bens_25 = df_25_m[col_ben_25].unique().tolist() if not df_25_m.empty else []
-                bens_26 = df_26_m[col_ben_26].unique().tolist() if not df_26_m.empty else []
-                bens_total = sorted(list(set(bens_25) | set(bens_26)))
-                
-                sel_ben = f2.multiselect("🔍 Filtrar Benefícios (Opcional):", bens_total)
-                
-                if sel_ben:
-                    df_25_final = df_25_m[df_25_m[col_ben_25].isin(sel_ben)]
-                    df_26_final = df_26_m[df_26_m[col_ben_26].isin(sel_ben)]
-                else:
-                    df_25_final = df_25_m
-                    df_26_final = df_26_m
-                    
-                total_25 = df_25_final[col_real_25].sum() if not df_25_final.empty else 0
-                total_26 = df_26_final[col_real_26].sum() if not df_26_final.empty else 0
-                delta = total_26 - total_25
-                delta_perc = (delta / total_25 * 100) if total_25 > 0 else 0
-                
-                st.markdown(f"### Resultados de **{mes_selecionado}**")
-                k1, k2, k3 = st.columns(3)
-                k1.metric("Realizado 2025", formatar_moeda(total_25))
-                k2.metric("Realizado 2026", formatar_moeda(total_26))
-                k3.metric("Diferença (R$)", formatar_moeda(delta), delta=f"{delta_perc:.1f}%", delta_color="inverse")
-                
-                st.markdown("---")
-                
-                view_25 = df_25_final.groupby(col_ben_25)[col_real_25].sum().reset_index() if not df_25_final.empty else pd.DataFrame(columns=[col_ben_25, col_real_25])
-                view_25.columns = ['Benefício', 'Valor']; view_25['Ano'] = '2025'
-                
-                view_26 = df_26_final.groupby(col_ben_26)[col_real_26].sum().reset_index() if not df_26_final.empty else pd.DataFrame(columns=[col_ben_26, col_real_26])
-                view_26.columns = ['Benefício', 'Valor']; view_26['Ano'] = '2026'
-                
-                df_chart = pd.concat([view_25, view_26]).sort_values('Valor', ascending=False)
-                if not df_chart.empty:
-                    fig = px.bar(df_chart, x="Benefício", y="Valor", color="Ano", barmode="group", text_auto='.2s', color_discrete_map={'2025': '#999999', '2026': '#CC0000'}, height=500)
-                    fig.update_layout(template="plotly_white", yaxis_tickprefix="R$ ", xaxis_title=None, yaxis_title="Custo Realizado")
-                    st.plotly_chart(fig, use_container_width=True)
-            else:
+    anos = list(GIDS_ORCAMENTO_ANUAL)
+    st.caption(f"Selecione o mês abaixo para comparar o desempenho exato entre {', '.join(anos[:-1])} e {anos[-1]}.")
+
+    # Mês e benefícios só reexecutam este bloco (fragmento), e os benefícios
+    # só valem ao clicar em "Aplicar": escolher cinco benefícios é uma
+    # recomputação, não cinco. As planilhas são lidas dentro do fragmento: um
+    # rerun só do fragmento depois de uma revalidação em segundo plano usa as
+    # folhas novas, não as da última execução completa.
+    @fragmento
+    def renderizar_comparativo():
+        contar_regiao("comparativo")
+        try:
+            with st.spinner("Carregando dados..."), medir(aba_selecionada, "carga"):
+                planilhas = load_many_folhas(GIDS_POR_VISAO[aba_selecionada])
+            aviso_quarentena(*GIDS_POR_VISAO[aba_selecionada])
+            if not all(planilhas.get(gid) is not None and planilhas[gid].df is not None for gid in GIDS_ORCAMENTO_ANUAL.values()):
+                st.info("Carregando planilhas financeiras...")
+                return
+            papeis = {ano: resolver_papeis(planilhas[gid].df, PAPEIS_ORCAMENTO) for ano, gid in GIDS_ORCAMENTO_ANUAL.items()}
+            if not all(p["realizado"] and p["mes"] and p["beneficio"] for p in papeis.values()):
                 st.warning("⚠️ Algumas colunas não foram encontradas na planilha.")
-        else:
-            st.info("Carregando planilhas financeiras...")
-    except Exception as e:
-        st.error(f"Erro na Análise Financeira. {e}")
+                return
+
+            f1, f2 = st.columns(2)
+            LISTA_MESES_EXTENSO = ['Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+            mes_selecionado = f1.selectbox("📅 Selecione o Mês:", LISTA_MESES_EXTENSO, index=0)
+
+            # Índice (ano, mês, benefício) -> realizado, montado uma vez por
+            # versão das planilhas: mês e benefícios viram consultas no array.
+            with medir(aba_selecionada, "indice_anual"):
+                indice = indice_anual([(ano, planilhas[gid], papeis[ano]) for ano, gid in GIDS_ORCAMENTO_ANUAL.items()])
+            ordem_mes = get_mes_ordem(mes_selecionado)
+
+            with f2.form(key="filtros_financeira", border=False):
+                sel_ben = st.multiselect("🔍 Filtrar Benefícios (Opcional):", indice.beneficios_do_mes(ordem_mes))
+                st.form_submit_button("Aplicar filtros")
+
+            totais = indice.totais(ordem_mes, sel_ben)
+            total_anterior, total_atual = (totais[-2], totais[-1]) if len(totais) > 1 else (0, totais[-1])
+            delta = total_atual - total_anterior
+            delta_perc = (delta / total_anterior * 100) if total_anterior > 0 else 0
+
+            st.markdown(f"### Resultados de **{mes_selecionado}**")
+            colunas_kpi = st.columns(len(anos) + 1)
+            for coluna, ano, total in zip(colunas_kpi, anos, totais): coluna.metric(f"Realizado {ano}", formatar_moeda(total))
+            colunas_kpi[-1].metric("Diferença (R$)", formatar_moeda(delta), delta=f"{delta_perc:.1f}%", delta_color="inverse")
+
+            st.markdown("---")
+
+            with medir(aba_selecionada, "agregacao"):
+                df_chart = indice.por_beneficio(ordem_mes, sel_ben)
+
+            def montar_comparativo():
+                # Anos anteriores em tons de cinza; o mais recente em vermelho.
+                cinzas = ['#999999', '#bbbbbb', '#777777', '#dddddd', '#555555']
+                cores = {ano: cinzas[(len(anos) - 2 - i) % len(cinzas)] for i, ano in enumerate(anos[:-1])}
+                cores[anos[-1]] = '#CC0000'
+                fig = px.bar(df_chart, x="Benefício", y="Valor", color="Ano", barmode="group", text_auto='.2s', color_discrete_map=cores, category_orders={"Ano": anos}, height=500)
+                fig.update_layout(template="plotly_white", yaxis_tickprefix="R$ ", xaxis_title=None, yaxis_title="Custo Realizado")
+                return fig
+
+            with medir(aba_selecionada, "grafico_comparativo"):
+                if not df_chart.empty:
+                    chave_filtros = (chave_dados(*planilhas.values()), mes_selecionado, filtro(sel_ben))
+                    st.plotly_chart(figura(aba_selecionada, "comparativo", chave_filtros, montar_comparativo), use_container_width=True)
+        except Exception as e:
+            st.error(f"Erro na Análise Financeira. {e}")
+
+    renderizar_comparativo()
 
 elif aba_selecionada == "Benefits Efficiency Map":
     st.header("🗺️ Benefits Efficiency Map")
     st.caption("Visão estratégica de escala, custo e eficiência por Razão Social (Unificando Saúde e Educação).")
 
     try:
-        df_saude = padronizar_colunas(load_data(GID_BASE_COMPLETA), "V4 - Starbem")
-        df_wyden = padronizar_colunas(load_data(GID_WYDEN), "Wyden")
-        df_ep = padronizar_colunas(load_data(GID_EP), "English Pass")
-        df_staage = padronizar_colunas(load_data(GID_STAAGE), "Staage")
-
-        dfs = [d for d in [df_saude, df_wyden, df_ep, df_staage] if d is not None]
-        df_detalhado = pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
-
-        df_consultas_raw = load_data(GID_CONSULTAS)
-        df_consultas = processar_consultas(df_consultas_raw)
-
-        if df_detalhado.empty and df_consultas is None:
+        # As bases de vidas chegam já padronizadas pela ingestão em lotes; só a
+        # planilha cuja versão mudou é reagregada.
+        fontes = FONTES_BENEFICIARIOS
+        with medir(aba_selecionada, "carga"):
+            bases = load_many_beneficiarios(fontes)
+            folha_consultas = load_folha(GID_CONSULTAS)
+        aviso_quarentena(GID_CONSULTAS)
+        armazem = ARMAZEM_EMPRESAS
+        with medir(aba_selecionada, "armazem"):
+            for gid, nome in fontes:
+                # Versão da folha servida, a mesma do DataFrame entregue ao construir.
+                folha = bases.get(gid)
+                armazem.atualizar_fonte(gid or nome, folha.versao if folha is not None else 0, lambda folha=folha: folha.df if folha is not None else None)
+
+        with medir(aba_selecionada, "consultas"):
+            cubo_consultas = derivado(("consultas", chave_dados(folha_consultas)), lambda: CuboConsultas(processar_consultas(folha_consultas.df if folha_consultas else None)), compartilhar=True)
+
+        if armazem.vazio() and cubo_consultas.vazio():
             st.info("ℹ️ Exibindo dados simulados. Para ver a visão completa, insira os GIDs das abas no final do código.")
             mock_data = {
                 "Razão Social": ["REGECOM MARKETING LTDA"]*5 + ["V4 COMPANY S.A."]*10,
@@ -500,41 +526,45 @@ elif aba_selecionada == "Benefits Efficiency Map":
                 "Nome": [f"Funcionario {i}" for i in range(15)],
                 "Regional": ["Geral"]*15
             }
-            df_detalhado = pd.DataFrame(mock_data)
+            armazem = ArmazemEmpresas()
+            armazem.atualizar_fonte("simulado", 0, lambda: pd.DataFrame(mock_data))
 
         st.markdown("##### 🩺 Filtros de Utilização (Consultas)")
-        fc1, fc2 = st.columns(2)
         
         qtd_consultas_por_empresa = pd.DataFrame(columns=['Razão Social', 'Total_Consultas']) 
+        sel_status, sel_esp = [], []
         
-        if df_consultas is not None and not df_consultas.empty:
-            status_opcoes = sorted(df_consultas['Status_Consulta'].dropna().unique())
-            sel_status = fc1.multiselect("Status da Consulta:", status_opcoes, default=[s for s in status_opcoes if 'finalizado' in str(s).lower()])
-            esp_opcoes = sorted(df_consultas['Especialidade'].dropna().unique())
-            sel_esp = fc2.multiselect("Especialidade:", esp_opcoes)
+        if not cubo_consultas.vazio():
+            # Status e especialidades só valem no "Aplicar": o mapa inteiro é
+            # recalculado uma vez por lote de escolhas.
+            with st.form(key="filtros_consultas", border=False):
+                fc1, fc2 = st.columns(2)
+                status_opcoes = cubo_consultas.status_opcoes()
+                sel_status = fc1.multiselect("Status da Consulta:", status_opcoes, default=[s for s in status_opcoes if 'finalizado' in str(s).lower()])
+                sel_esp = fc2.multiselect("Especialidade:", cubo_consultas.especialidade_opcoes())
+                st.form_submit_button("Aplicar filtros")
             
-            df_cons_filt = df_consultas.copy()
-            if sel_status: df_cons_filt = df_cons_filt[df_cons_filt['Status_Consulta'].isin(sel_status)]
-            if sel_esp: df_cons_filt = df_cons_filt[df_cons_filt['Especialidade'].isin(sel_esp)]
-            
-            qtd_consultas_por_empresa = df_cons_filt.groupby('Razão Social').size().reset_index(name='Total_Consultas')
+            # Soma sobre as fatias do cubo (empresa x status x especialidade)
+            # montado uma vez por versão da planilha; nenhuma linha é varrida.
+            with medir(aba_selecionada, "filtro_consultas"): qtd_consultas_por_empresa = cubo_consultas.por_empresa(sel_status, sel_esp)
 
         st.markdown("---")
 
-        if not df_detalhado.empty:
-            df_agg = df_detalhado.groupby(['Razão Social']).agg(
-                Vidas=('Custo_Calculado', 'count'),
-                Custo_Total=('Custo_Calculado', 'sum'),
-                Lista_Beneficios=('Benefício', lambda x: list(set(x)))
-            ).reset_index()
+        # Chaves das figuras: versões das bases de vidas/consultas e filtros. Trocar
+        # a Razão Social do Raio-X não remonta a dispersão.
+        chave_vidas = (armazem.versoes(), armazem is ARMAZEM_EMPRESAS)
+        chave_consultas = chave_dados(folha_consultas)
+        chave_mapa = (chave_vidas, chave_consultas, filtro(sel_status), filtro(sel_esp))
+
+        if not armazem.vazio():
+            with medir(aba_selecionada, "consolidado"): df_agg = armazem.consolidado()
             
             if not qtd_consultas_por_empresa.empty:
+                qtd_consultas_por_empresa['Razão Social'] = qtd_consultas_por_empresa['Razão Social'].astype(str)
                 df_agg = pd.merge(df_agg, qtd_consultas_por_empresa, on='Razão Social', how='left')
                 df_agg['Total_Consultas'] = df_agg['Total_Consultas'].fillna(0).astype(int)
             else:
-                df_agg['Total_Consultas'] = 0
-                
-            df_agg['Per Capita'] = df_agg.apply(lambda x: x['Custo_Total'] / x['Vidas'] if x['Vidas'] > 0 else 0, axis=1)
+                df_agg = df_agg.assign(Total_Consultas=0)
             
             media_pc = df_agg['Per Capita'].mean()
             total_vidas = df_agg['Vidas'].sum()
@@ -549,15 +579,10 @@ elif aba_selecionada == "Benefits Efficiency Map":
             k4.metric("Média Consultas/Vida", f"{utilizacao:.2f}")
 
             std_pc = df_agg['Per Capita'].std() if len(df_agg) > 1 else 0
-            def classificar(val):
-                if val > media_pc + std_pc: return '🔴 Alto'
-                elif val < media_pc - std_pc: return '🟢 Eficiente'
-                return '🟡 Na Média'
-            df_agg['Status'] = df_agg['Per Capita'].apply(classificar)
+            per_capita = df_agg['Per Capita'].to_numpy()
+            df_agg['Status'] = np.select([per_capita > media_pc + std_pc, per_capita < media_pc - std_pc], ['🔴 Alto', '🟢 Eficiente'], '🟡 Na Média')
 
-            col_grafico, col_ranking = st.columns([6, 4])
-            with col_grafico:
-                st.markdown("##### 🎯 Escala vs. Eficiência")
+            def montar_dispersao():
                 fig_scatter = px.scatter(
                     df_agg, x='Vidas', y='Per Capita', size='Custo_Total', color='Status',
                     hover_name='Razão Social', hover_data=['Total_Consultas'], size_max=40,
@@ -565,66 +590,130 @@ elif aba_selecionada == "Benefits Efficiency Map":
                 )
                 fig_scatter.add_hline(y=media_pc, line_dash="dot", line_color="#ffffff", annotation_text="Média")
                 fig_scatter.update_layout(template="plotly_white", height=450, margin=dict(l=0, r=0, t=30, b=0))
-                st.plotly_chart(fig_scatter, use_container_width=True)
+                return fig_scatter
+
+            col_grafico, col_ranking = st.columns([6, 4])
+            with col_grafico, medir(aba_selecionada, "dispersao"):
+                st.markdown("##### 🎯 Escala vs. Eficiência")
+                st.plotly_chart(figura(aba_selecionada, "dispersao", chave_mapa, montar_dispersao), use_container_width=True)
 
-            with col_ranking:
+            with col_ranking, medir(aba_selecionada, "ranking"):
                 st.markdown("##### 🏆 Top Utilizadores (Consultas)")
                 df_ranking = df_agg[['Razão Social', 'Vidas', 'Total_Consultas']].sort_values(by='Total_Consultas', ascending=False).head(10)
-                st.dataframe(df_ranking.style.background_gradient(cmap='Reds', subset=['Total_Consultas']), hide_index=True, use_container_width=True, height=450)
+                st.dataframe(df_ranking.style.apply(gradiente, subset=['Total_Consultas']), hide_index=True, use_container_width=True, height=450)
+
+            with st.expander("📤 Exportar agregados por empresa"):
+                colunas_exportacao = ['Razão Social', 'Vidas', 'Custo_Total', 'Per Capita', 'Total_Consultas', 'Status', 'Lista_Beneficios']
+                painel_exportacao("empresas", ("empresas", chave_mapa), "agregados_por_empresa", lambda df=df_agg: df[colunas_exportacao].round({'Custo_Total': 2, 'Per Capita': 2}))
 
             st.markdown("---")
-            st.markdown("##### 🔍 Raio-X Detalhado (Por Razão Social)")
+
+            # Trocar a Razão Social só reexecuta o Raio-X (fragmento); KPIs,
+            # dispersão e ranking ficam como estão.
+            @fragmento
+            def renderizar_raio_x(df_agg, armazem):
+                contar_regiao("raio_x")
+                try:
+                    st.markdown("##### 🔍 Raio-X Detalhado (Por Razão Social)")
             
-            lista_razao = sorted(df_agg['Razão Social'].unique())
-            razao_sel = st.selectbox("Selecione a Razão Social para investigar:", ["Selecione..."] + lista_razao)
+                    lista_razao = sorted(df_agg['Razão Social'].unique())
+                    razao_sel = st.selectbox("Selecione a Razão Social para investigar:", ["Selecione..."] + lista_razao)
 
-            if razao_sel != "Selecione...":
-                df_filtrado = df_detalhado[df_detalhado['Razão Social'] == razao_sel]
-                dados_resumo = df_agg[df_agg['Razão Social'] == razao_sel].iloc[0]
+                    if razao_sel != "Selecione...":
+                        dados_resumo = df_agg[df_agg['Razão Social'] == razao_sel].iloc[0]
                 
-                st.markdown(f"#### Detalhes: **{razao_sel}**")
+                        st.markdown(f"#### Detalhes: **{razao_sel}**")
                 
-                html_tags = ""
-                lista_bens = dados_resumo['Lista_Beneficios']
-                if isinstance(lista_bens, list):
-                    for ben in lista_bens:
-                        classe_cor = "bg-outros"
-                        nome_clean = str(ben).lower()
-                        if "starbem" in nome_clean or "saúde" in nome_clean: classe_cor = "bg-saude"
-                        elif "english" in nome_clean or "wyden" in nome_clean: classe_cor = "bg-educacao"
-                        html_tags += f"<span class='badge-base {classe_cor}'>{ben}</span>"
-                st.markdown(html_tags, unsafe_allow_html=True)
-                st.markdown("<br>", unsafe_allow_html=True)
-
-                r1, r2, r3, r4 = st.columns(4)
-                r1.metric("Custo Total", formatar_moeda(dados_resumo['Custo_Total']))
-                r2.metric("Per Capita", formatar_moeda(dados_resumo['Per Capita']))
-                r3.metric("Vidas Ativas", int(dados_resumo['Vidas']))
-                r4.metric("Consultas Realizadas", int(dados_resumo['Total_Consultas']))
+                        html_tags = ""
+                        lista_bens = dados_resumo['Lista_Beneficios']
+                        if isinstance(lista_bens, list):
+                            for ben in lista_bens:
+                                classe_cor = "bg-outros"
+                                nome_clean = str(ben).lower()
+                                if "starbem" in nome_clean or "saúde" in nome_clean: classe_cor = "bg-saude"
+                                elif "english" in nome_clean or "wyden" in nome_clean: classe_cor = "bg-educacao"
+                                html_tags += f"<span class='badge-base {classe_cor}'>{ben}</span>"
+                        st.markdown(html_tags, unsafe_allow_html=True)
+                        st.markdown("<br>", unsafe_allow_html=True)
+
+                        r1, r2, r3, r4 = st.columns(4)
+                        r1.metric("Custo Total", formatar_moeda(dados_resumo['Custo_Total']))
+                        r2.metric("Per Capita", formatar_moeda(dados_resumo['Per Capita']))
+                        r3.metric("Vidas Ativas", int(dados_resumo['Vidas']))
+                        r4.metric("Consultas Realizadas", int(dados_resumo['Total_Consultas']))
                 
-                col_d1, col_d2 = st.columns([1, 1])
-                with col_d1:
-                    st.markdown("**Composição do Custo:**")
-                    df_bar = df_filtrado.groupby('Benefício')['Custo_Calculado'].sum().reset_index().sort_values('Custo_Calculado')
-                    df_bar['Texto'] = df_bar['Custo_Calculado'].apply(lambda x: formatar_moeda(x))
-                    fig_bar = px.bar(df_bar, y='Benefício', x='Custo_Calculado', orientation='h', text='Texto')
-                    fig_bar.update_traces(marker_color='#ff4b4b', textposition='inside', insidetextanchor='middle', textfont=dict(color='white'))
-                    fig_bar.update_layout(template="plotly_white", height=300, xaxis_visible=False, yaxis_title="")
-                    st.plotly_chart(fig_bar, use_container_width=True)
-                    
-                with col_d2:
-                    st.markdown("**Top Especialidades Consultadas:**")
-                    if df_consultas is not None and not df_consultas.empty:
-                        df_cons_empresa = df_consultas[df_consultas['Razão Social'] == razao_sel]
-                        if not df_cons_empresa.empty:
-                            top_esp = df_cons_empresa['Especialidade'].value_counts().reset_index()
+                        def montar_composicao():
+                            df_filtrado = armazem.detalhe(razao_sel)
+                            df_bar = df_filtrado.groupby('Benefício', observed=True)['Custo_Calculado'].sum().round(2).reset_index().sort_values('Custo_Calculado')
+                            df_bar['Texto'] = moeda_brl(df_bar['Custo_Calculado'])
+                            fig_bar = px.bar(df_bar, y='Benefício', x='Custo_Calculado', orientation='h', text='Texto')
+                            fig_bar.update_traces(marker_color='#ff4b4b', textposition='inside', insidetextanchor='middle', textfont=dict(color='white'))
+                            fig_bar.update_layout(template="plotly_white", height=300, xaxis_visible=False, yaxis_title="")
+                            return fig_bar
+
+                        def montar_especialidades():
+                            contagem = cubo_consultas.especialidades_de(razao_sel)
+                            if contagem.empty: return None
+                            top_esp = contagem.reset_index()
                             top_esp.columns = ['Especialidade', 'Qtd']
                             fig_pie = px.pie(top_esp.head(5), values='Qtd', names='Especialidade', hole=0.4)
                             fig_pie.update_layout(height=300, margin=dict(l=0, r=0, t=0, b=0))
-                            st.plotly_chart(fig_pie, use_container_width=True)
-                        else:
-                            st.info("Nenhuma consulta registrada para esta empresa.")
-                    else:
-                        st.caption("Dados de consultas indisponíveis.")
+                            return fig_pie
+
+                        col_d1, col_d2 = st.columns([1, 1])
+                        with col_d1, medir(aba_selecionada, "composicao_custo"):
+                            st.markdown("**Composição do Custo:**")
+                            st.plotly_chart(figura(aba_selecionada, "composicao_custo", (chave_vidas, razao_sel), montar_composicao), use_container_width=True)
+                    
+                        with col_d2, medir(aba_selecionada, "especialidades"):
+                            st.markdown("**Top Especialidades Consultadas:**")
+                            if not cubo_consultas.vazio():
+                                fig_pie = figura(aba_selecionada, "especialidades", (chave_consultas, razao_sel), montar_especialidades)
+                                if fig_pie is not None:
+                                    st.plotly_chart(fig_pie, use_container_width=True)
+                                else:
+                                    st.info("Nenhuma consulta registrada para esta empresa.")
+                            else:
+                                st.caption("Dados de consultas indisponíveis.")
+
+                        with st.expander(f"📤 Exportar vidas de {razao_sel}"):
+                            painel_exportacao("raio_x", ("raio_x", chave_vidas, razao_sel), f"raio_x_{razao_sel}", lambda: armazem.detalhe(razao_sel))
+                except Exception as e:
+                    st.error(f"Erro ao processar o Raio-X. Detalhe técnico: {e}")
+
+            renderizar_raio_x(df_agg, armazem)
     except Exception as e:
         st.error(f"Erro ao processar o Mapa de Eficiência. Detalhe técnico: {e}")
+
+# ==============================================================================
+# 6. TELEMETRIA (somente admin)
+# ==============================================================================
+registrar(aba_selecionada, "total", time.perf_counter() - inicio_rerun)
+
+if role == "admin" and st.sidebar.toggle("⏱️ Painel de Latência", value=False):
+    with st.sidebar:
+        etapas = pd.DataFrame(resumo_etapas())
+        if etapas.empty:
+            st.caption("Sem medições ainda.")
+        else:
+            st.dataframe(etapas.round(1), hide_index=True, use_container_width=True)
+            rotulos_etapas = [f"{v} · {e}" for v, e in zip(etapas["Visão"], etapas["Etapa"])]
+            padrao = rotulos_etapas.index(f"{aba_selecionada} · total") if f"{aba_selecionada} · total" in rotulos_etapas else 0
+            escolhida = st.selectbox("Histograma da etapa:", rotulos_etapas, index=padrao)
+            visao_h, etapa_h = escolhida.split(" · ", 1)
+            fig_lat = px.histogram(x=amostras(visao_h, etapa_h), nbins=30, labels={"x": "ms"})
+            fig_lat.update_layout(template="plotly_white", height=220, margin=dict(l=0, r=0, t=10, b=0), yaxis_title="")
+            st.plotly_chart(fig_lat, use_container_width=True)
+        st.caption("Execuções por região (sessão / processo)")
+        execucoes = st.session_state.get("execucoes", {})
+        st.dataframe(pd.DataFrame([{"Região": r, "Sessão": execucoes.get(r, 0), "Processo": n} for r, n in contadores().items()]), hide_index=True, use_container_width=True)
+        st.caption("Cache por planilha (memória / snapshot / falta)")
+        st.dataframe(pd.DataFrame(resumo_cache()).fillna(0), hide_index=True, use_container_width=True)
+        st.caption("Última carga por planilha")
+        st.dataframe(pd.DataFrame.from_dict(TEMPOS, orient="index"), use_container_width=True)
+        if QUARENTENA:
+            st.caption("Contrato e quarentena por planilha")
+            quarentenas = {chave: q.resumo() for chave, q in QUARENTENA.items()}
+            st.dataframe(pd.DataFrame.from_dict(quarentenas, orient="index").astype({"divergencia": str, "motivos": str}), use_container_width=True)
+            amostras_quarentena = [{"Planilha": chave, **linha} for chave, q in QUARENTENA.items() for linha in q.amostra]
+            if amostras_quarentena: st.dataframe(pd.DataFrame(amostras_quarentena).astype(str), hide_index=True, use_container_width=True)
@@ -0,0 +1,272 @@
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = feather = None
+
+# ==============================================================================
+# Armazenamento das planilhas normalizadas (snapshot local ou cache compartilhado)
+# ==============================================================================
+# Backends com a mesma interface, escolhidos por DASHBOARD_CACHE:
+#   processo (padrão): cada processo tem o seu cache; a pasta só guarda o
+#                      snapshot para a partida a frio.
+#   disco:             pasta compartilhada entre réplicas (volume comum).
+#   sqlite:            um arquivo SQLite compartilhado entre réplicas.
+# Nos compartilhados, metadados e dados são versionados por chave (GID), a
+# revalidação de cada chave tem uma trava entre processos (só uma réplica
+# baixa por vez) e as outras adotam a versão que ela gravou. Derivados (cubos,
+# índices) vão como npz só de arrays numpy, lido sem allow_pickle: bytes de um
+# volume compartilhado nunca executam código.
+VERSOES_MANTIDAS = 2
+MAX_DERIVADOS_COMPARTILHADOS = 256
+ESPERA_TRAVA_SEGUNDOS = 0.05
+# Trava de uma réplica que morreu no meio da revalidação expira sozinha (SQLite;
+# no disco o flock é solto pelo sistema quando o processo termina).
+VALIDADE_TRAVA_SEGUNDOS = 120
+
+
+def _nome_arquivo(chave):
+    return re.sub(r"[^\w.-]", "_", str(chave))
+
+
+def _nome_derivado(chave):
+    # repr de tuplas de str/int/None é estável entre processos (nada de set/hash).
+    return hashlib.sha1(repr(chave).encode()).hexdigest()
+
+
+def serializar_df(df):
+    # DataFrame -> Arrow IPC (tipos, categorias e int8 preservados).
+    tabela = pa.Table.from_pandas(df, preserve_index=False)
+    saida = pa.BufferOutputStream()
+    with pa.ipc.new_stream(saida, tabela.schema) as escritor: escritor.write_table(tabela)
+    return saida.getvalue().to_pybytes()
+
+
+def desserializar_df(dados):
+    return pa.ipc.open_stream(pa.py_buffer(dados)).read_all().to_pandas()
+
+
+def _ler_arrays(origem):
+    with np.load(origem, allow_pickle=False) as npz: return {nome: npz[nome] for nome in npz.files}
+
+
+class ArmazemDisco:
+    # Um Feather sem compressão por (chave, versão) e um JSON de metadados por
+    # chave, sempre gravados em .tmp + os.replace: leitores nunca veem arquivo
+    # pela metade. Os dados são gravados antes dos metadados que apontam para eles.
+    def __init__(self, pasta, compartilhado=False):
+        self.pasta = pasta
+        self.compartilhado = compartilhado
+
+    def _caminho(self, chave, sufixo):
+        return os.path.join(self.pasta, _nome_arquivo(chave) + sufixo)
+
+    def _gravar_atomico(self, caminho, escrever):
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+        try:
+            escrever(temporario)
+            os.replace(temporario, caminho)
+        finally:
+            if os.path.exists(temporario): os.remove(temporario)
+
+    def ler_meta(self, chave):
+        try:
+            with open(self._caminho(chave, ".json")) as f: return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def ler_dados(self, chave, versao):
+        if feather is None: return None
+        try:
+            # Sem compressão o arquivo é mapeado em memória: colunas numéricas
+            # chegam ao DataFrame sem cópia e categorias/int8 são preservados.
+            return feather.read_table(self._caminho(chave, f".v{versao}.feather"), memory_map=True).to_pandas()
+        except Exception:
+            return None
+
+    def gravar(self, chave, meta, df=None):
+        if df is not None:
+            if feather is None: return
+            self._gravar_atomico(self._caminho(chave, f".v{meta['versao']}.feather"),
+                                 lambda destino: feather.write_feather(df, destino, compression="uncompressed"))
+        self._gravar_atomico(self._caminho(chave, ".json"), lambda destino: _escrever_json(destino, meta))
+        if df is not None: self._descartar_versoes(chave, meta["versao"])
+
+    def _descartar_versoes(self, chave, versao):
+        prefixo = _nome_arquivo(chave) + ".v"
+        for nome in os.listdir(self.pasta):
+            numero = nome[len(prefixo):-len(".feather")] if nome.startswith(prefixo) and nome.endswith(".feather") else ""
+            if numero.isdigit() and int(numero) <= versao - VERSOES_MANTIDAS:
+                try: os.remove(os.path.join(self.pasta, nome))
+                except OSError: pass
+
+    def chaves(self):
+        try: nomes = os.listdir(self.pasta)
+        except OSError: return []
+        metas = (self.ler_meta(n[:-len(".json")]) for n in nomes if n.endswith(".json"))
+        return [m["chave"] for m in metas if m and m.get("chave")]
+
+    @contextmanager
+    def trava(self, chave):
+        # flock no arquivo .lock da chave: exclusivo entre processos da mesma
+        # máquina/volume. Sem fcntl (Windows), fica só a trava do processo.
+        if not self.compartilhado or fcntl is None:
+            yield
+            return
+        caminho = self._caminho(chave, ".lock")
+        os.makedirs(self.pasta, exist_ok=True)
+        with open(caminho, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try: yield
+            finally: fcntl.flock(f, fcntl.LOCK_UN)
+
+    def travar_derivado(self, chave):
+        return self.trava("derivado~" + _nome_derivado(chave))
+
+    def ler_derivado(self, chave):
+        # arrays: dicionário nome -> np.ndarray (ver agregados.derivado).
+        try:
+            return _ler_arrays(os.path.join(self.pasta, "derivados", _nome_derivado(chave) + ".npz"))
+        except Exception:
+            return None
+
+    def gravar_derivado(self, chave, arrays):
+        pasta = os.path.join(self.pasta, "derivados")
+        try:
+            self._gravar_atomico(os.path.join(pasta, _nome_derivado(chave) + ".npz"), lambda destino: _escrever_arrays(destino, arrays))
+            arquivos = sorted((os.path.join(pasta, n) for n in os.listdir(pasta) if n.endswith(".npz")), key=os.path.getmtime)
+            for caminho in arquivos[:-MAX_DERIVADOS_COMPARTILHADOS]: os.remove(caminho)
+        except Exception:
+            pass
+
+
+class ArmazemSQLite:
+    # Um arquivo SQLite (WAL: leitores não esperam o escritor) com metadados,
+    # dados em Arrow IPC por (chave, versão), derivados e as travas de
+    # revalidação como "aluguéis" com validade.
+    compartilhado = True
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.dono = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(os.path.dirname(os.path.abspath(arquivo)), exist_ok=True)
+        with self._conexao() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, dados TEXT NOT NULL)")
+            con.execute("CREATE TABLE IF NOT EXISTS dados (chave TEXT, versao INTEGER, arrow BLOB NOT NULL, PRIMARY KEY (chave, versao))")
+            con.execute("CREATE TABLE IF NOT EXISTS derivados (nome TEXT PRIMARY KEY, dados BLOB NOT NULL, gravado_em REAL NOT NULL)")
+            con.execute("CREATE TABLE IF NOT EXISTS travas (chave TEXT PRIMARY KEY, dono TEXT NOT NULL, expira_em REAL NOT NULL)")
+
+    @contextmanager
+    def _conexao(self):
+        # Uma conexão por operação: sqlite3 não compartilha conexões entre
+        # threads, e abrir um arquivo local custa microssegundos.
+        con = sqlite3.connect(self.arquivo, timeout=30, isolation_level=None)
+        try: yield con
+        finally: con.close()
+
+    def ler_meta(self, chave):
+        with self._conexao() as con:
+            linha = con.execute("SELECT dados FROM meta WHERE chave = ?", (str(chave),)).fetchone()
+        return json.loads(linha[0]) if linha else None
+
+    def ler_dados(self, chave, versao):
+        if pa is None: return None
+        with self._conexao() as con:
+            linha = con.execute("SELECT arrow FROM dados WHERE chave = ? AND versao = ?", (str(chave), versao)).fetchone()
+        return desserializar_df(linha[0]) if linha else None
+
+    def gravar(self, chave, meta, df=None):
+        chave = str(chave)
+        blob = None
+        if df is not None:
+            if pa is None: return
+            blob = serializar_df(df)
+        with self._conexao() as con:
+            con.execute("BEGIN IMMEDIATE")
+            if blob is not None:
+                con.execute("INSERT OR REPLACE INTO dados VALUES (?, ?, ?)", (chave, meta["versao"], blob))
+                con.execute("DELETE FROM dados WHERE chave = ? AND versao <= ?", (chave, meta["versao"] - VERSOES_MANTIDAS))
+            con.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (chave, json.dumps(meta)))
+            con.execute("COMMIT")
+
+    def chaves(self):
+        with self._conexao() as con:
+            return [linha[0] for linha in con.execute("SELECT chave FROM meta")]
+
+    @contextmanager
+    def trava(self, chave):
+        chave = str(chave)
+        while True:
+            agora = time.time()
+            with self._conexao() as con:
+                cursor = con.execute("INSERT INTO travas VALUES (?, ?, ?) ON CONFLICT (chave) DO UPDATE SET dono = excluded.dono, "
+                                     "expira_em = excluded.expira_em WHERE travas.expira_em < ?",
+                                     (chave, self.dono, agora + VALIDADE_TRAVA_SEGUNDOS, agora))
+                if cursor.rowcount == 1: break
+            time.sleep(ESPERA_TRAVA_SEGUNDOS)
+        try:
+            yield
+        finally:
+            with self._conexao() as con:
+                con.execute("DELETE FROM travas WHERE chave = ? AND dono = ?", (chave, self.dono))
+
+    def travar_derivado(self, chave):
+        return self.trava("derivado~" + _nome_derivado(chave))
+
+    def ler_derivado(self, chave):
+        try:
+            with self._conexao() as con:
+                linha = con.execute("SELECT dados FROM derivados WHERE nome = ?", (_nome_derivado(chave),)).fetchone()
+            return _ler_arrays(io.BytesIO(linha[0])) if linha else None
+        except Exception:
+            return None
+
+    def gravar_derivado(self, chave, arrays):
+        try:
+            saida = io.BytesIO()
+            np.savez(saida, **arrays)
+            dados = saida.getvalue()
+            with self._conexao() as con:
+                con.execute("INSERT OR REPLACE INTO derivados VALUES (?, ?, ?)", (_nome_derivado(chave), dados, time.time()))
+                con.execute("DELETE FROM derivados WHERE nome NOT IN (SELECT nome FROM derivados ORDER BY gravado_em DESC LIMIT ?)",
+                            (MAX_DERIVADOS_COMPARTILHADOS,))
+        except Exception:
+            pass
+
+
+def _escrever_json(destino, dados):
+    with open(destino, "w") as f: json.dump(dados, f)
+
+
+def _escrever_arrays(destino, arrays):
+    with open(destino, "wb") as f: np.savez(f, **arrays)
+
+
+def criar_armazem(modo, pasta):
+    # pasta: DASHBOARD_SNAPSHOTS; no modo sqlite, o arquivo é DASHBOARD_CACHE_SQLITE
+    # (padrão: cache.sqlite dentro da pasta).
+    modo = (modo or "processo").lower()
+    if modo == "sqlite":
+        return ArmazemSQLite(os.environ.get("DASHBOARD_CACHE_SQLITE", os.path.join(pasta, "cache.sqlite")))
+    if modo not in ("processo", "disco"):
+        raise ValueError(f"DASHBOARD_CACHE inválido: {modo!r} (use processo, disco ou sqlite)")
+    return ArmazemDisco(pasta, compartilhado=modo == "disco")
@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import io
+import os
+from functools import lru_cache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# ==============================================================================
+# Ativos estáticos (imagens e CSS) preparados uma vez por processo
+# ==============================================================================
+# Cada arquivo é lido, reduzido e codificado uma única vez por assinatura
+# (mtime + tamanho). Com server.enableStaticServing ligado, as variantes são
+# publicadas em ./static com o hash do conteúdo no nome e a página recebe só a
+# URL; sem ele, cai no data URI em base64, também memorizado.
+PASTA_ESTATICA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+LARGURA_FUNDO = 1920
+QUALIDADE_JPEG = 75
+TIPOS_MIME = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+
+# CSS comum a todas as telas: não depende de nenhuma imagem e sai igual em
+# todo rerun.
+ESTILO_BASE = """
+<style>
+.stProgress > div > div > div > div { background-color: #ff4b4b; }
+.home-title { margin-bottom: 0px; display: flex; align-items: center; gap: 15px; flex-wrap: wrap; }
+button[data-baseweb="tab"] { font-size: 16px !important; font-weight: 600 !important; }
+.dataframe { font-size: 14px !important; }
+
+/* Estilos das Tags de Benefícios */
+.badge-base { padding: 4px 10px; border-radius: 12px; font-size: 12px; font-weight: 600; color: white; display: inline-block; margin-right: 5px; margin-bottom: 5px; }
+.bg-saude { background-color: #cc0000; }
+.bg-educacao { background-color: #0044cc; }
+.bg-outros { background-color: #ff9900; color: black !important; }
+</style>
+"""
+
+# CSS da tela de login; só a URL do fundo varia.
+ESTILO_LOGIN = """
+<style>
+[data-testid="stAppViewContainer"] {
+    background-image: url("%s");
+    background-size: cover;
+    background-position: center center;
+    background-repeat: no-repeat;
+    background-attachment: fixed;
+}
+[data-testid="stSidebar"] { background-color: rgba(255, 255, 255, 0.95); }
+.login-box {
+    background-color: rgba(0, 0, 0, 0.85);
+    padding: 40px;
+    border-radius: 15px;
+    color: white;
+    text-align: center;
+    box-shadow: 0 4px 15px rgba(0,0,0,0.5);
+    border: 1px solid rgba(255,255,255,0.1);
+}
+.login-box h1 { font-size: 26px; color: white !important; margin-bottom: 10px; }
+.login-box h3 { font-size: 18px; color: #ff4b4b !important; margin-top: 0; font-weight: 500; margin-bottom: 20px; }
+.login-box p { font-size: 14px; color: #cccccc !important; }
+</style>
+"""
+
+
+def _assinatura(caminho):
+    info = os.stat(caminho)
+    return info.st_mtime_ns, info.st_size
+
+
+def _extensao(caminho):
+    # "capa_login.jpg.jpg" -> ".jpg"
+    return os.path.splitext(caminho)[1].lower()
+
+
+def _reduzir(dados, extensao, largura_max):
+    # Variante menor para imagens de fundo: JPEG progressivo sem EXIF na
+    # largura máxima pedida. Sem Pillow, o arquivo segue como está.
+    if Image is None or not largura_max or extensao not in (".jpg", ".jpeg"): return dados
+    try:
+        with Image.open(io.BytesIO(dados)) as imagem:
+            if imagem.width > largura_max:
+                imagem = imagem.resize((largura_max, round(imagem.height * largura_max / imagem.width)), Image.LANCZOS)
+            saida = io.BytesIO()
+            imagem.convert("RGB").save(saida, "JPEG", quality=QUALIDADE_JPEG, optimize=True, progressive=True)
+    except Exception:
+        return dados
+    return saida.getvalue() if saida.tell() < len(dados) else dados
+
+
+@lru_cache(maxsize=32)
+def _variante(caminho, assinatura, largura_max):
+    with open(caminho, "rb") as f:
+        dados = f.read()
+    dados = _reduzir(dados, _extensao(caminho), largura_max)
+    return dados, hashlib.sha1(dados).hexdigest()[:12]
+
+
+@lru_cache(maxsize=32)
+def _data_uri(caminho, assinatura, largura_max):
+    dados, _ = _variante(caminho, assinatura, largura_max)
+    return base64.b64encode(dados).decode()
+
+
+@lru_cache(maxsize=32)
+def _publicar(caminho, assinatura, largura_max):
+    dados, hash_conteudo = _variante(caminho, assinatura, largura_max)
+    base = os.path.basename(caminho).split(".")[0]
+    nome = f"{base}.{hash_conteudo}{_extensao(caminho)}"
+    destino = os.path.join(PASTA_ESTATICA, nome)
+    try:
+        if not os.path.exists(destino):
+            os.makedirs(PASTA_ESTATICA, exist_ok=True)
+            temporario = f"{destino}.{os.getpid()}.tmp"
+            with open(temporario, "wb") as f:
+                f.write(dados)
+            os.replace(temporario, destino)
+    except OSError:
+        return None
+    return nome
+
+
+def url_do_ativo(caminho, largura_max=None, estatico=False):
+    # URL servida pelo /app/static quando possível; senão, data URI.
+    try:
+        assinatura = _assinatura(caminho)
+    except OSError:
+        return ""
+    if estatico:
+        nome = _publicar(caminho, assinatura, largura_max)
+        if nome: return f"app/static/{nome}"
+    mime = TIPOS_MIME.get(_extensao(caminho), "application/octet-stream")
+    return f"data:{mime};base64,{_data_uri(caminho, assinatura, largura_max)}"
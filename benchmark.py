@@ -0,0 +1,1173 @@
+"""Benchmarks do dashboard com planilhas sintéticas servidas localmente.
+
+Uso:
+    python benchmark.py carga [--latencia 0.3] [--linhas 2000] [--sessoes 8]
+    python benchmark.py moeda [--tamanhos 10000 100000 1000000]
+    python benchmark.py meses [--anos 5] [--linhas-por-ano 200000]
+    python benchmark.py memoria [--linhas 500000]
+    python benchmark.py ativos [--repeticoes 20]
+    python benchmark.py matriz [--beneficios 60]
+    python benchmark.py formatacao [--tamanhos 1000 10000 100000]
+    python benchmark.py vidas [--linhas 500000]
+    python benchmark.py consultas [--linhas 100000 1000000 3000000]
+    python benchmark.py anual [--anos 2 5] [--linhas-por-ano 200000]
+    python benchmark.py tendencia [--linhas 10000 1000000]
+    python benchmark.py exportacao [--linhas 500000]
+    python benchmark.py contratos [--linhas 100000 1000000]
+    python benchmark.py visoes [--linhas 1000 100000 1000000] [--saida benchmark_visoes.json] [--comparar anterior.json]
+    python benchmark.py partida [--linhas 20000] [--repeticoes 5]
+    python benchmark.py sessoes [--sessoes 1 10 50] [--voltas 2]
+    python benchmark.py filtros [--linhas 20000]
+    python benchmark.py replicas [--replicas 4] [--modos processo disco sqlite]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# Servidor local que imita o endpoint CSV das planilhas publicadas
+# ==============================================================================
+class ServidorPlanilhas:
+    def __init__(self, planilhas, latencia=0.0):
+        self.planilhas = {gid: (df.to_csv(index=False).encode() if isinstance(df, pd.DataFrame) else df)
+                          for gid, df in planilhas.items()}
+        self.latencia = latencia
+        self.conexoes = 0
+        self.downloads = 0
+        self._trava = threading.Lock()
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with servidor._trava: servidor.conexoes += 1
+
+            def do_GET(self):
+                gid = parse_qs(urlparse(self.path).query).get("gid", [""])[0]
+                corpo = servidor.planilhas.get(gid)
+                if servidor.latencia: time.sleep(servidor.latencia)
+                if corpo is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                etag = '"%x"' % hash(corpo)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                with servidor._trava: servidor.downloads += 1
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "text/csv; charset=utf-8")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url_base = f"http://127.0.0.1:{self.httpd.server_address[1]}/pub"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# ==============================================================================
+# Planilhas sintéticas
+# ==============================================================================
+MESES = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho", "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+BENEFICIOS = ["Saúde", "Odonto", "Vale Refeição", "Vale Alimentação", "Seguro de Vida", "Gympass", "English Pass", "Wyden"]
+
+
+def moeda_brl(valores):
+    return ["R$ " + f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") for v in valores]
+
+
+def gerar_orcamento(linhas, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Mês": rng.choice(MESES, linhas),
+        "Benefício": rng.choice(BENEFICIOS, linhas),
+        "Custo Orçado": moeda_brl(rng.uniform(100, 50000, linhas)),
+        "Custo Realizado": moeda_brl(rng.uniform(100, 50000, linhas)),
+    })
+
+
+def gerar_beneficiarios(linhas, empresas=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Razão Social": [f"EMPRESA {i:04d} LTDA" for i in rng.integers(0, empresas, linhas)],
+        "Nome": [f"Colaborador {i}" for i in range(linhas)],
+        "Status": rng.choice(["active", "inactive"], linhas, p=[0.9, 0.1]),
+        "Tipo de Usuário": rng.choice(["Titular", "Dependente"], linhas, p=[0.7, 0.3]),
+        "Plano": rng.choice(["V4 - Starbem", "Starbem Plus"], linhas),
+        "Valor Titular": moeda_brl(rng.uniform(50, 500, linhas)),
+        "Valor Dependente": moeda_brl(rng.uniform(30, 300, linhas)),
+    })
+
+
+def gerar_consultas(linhas, empresas=200, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Razão Social": [f"EMPRESA {i:04d} LTDA" for i in rng.integers(0, empresas, linhas)],
+        "Status Consulta": rng.choice(["Finalizado", "Cancelado", "Agendado"], linhas, p=[0.7, 0.2, 0.1]),
+        "Especialidade": rng.choice(["Clínico Geral", "Psicologia", "Nutrição", "Pediatria", "Dermatologia"], linhas),
+    })
+
+
+# ==============================================================================
+# Cenários
+# ==============================================================================
+def bench_carga(args):
+    import carregamento
+    from armazenamento import criar_armazem
+    from normalizacao import tratar_colunas_financeiras
+
+    planilhas = {
+        "1": gerar_beneficiarios(args.linhas, seed=1),
+        "2": gerar_beneficiarios(args.linhas, seed=2),
+        "3": gerar_beneficiarios(args.linhas, seed=3),
+        "4": gerar_beneficiarios(args.linhas, seed=4),
+        "5": gerar_consultas(args.linhas, seed=5),
+    }
+    gids = list(planilhas)
+    with ServidorPlanilhas(planilhas, latencia=args.latencia) as servidor:
+        carregamento.URL_BASE = servidor.url_base
+
+        inicio = time.perf_counter()
+        for gid in gids:
+            tratar_colunas_financeiras(pd.read_csv(carregamento.montar_url(gid)))
+        sequencial = time.perf_counter() - inicio
+
+        carregamento.limpar_cache()
+        conexoes_antes = servidor.conexoes
+        inicio = time.perf_counter()
+        resultado = carregamento.load_many(gids)
+        paralelo = time.perf_counter() - inicio
+        conexoes = servidor.conexoes - conexoes_antes
+        tempos = {gid: dict(carregamento.TEMPOS[gid]) for gid in gids}
+
+        # Várias sessões pedindo as mesmas planilhas ao mesmo tempo, com o cache
+        # vazio (e sem snapshots): uma leitura por GID (single-flight), a mesma
+        # Folha para todas.
+        carregamento.limpar_cache()
+        with tempfile.TemporaryDirectory(prefix="snapshots_carga_") as pasta:
+            carregamento.ARMAZEM = criar_armazem("processo", pasta)
+            downloads = servidor.downloads
+            barreira = threading.Barrier(args.sessoes)
+
+            def sessao(_):
+                barreira.wait()
+                return carregamento.load_many_folhas(gids)
+
+            with ThreadPoolExecutor(args.sessoes) as pool: servidas = list(pool.map(sessao, range(args.sessoes)))
+            concorrentes = servidor.downloads - downloads
+            assert concorrentes == len(gids), f"{concorrentes} downloads para {len(gids)} GIDs com {args.sessoes} sessões"
+            assert all(s[gid] is servidas[0][gid] for s in servidas for gid in gids), "sessões receberam folhas diferentes"
+
+            # Uma planilha muda: a atualização baixa só ela, uma vez, e a serve numa
+            # versão nova; as outras respondem 304 e ficam na mesma versão.
+            antes = carregamento.load_many_folhas(gids)
+            servidor.planilhas[gids[0]] = gerar_beneficiarios(args.linhas, seed=99).to_csv(index=False).encode()
+            downloads = servidor.downloads
+            resultados = carregamento.atualizar(gids)
+            depois = carregamento.load_many_folhas(gids)
+            assert servidor.downloads - downloads == 1, f"{servidor.downloads - downloads} downloads na atualização"
+            assert resultados == {gids[0]: "novo", **{gid: "nao_modificado" for gid in gids[1:]}}, resultados
+            assert depois[gids[0]].versao == antes[gids[0]].versao + 1 and not depois[gids[0]].df.equals(antes[gids[0]].df)
+            assert all(depois[gid] is antes[gid] for gid in gids[1:])
+            downloads = servidor.downloads
+            carregamento.atualizar(gids)
+            assert servidor.downloads == downloads and carregamento.load_folha(gids[0]).versao == depois[gids[0]].versao
+
+    print(f"Sequencial (pd.read_csv por GID): {sequencial:.3f}s")
+    print(f"load_many ({len(gids)} GIDs, {conexoes} conexões): {paralelo:.3f}s")
+    for gid in gids:
+        t = tempos[gid]
+        linhas = len(resultado[gid]) if resultado[gid] is not None else 0
+        print(f"  gid={gid}: download={t['download_s']:.3f}s processamento={t['processamento_s']:.3f}s linhas={linhas}")
+    print(f"{args.sessoes} sessões simultâneas: {concorrentes} downloads para {len(gids)} GIDs; "
+          f"atualização após mudança: 1 download, versão {antes[gids[0]].versao} -> {depois[gids[0]].versao}")
+
+
+def _tratar_colunas_financeiras_original(df):
+    # Caminho anterior do load_data, para comparação. A checagem de dtype aceita
+    # também o dtype de texto do pandas 3, senão nada seria convertido.
+    from normalizacao import TERMOS_FINANCEIROS, remover_acentos
+    for col in df.columns:
+        col_norm = remover_acentos(col)
+        eh_financeiro = any(t in col_norm for t in TERMOS_FINANCEIROS)
+        primeiro_valor = df[col].dropna().iloc[0] if not df[col].dropna().empty else ""
+        tem_cifrao = "R$" in str(primeiro_valor)
+        if eh_financeiro or tem_cifrao:
+            if df[col].dtype == "object" or pd.api.types.is_string_dtype(df[col]):
+                df[col] = df[col].astype(str).str.replace("R$", "", regex=False)
+                df[col] = df[col].str.replace(" ", "", regex=False)
+                df[col] = df[col].str.replace(".", "", regex=False)
+                df[col] = df[col].str.replace(",", ".", regex=False)
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+    return df
+
+
+def _cronometrar(func, repeticoes=3):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def bench_moeda(args):
+    from normalizacao import tratar_colunas_financeiras
+
+    print(f"{'linhas':>10} {'original':>10} {'vetorizado':>11} {'ganho':>7}")
+    for linhas in args.tamanhos:
+        base = gerar_orcamento(linhas)
+        original = _cronometrar(lambda: _tratar_colunas_financeiras_original(base.copy()))
+        novo = _cronometrar(lambda: tratar_colunas_financeiras(base.copy()))
+        pd.testing.assert_frame_equal(_tratar_colunas_financeiras_original(base.copy()), tratar_colunas_financeiras(base.copy()), check_dtype=False)
+        print(f"{linhas:>10} {original:>9.3f}s {novo:>10.3f}s {original / novo:>6.1f}x")
+
+
+def bench_meses(args):
+    from normalizacao import COLUNA_ORDEM_MES, get_mes_ordem, preparar_dimensoes, tratar_colunas_financeiras
+
+    anos = [gerar_orcamento(args.linhas_por_ano, seed=i) for i in range(args.anos)]
+    bruto = tratar_colunas_financeiras(pd.concat(anos, ignore_index=True))
+    preparado = preparar_dimensoes(bruto.copy())
+    print(f"Planilha sintética: {len(bruto)} linhas ({args.anos} anos)")
+
+    def filtro_antes():
+        for mes in range(1, 13): bruto[bruto["Mês"].apply(get_mes_ordem) == mes]["Custo Realizado"].sum()
+
+    def filtro_depois():
+        for mes in range(1, 13): preparado[preparado[COLUNA_ORDEM_MES] == mes]["Custo Realizado"].sum()
+
+    def agrupar_antes():
+        df_c = bruto.groupby("Mês")[["Custo Orçado", "Custo Realizado"]].sum().reset_index()
+        df_c["ordem"] = df_c["Mês"].apply(get_mes_ordem)
+        bruto.groupby("Benefício")["Custo Realizado"].sum()
+        return df_c.sort_values("ordem")
+
+    def agrupar_depois():
+        preparado.groupby("Benefício", observed=True)["Custo Realizado"].sum()
+        return preparado.groupby([COLUNA_ORDEM_MES, "Mês"], observed=True)[["Custo Orçado", "Custo Realizado"]].sum().reset_index()
+
+    for nome, antes, depois in [("filtro dos 12 meses", filtro_antes, filtro_depois), ("groupby mês + benefício", agrupar_antes, agrupar_depois)]:
+        t_antes, t_depois = _cronometrar(antes), _cronometrar(depois)
+        print(f"{nome:<24} antes={t_antes:.3f}s depois={t_depois:.3f}s ({t_antes / t_depois:.1f}x)")
+    print(f"Memória: antes={bruto.memory_usage(deep=True).sum() / 1e6:.1f}MB depois={preparado.memory_usage(deep=True).sum() / 1e6:.1f}MB")
+
+
+def _padronizar_colunas_original(df, nome_beneficio):
+    # padronizar_colunas do app antes da ingestão em lotes, para comparação.
+    from normalizacao import PAPEIS_BENEFICIARIOS, resolver_papeis
+    c = resolver_papeis(df, PAPEIS_BENEFICIARIOS)
+    if not c["razao"]: return None
+    if c["status"]: df = df[df[c["status"]].astype(str).str.lower() == 'active'].copy()
+    else: df = df.copy()
+    df['Custo_Calculado'] = 0.0
+    if c["tipo_usuario"] and c["valor_titular"] and c["valor_dependente"]:
+        df['Custo_Calculado'] = np.where(df[c["tipo_usuario"]].astype(str).str.lower().str.contains('titular'), df[c["valor_titular"]], df[c["valor_dependente"]])
+    elif c["valor_unico"]:
+        df['Custo_Calculado'] = df[c["valor_unico"]]
+    df['Custo_Calculado'] = df['Custo_Calculado'].fillna(0)
+    df['Benefício_Final'] = df[c["plano"]] if c["plano"] else nome_beneficio
+    df = df.rename(columns={c["razao"]: 'Razão Social', c["nome"]: 'Nome', 'Benefício_Final': 'Benefício'})
+    if 'Regional' not in df.columns: df['Regional'] = 'Geral'
+    if 'Nome' not in df.columns: df['Nome'] = 'Colaborador'
+    return df[['Razão Social', 'Benefício', 'Custo_Calculado', 'Nome', 'Regional']]
+
+
+def _pico_rss_mb():
+    # VmHWM é zerado no exec; o ru_maxrss do Linux herda o pico do processo pai.
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmHWM:"): return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _medir_carga_isolada(args):
+    # Executado num subprocesso: o pico de RSS de cada carregador não se
+    # mistura com o do outro nem com a geração da planilha.
+    import carregamento
+    with open(args.arquivo, "rb") as f: conteudo = f.read()
+    base = _pico_rss_mb()
+    inicio = time.perf_counter()
+    if args.interno == "original":
+        df = _padronizar_colunas_original(carregamento.processar_csv(conteudo), "V4 - Starbem")
+    else:
+        df = carregamento.processar_beneficiarios(conteudo, "V4 - Starbem")
+    duracao = time.perf_counter() - inicio
+    print(json.dumps({"pico_mb": _pico_rss_mb() - base, "segundos": duracao, "linhas": int(df['Ativo'].sum()) if 'Ativo' in df.columns else len(df),
+                      "df_mb": df.memory_usage(deep=True).sum() / 1e6}))
+
+
+def bench_memoria(args):
+    if args.interno: return _medir_carga_isolada(args)
+    with tempfile.NamedTemporaryFile(suffix=".csv", delete=False) as f:
+        f.write(gerar_beneficiarios(args.linhas, empresas=2000).to_csv(index=False).encode())
+        arquivo = f.name
+    try:
+        print(f"Base de vidas sintética: {args.linhas} linhas ({os.path.getsize(arquivo) / 1e6:.1f}MB de CSV)")
+        for modo in ["original", "lotes"]:
+            saida = subprocess.run([sys.executable, __file__, "memoria", "--interno", modo, "--arquivo", arquivo],
+                                   capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            r = json.loads(saida.stdout.strip().splitlines()[-1])
+            print(f"{modo:<9} pico RSS=+{r['pico_mb']:.0f}MB tempo={r['segundos']:.2f}s resultado={r['df_mb']:.1f}MB ({r['linhas']} vidas ativas)")
+    finally:
+        os.unlink(arquivo)
+
+
+def _css_login_original(arquivo):
+    import base64
+    with open(arquivo, "rb") as f:
+        return '<style>[data-testid="stAppViewContainer"] { background-image: url("data:image/jpg;base64,%s"); }</style>' % base64.b64encode(f.read()).decode()
+
+
+def bench_ativos(args):
+    import ativos
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    arquivo = os.path.join(pasta, "capa_login.jpg.jpg")
+    print(f"Imagem de login: {os.path.getsize(arquivo) / 1e3:.0f}KB")
+    t = _cronometrar(lambda: _css_login_original(arquivo), args.repeticoes)
+    css = _css_login_original(arquivo)
+    print(f"original      {t * 1000:7.2f}ms/rerun  CSS inline={len(css) / 1e3:8.1f}KB")
+    for estatico in (False, True):
+        ativos._variante.cache_clear(); ativos._data_uri.cache_clear(); ativos._publicar.cache_clear()
+        inicio = time.perf_counter()
+        ativos.url_do_ativo(arquivo, ativos.LARGURA_FUNDO, estatico)
+        frio = time.perf_counter() - inicio
+        t = _cronometrar(lambda: ativos.url_do_ativo(arquivo, ativos.LARGURA_FUNDO, estatico), args.repeticoes)
+        css = ativos.ESTILO_LOGIN % ativos.url_do_ativo(arquivo, ativos.LARGURA_FUNDO, estatico)
+        print(f"{'static' if estatico else 'data URI':<13} {t * 1000:7.2f}ms/rerun  CSS inline={len(css) / 1e3:8.1f}KB  (1ª vez {frio * 1000:.0f}ms)")
+
+
+def _matriz_sintetica(beneficios, seed=0):
+    rng = np.random.default_rng(seed)
+    meses = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+    piv = pd.DataFrame(rng.gamma(2.0, 20_000, (beneficios, 12)).round(2), columns=meses, index=[f"Benefício {i:03d}" for i in range(beneficios)])
+    piv["Total Anual"] = piv.sum(axis=1)
+    lin_tot = piv.sum(); lin_tot.name = "TOTAL GERAL"
+    return pd.concat([piv, lin_tot.to_frame().T])
+
+
+def _estilo_matriz_original(piv):
+    # Styler.applymap foi renomeado para map no pandas 2.1.
+    sty = piv.style.format("R$ {:,.2f}")
+    cols = [c for c in piv.columns if c != "Total Anual"]
+    sty = sty.background_gradient(cmap="Reds", subset=(piv.index[:-1], cols), vmin=0)
+    aplicar = sty.map if hasattr(sty, "map") else sty.applymap
+    return aplicar(lambda x: "background-color: #f0f2f6; color: black; font-weight: bold;", subset=["Total Anual"])
+
+
+def _textos_estilos_matriz(piv):
+    from formatacao import ESTILO_TOTAL, gradiente, tabela_moeda_brl
+    texto = tabela_moeda_brl(piv)
+    estilos = np.full(piv.shape, "", dtype=object)
+    cols = [i for i, c in enumerate(piv.columns) if c != "Total Anual"]
+    estilos[:-1, cols] = gradiente(piv.iloc[:-1, cols].to_numpy(), vmin=0)
+    estilos[:, piv.columns.get_loc("Total Anual")] = ESTILO_TOTAL
+    return texto, estilos
+
+
+def _estilo_matriz_vetorizado(piv):
+    texto, estilos = _textos_estilos_matriz(piv)
+    return texto.style.apply(lambda _: estilos, axis=None)
+
+
+def bench_matriz(args):
+    # Mede o que o st.dataframe faz com o Styler: estilos + valores exibidos
+    # serializados no proto do Streamlit.
+    from streamlit.elements.lib.pandas_styler_utils import marshall_styler
+    try:
+        from streamlit.proto.ArrowData_pb2 import ArrowData as ArrowProto
+    except ImportError:
+        from streamlit.proto.Arrow_pb2 import Arrow as ArrowProto
+    piv = _matriz_sintetica(args.beneficios)
+    print(f"Visão matricial: {piv.shape[0]} linhas x {piv.shape[1]} colunas (x2 abas por rerun)")
+
+    def renderizar(montar):
+        marshall_styler(ArrowProto(), montar(piv), "bench")
+
+    texto, estilos = _textos_estilos_matriz(piv)
+    cenarios = [("original", _estilo_matriz_original), ("vetorizado", _estilo_matriz_vetorizado),
+                ("memorizado", lambda _: texto.style.apply(lambda _: estilos, axis=None))]
+    for nome, montar in cenarios:
+        t = _cronometrar(lambda: renderizar(montar), 5)
+        print(f"{nome:<11} {t * 1000:7.1f}ms por tabela")
+    texto_original = _estilo_matriz_original(piv).to_html()
+    print(f"matplotlib carregado: {'matplotlib' in sys.modules} | tamanho HTML original={len(texto_original) / 1e3:.0f}KB")
+
+
+def _formatar_moeda_original(valor):
+    try:
+        if pd.isna(valor): return "R$ 0,00"
+        return f"R$ {float(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    except:
+        return "R$ 0,00"
+
+
+def bench_formatacao(args):
+    from formatacao import moeda_brl, percentual
+    rng = np.random.default_rng(0)
+    print("Rótulos R$ (formatar_moeda por valor x moeda_brl na Series)")
+    for n in args.tamanhos:
+        valores = pd.Series(rng.normal(50_000, 80_000, n).round(2))
+        valores.iloc[::97] = np.nan
+        t_antes = _cronometrar(lambda: valores.apply(_formatar_moeda_original))
+        t_depois = _cronometrar(lambda: moeda_brl(valores))
+        iguais = moeda_brl(valores).tolist() == valores.apply(_formatar_moeda_original).tolist()
+        print(f"  {n:>9} rótulos: {t_antes * 1000:8.1f}ms -> {t_depois * 1000:7.1f}ms  ({t_depois / n * 1e9:5.0f}ns/rótulo)  idênticos={iguais}")
+
+    print("Rótulos + cores da Distribuição Estratégica (apply linha a linha com max() x vetorizado)")
+    for n in [t for t in args.tamanhos if t <= 10_000] or [1000]:
+        df = pd.DataFrame({"v": rng.gamma(2.0, 20_000, n)})
+        df["Percentual"] = df["v"] / df["v"].sum()
+
+        def antes():
+            cor = df.apply(lambda x: '#990000' if x["v"] == df["v"].max() else '#ff4b4b', axis=1)
+            texto = df.apply(lambda x: f"R$ {x['v']:,.0f}".replace(',', '_').replace('.', ',').replace('_', '.') + f" ({x['Percentual']*100:.1f}%)", axis=1)
+            return cor, texto
+
+        def depois():
+            cor = np.where(df["v"] == df["v"].max(), '#990000', '#ff4b4b')
+            return cor, moeda_brl(df["v"], casas=0) + " (" + percentual(df["Percentual"]) + ")"
+
+        t_antes, t_depois = _cronometrar(antes, 1), _cronometrar(depois)
+        iguais = antes()[1].tolist() == depois()[1].tolist()
+        print(f"  {n:>9} barras:  {t_antes * 1000:8.1f}ms -> {t_depois * 1000:7.1f}ms  idênticos={iguais}")
+
+
+def _bytes_por_vida(base):
+    # Memória da BaseVidas por linha: códigos + custo + bitmaps.
+    total = base.custo.nbytes + base.ativo.nbytes + base.titular.nbytes + sum(c.nbytes for c in base.codigos.values())
+    return total / max(base.tamanho, 1)
+
+
+def bench_vidas(args):
+    import carregamento
+    from vidas import BaseVidas
+    bruto = gerar_beneficiarios(args.linhas, empresas=2000, seed=5)
+    conteudo = bruto.to_csv(index=False).encode()
+    bruto = pd.read_csv(io.BytesIO(conteudo), dtype=object)
+    base = BaseVidas(carregamento.processar_beneficiarios(conteudo, "V4 - Starbem"))
+    razao, plano = bruto['Razão Social'].iat[0], bruto['Plano'].iat[0]
+    print(f"Base de vidas: {args.linhas} linhas")
+
+    def filtro_texto():
+        ativo = bruto['Status'].astype(str).str.lower() == 'active'
+        titular = bruto['Tipo de Usuário'].astype(str).str.lower().str.contains('titular')
+        return ativo & titular & (bruto['Plano'] == plano) & (bruto['Razão Social'] == razao)
+
+    def filtro_bitmap():
+        return base.mascara(titular=True, **{'Benefício': plano, 'Razão Social': razao})
+
+    iguais = np.array_equal(filtro_texto().to_numpy(), filtro_bitmap())
+    t_texto, t_bitmap = _cronometrar(filtro_texto), _cronometrar(filtro_bitmap)
+    print(f"ativo+titular+plano+empresa: texto {t_texto * 1000:7.1f}ms -> bitmaps {t_bitmap * 1000:6.2f}ms  iguais={iguais}")
+    colunas = ['Razão Social', 'Status', 'Tipo de Usuário', 'Plano', 'Valor Titular', 'Valor Dependente']
+    por_vida_texto = bruto[colunas].memory_usage(deep=True, index=False).sum() / len(bruto)
+    print(f"memória por vida: {por_vida_texto:.0f} bytes (colunas de texto) -> {_bytes_por_vida(base):.0f} bytes (códigos + custo + bitmaps)")
+
+
+def bench_consultas(args):
+    from consultas import CuboConsultas
+    for linhas in args.linhas:
+        df = gerar_consultas(linhas, empresas=2000, seed=6).rename(columns={"Status Consulta": "Status_Consulta"}).astype("category")
+        status, especialidades = ["Finalizado", "Agendado"], ["Psicologia", "Nutrição"]
+        razao = df['Razão Social'].iat[0]
+
+        def original():
+            # Cópia + filtros + groupby a cada interação, como era no mapa.
+            dff = df.copy()
+            dff = dff[dff['Status_Consulta'].isin(status) & dff['Especialidade'].isin(especialidades)]
+            por_empresa = dff.groupby('Razão Social', observed=True).size()
+            pizza = df[df['Razão Social'] == razao]['Especialidade'].value_counts()
+            return por_empresa[por_empresa > 0], pizza[pizza > 0]
+
+        t_montagem = _cronometrar(lambda: CuboConsultas(df), 1)
+        cubo = CuboConsultas(df)
+
+        def com_cubo():
+            return cubo.por_empresa(status, especialidades), cubo.especialidades_de(razao)
+
+        antes, depois = original(), com_cubo()
+        iguais = antes[0].sum() == depois[0]['Total_Consultas'].sum() and antes[1].to_dict() == depois[1].to_dict()
+        t_original, t_cubo = _cronometrar(original), _cronometrar(com_cubo)
+        print(f"{linhas:>9} consultas: interação {t_original * 1000:8.1f}ms -> {t_cubo * 1000:6.2f}ms  "
+              f"(montagem do cubo {t_montagem * 1000:.0f}ms, {cubo.contagens.nbytes / 1e6:.1f}MB)  iguais={iguais}")
+
+
+def bench_anual(args):
+    import carregamento
+    from agregados import indice_anual
+    from normalizacao import COLUNA_ORDEM_MES, PAPEIS_ORCAMENTO, get_mes_ordem, resolver_papeis
+    for n in args.anos:
+        anos = [str(2026 - n + 1 + i) for i in range(n)]
+        fontes = []
+        for i, ano in enumerate(anos):
+            df = carregamento.processar_csv(gerar_orcamento(args.linhas_por_ano, seed=10 + i).to_csv(index=False).encode())
+            fontes.append((ano, carregamento.Folha(f"anual_{n}_{ano}", df, 0.0, 0.0), resolver_papeis(df, PAPEIS_ORCAMENTO)))
+        ordem, selecao = get_mes_ordem("Março"), BENEFICIOS[:3]
+
+        def original():
+            # Filtro do mês e dos benefícios em cada ano + groupby + concat.
+            partes, totais = [], []
+            for ano, folha, p in fontes:
+                df = folha.df
+                df_m = df[df[p["mes"]].apply(get_mes_ordem) == ordem]
+                df_m = df_m[df_m[p["beneficio"]].isin(selecao)]
+                totais.append(df_m[p["realizado"]].sum())
+                visao = df_m.groupby(p["beneficio"], observed=True)[p["realizado"]].sum().reset_index()
+                visao.columns = ['Benefício', 'Valor']; visao['Ano'] = ano
+                partes.append(visao)
+            return totais, pd.concat(partes).sort_values('Valor', ascending=False)
+
+        t_montagem = _cronometrar(lambda: indice_anual(fontes) and None, 1)
+        indice = indice_anual(fontes)
+        # Série ano x mês do índice = groupby por mês de cada planilha.
+        serie = indice.serie_mensal()
+        for ano, folha, p in fontes:
+            por_mes = folha.df.groupby(COLUNA_ORDEM_MES, observed=True)[p["realizado"]].sum().reindex(serie.columns, fill_value=0)
+            assert np.allclose(serie.loc[ano].to_numpy(), por_mes.to_numpy()), ano
+
+        def com_indice():
+            return indice.totais(ordem, selecao), indice.por_beneficio(ordem, selecao)
+
+        iguais = np.allclose(original()[0], com_indice()[0])
+        t_original, t_indice = _cronometrar(original), _cronometrar(com_indice)
+        print(f"{n} anos x {args.linhas_por_ano} linhas: troca de mês/benefício {t_original * 1000:8.1f}ms -> {t_indice * 1000:6.2f}ms  "
+              f"(índice montado em {t_montagem * 1000:.0f}ms, {indice.realizado.nbytes / 1e3:.0f}KB)  iguais={iguais}")
+
+
+def bench_tendencia(args):
+    import carregamento
+    from agregados import tendencia_periodos
+    from normalizacao import COLUNA_ORDEM_MES, PAPEIS_ORCAMENTO, resolver_papeis
+    for linhas in args.linhas:
+        df = carregamento.processar_csv(gerar_orcamento(linhas, seed=7).to_csv(index=False).encode())
+        folha, p = carregamento.Folha(f"tendencia_{linhas}", df, 0.0, 0.0), resolver_papeis(df, PAPEIS_ORCAMENTO)
+
+        def groupby_por_rerun():
+            custos = df.groupby(COLUNA_ORDEM_MES, observed=True)[p["realizado"]].sum()
+            custos = custos[(custos.index >= 1) & (custos.index <= 12)]
+            return custos.sum(), custos.mean(), custos.iloc[-1] / custos.iloc[0] - 1
+
+        t_montagem = _cronometrar(lambda: tendencia_periodos(folha, p), 1)
+
+        def leitura():
+            t = tendencia_periodos(folha, p)
+            return t.total, t.media, t.crescimento
+
+        iguais = np.allclose(groupby_por_rerun(), leitura())
+        t_groupby, t_leitura = _cronometrar(groupby_por_rerun), _cronometrar(leitura)
+        print(f"{linhas:>9} lançamentos: KPIs do Início {t_groupby * 1000:7.1f}ms -> {t_leitura * 1000:6.3f}ms  "
+              f"(visão montada uma vez em {t_montagem * 1000:.0f}ms)  iguais={iguais}")
+
+
+def bench_exportacao(args):
+    import carregamento
+    import exportacao
+    df = carregamento.processar_beneficiarios(gerar_beneficiarios(args.linhas, empresas=2000, seed=8).to_csv(index=False).encode(), "V4 - Starbem")
+    pequeno = gerar_orcamento(5_000, seed=9)
+    print(f"Exportação de {len(df)} linhas de vidas")
+
+    def rerun_tipico():
+        # Um passo de rerun qualquer de outra sessão: groupby pequeno.
+        return pequeno.groupby("Benefício")["Mês"].count()
+
+    def latencias(segundos):
+        tempos, fim = [], time.perf_counter() + segundos
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            rerun_tipico()
+            tempos.append((time.perf_counter() - inicio) * 1000)
+        return np.percentile(tempos, 95)
+
+    p95_livre = latencias(1.0)
+    for formato in exportacao.formatos_disponiveis():
+        t_sincrono = _cronometrar(lambda: exportacao.ESCRITORES[formato](df, exportacao.Trabalho("", (), "", formato)), 1)
+        inicio = time.perf_counter()
+        trabalho = exportacao.solicitar(("bench", formato, time.time()), "bench", formato, lambda: df)
+        t_agendar = time.perf_counter() - inicio
+        p95_durante = latencias(min(t_sincrono, 2.0))
+        while not trabalho.concluido(): time.sleep(0.01)
+        print(f"  {formato:<8} no rerun: {t_sincrono * 1000:7.0f}ms bloqueando  |  no pool: agendar {t_agendar * 1000:5.2f}ms, "
+              f"p95 de outro rerun {p95_livre:.2f}ms -> {p95_durante:.2f}ms durante a geração ({len(trabalho.dados) / 1e6:.1f}MB)")
+
+
+# ==============================================================================
+# Contratos de esquema e quarentena de linhas
+# ==============================================================================
+def bench_contratos(args):
+    import carregamento
+    from contratos import CONTRATO_ORCAMENTO, Quarentena
+
+    print("Planilha de orçamento: detecção heurística x contrato (leitura tipada pyarrow)")
+    print(f"{'linhas':>10} {'heurística':>11} {'contrato':>9} {'ganho':>7}")
+    for linhas in args.linhas:
+        bruto = gerar_orcamento(linhas, seed=5).to_csv(index=False).encode()
+        heuristica = _cronometrar(lambda: carregamento.processar_csv(bruto))
+        contrato = _cronometrar(lambda: carregamento.processar_csv(bruto, CONTRATO_ORCAMENTO))
+        pd.testing.assert_frame_equal(carregamento.processar_csv(bruto), carregamento.processar_csv(bruto, CONTRATO_ORCAMENTO))
+        print(f"{linhas:>10} {heuristica:>10.3f}s {contrato:>8.3f}s {heuristica / contrato:>6.1f}x")
+
+    # Três linhas ruins no fim: campo a mais, valor que não é moeda e mês desconhecido.
+    ruins = 'Março,Odonto,"R$ 10,00","R$ 1,00",EXTRA\nAbril,Odonto,"R$ 1,00",a confirmar\nTotal,Odonto,"R$ 1,00","R$ 2,00"\n'
+    bruto = gerar_orcamento(args.linhas[0], seed=5).to_csv(index=False).encode() + ruins.encode()
+    print(f"\nMesma planilha ({args.linhas[0]} linhas) + 3 linhas ruins:")
+    try:
+        pd.read_csv(io.BytesIO(bruto))
+        print("  read_csv padrão:  leu")
+    except pd.errors.ParserError as e:
+        print(f"  read_csv padrão:  planilha inteira perdida ({str(e).splitlines()[0][:70]})")
+    for rotulo, contrato in (("heurística", None), ("contrato", CONTRATO_ORCAMENTO)):
+        quarentena = Quarentena()
+        df = carregamento.processar_csv(bruto, contrato, quarentena)
+        print(f"  {rotulo + ':':<17} {len(df)} linhas servidas, quarentena {quarentena.motivos or '{}'}")
+
+    # Cabeçalho da planilha real com outra grafia: os mesmos papéis que a
+    # heurística resolve valem para o contrato. Mês em data não é o do contrato.
+    bruto = gerar_orcamento(args.linhas[0], seed=5)
+    variantes = {"sem acento": bruto.rename(columns={"Mês": "Mes", "Benefício": "Beneficio", "Custo Orçado": "Orcado", "Custo Realizado": "Valor Executado"}),
+                 "mês como data": bruto.assign(**{"Mês": "2026-01-15"})}
+    print()
+    for rotulo, df_variante in variantes.items():
+        conteudo = df_variante.to_csv(index=False).encode()
+        quarentena = Quarentena()
+        df = carregamento.processar_csv(conteudo, CONTRATO_ORCAMENTO, quarentena)
+        pd.testing.assert_frame_equal(df, carregamento.processar_csv(conteudo))
+        print(f"  cabeçalho {rotulo + ':':<15} caminho {quarentena.caminho!r}, {len(df)} linhas servidas, "
+              f"divergência {quarentena.divergencia}, quarentena {quarentena.motivos or '{}'}")
+
+    # Base de vidas sem a coluna de razão social: o processamento devolve None
+    # e a revalidação registra uma carga vazia, não um erro.
+    with ServidorPlanilhas({"1": gerar_beneficiarios(1000).drop(columns=["Razão Social"])}) as servidor:
+        carregamento.URL_BASE = servidor.url_base
+        base = carregamento.load_many_beneficiarios([("1", "Saúde")])["1"].df
+        tempos = carregamento.TEMPOS[carregamento.chave_beneficiarios("1", "Saúde")]
+    assert base is None and tempos["resultado"] == "novo", tempos
+    print(f"\nBase de vidas sem razão social: resultado {tempos['resultado']!r}, nada servido")
+
+
+# ==============================================================================
+# Painel inteiro no AppTest (sessões headless)
+# ==============================================================================
+VISOES_SESSAO = ["Início", "Orçamento de Benefícios", "Análise Financeira", "Benefits Efficiency Map"]
+# GIDs sintéticos, injetados no app.py pelas variáveis DASHBOARD_GID_*.
+GIDS_SINTETICOS = {"DASHBOARD_GID_2026": "9002026", "DASHBOARD_GID_2025": "9002025",
+                   "DASHBOARD_GID_BASE_COMPLETA": "9001001", "DASHBOARD_GID_CONSULTAS": "9001002"}
+
+
+def _rss_atual_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for linha in f:
+                if linha.startswith("VmRSS:"): return int(linha.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def _planilhas_painel(linhas):
+    # Orçamentos 2025/2026, base de vidas e consultas, todas com `linhas` linhas.
+    g = GIDS_SINTETICOS
+    return {g["DASHBOARD_GID_2026"]: gerar_orcamento(linhas, seed=1), g["DASHBOARD_GID_2025"]: gerar_orcamento(linhas, seed=2),
+            g["DASHBOARD_GID_BASE_COMPLETA"]: gerar_beneficiarios(linhas, seed=3), g["DASHBOARD_GID_CONSULTAS"]: gerar_consultas(linhas, seed=4)}
+
+
+def _rodar_painel(argumentos):
+    # Subprocesso com os GIDs sintéticos e snapshots numa pasta descartável,
+    # para não ler nem sobrescrever o .cache_planilhas de verdade.
+    with tempfile.TemporaryDirectory(prefix="snapshots_bench_") as pasta:
+        ambiente = {**os.environ, **GIDS_SINTETICOS, "DASHBOARD_CONTRATOS": "1", "DASHBOARD_TELEMETRIA_LOG": "WARNING", "DASHBOARD_SNAPSHOTS": pasta}
+        saida = subprocess.run([sys.executable, __file__, *map(str, argumentos)], capture_output=True, text=True, check=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)), env=ambiente)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def _sessao_logada():
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"), default_timeout=600)
+    at.run()
+    at.text_input(key="username").input("Admin Opers")
+    at.text_input(key="password").input("BenefitsV4Company")
+    at.button[0].click()
+    at.run()
+    return at
+
+
+def _zerar_pico_rss():
+    # Linux: escrever "5" em clear_refs reinicia o VmHWM no RSS atual, o que dá
+    # o pico de cada visão em vez do pico acumulado do processo.
+    try:
+        with open("/proc/self/clear_refs", "w") as f: f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _widget(elementos, rotulo):
+    return next((w for w in elementos if w.label.startswith(rotulo)), None)
+
+
+def _escolher(elementos, rotulo, valores):
+    # valores: função das opções do widget -> novo valor. Sem o widget (visão
+    # vazia ou com erro), o passo vira só um rerun.
+    # Widget dentro de formulário só vale com o "Aplicar" do formulário.
+    w = _widget(elementos, rotulo)
+    if w is None: return
+    w.set_value(valores(list(w.options)))
+    if w.proto.form_id: next(b for b in w.root.button if b.proto.form_id == w.proto.form_id).click()
+
+
+# Passos de cada visão: (nome, ação sobre o AppTest antes do rerun).
+PASSOS_VISOES = {
+    "Início": [],
+    "Orçamento de Benefícios": [
+        ("mês", lambda at: _escolher(at.multiselect, "Filtrar por Mês", lambda op: op[:3])),
+        ("benefício", lambda at: _escolher(at.multiselect, "Filtrar por Benefício", lambda op: op[:2])),
+        ("limpar", lambda at: [_escolher(at.multiselect, r, lambda op: []) for r in ("Filtrar por Mês", "Filtrar por Benefício")]),
+    ],
+    "Análise Financeira": [
+        ("mês", lambda at: _escolher(at.selectbox, "📅", lambda op: op[2])),
+        ("benefício", lambda at: _escolher(at.multiselect, "🔍", lambda op: op[:2])),
+        ("limpar", lambda at: _escolher(at.multiselect, "🔍", lambda op: [])),
+    ],
+    "Benefits Efficiency Map": [
+        ("status", lambda at: _escolher(at.multiselect, "Status da Consulta", lambda op: op)),
+        ("especialidade", lambda at: _escolher(at.multiselect, "Especialidade", lambda op: op[:2])),
+        ("razão social", lambda at: _escolher(at.selectbox, "Selecione a Razão Social", lambda op: op[1] if len(op) > 1 else op[0])),
+        ("limpar", lambda at: _escolher(at.multiselect, "Especialidade", lambda op: [])),
+    ],
+}
+
+
+def _rerun_medido(at, amostras, visao, passo, erros):
+    inicio = time.perf_counter()
+    at.run()
+    amostras.setdefault(visao, {}).setdefault(passo, []).append((time.perf_counter() - inicio) * 1000)
+    for e in at.exception: erros.add(f"{visao} / {passo}: {str(e.value).splitlines()[0][:200]}")
+
+
+def _medir_visoes_isoladas(args):
+    # Um subprocesso por tamanho. O primeiro "abrir" de cada visão é a carga a
+    # frio; o pico de memória de cada visão é medido acima do RSS de quando
+    # ela começou (ou do pico acumulado, se o VmHWM não puder ser zerado).
+    import carregamento
+    inicio_processo = _rss_atual_mb()
+    with ServidorPlanilhas(_planilhas_painel(args.interno)) as servidor:
+        carregamento.URL_BASE = servidor.url_base
+        at = _sessao_logada()
+        amostras, picos, erros = {}, {}, set()
+        for _ in range(args.repeticoes):
+            for visao in VISOES_SESSAO:
+                base = _rss_atual_mb() if _zerar_pico_rss() else inicio_processo
+                at.sidebar.radio[0].set_value(visao)
+                _rerun_medido(at, amostras, visao, "abrir", erros)
+                for passo, acao in PASSOS_VISOES[visao]:
+                    acao(at)
+                    _rerun_medido(at, amostras, visao, passo, erros)
+                picos[visao] = max(picos.get(visao, 0.0), _pico_rss_mb() - base)
+        rss_final = _rss_atual_mb() - inicio_processo
+    visoes = {}
+    for visao, passos in amostras.items():
+        quentes = np.array(passos["abrir"][1:] + [t for p, ts in passos.items() if p != "abrir" for t in ts])
+        visoes[visao] = {"frio_ms": passos["abrir"][0],
+                         "p50_ms": float(np.percentile(quentes, 50)) if len(quentes) else None,
+                         "p95_ms": float(np.percentile(quentes, 95)) if len(quentes) else None,
+                         "pico_rss_mb": picos[visao],
+                         "passos": {p: {"n": len(ts), "p50_ms": float(np.percentile(ts, 50)), "max_ms": float(max(ts))} for p, ts in passos.items()}}
+    print(json.dumps({"linhas": args.interno, "rss_final_mb": rss_final, "visoes": visoes, "erros": sorted(erros)}, ensure_ascii=False))
+
+
+def _metadados_execucao():
+    import streamlit
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"gerado_em": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": sys.version.split()[0],
+            "pandas": pd.__version__, "numpy": np.__version__, "streamlit": streamlit.__version__}
+
+
+def _comparar_visoes(anterior, atual):
+    print(f"\nComparação com {anterior['metadados'].get('commit')} ({anterior['metadados'].get('gerado_em')}):")
+    antigos = {(r["linhas"], v): d for r in anterior["resultados"] for v, d in r["visoes"].items()}
+    for r in atual["resultados"]:
+        for visao, d in r["visoes"].items():
+            a = antigos.get((r["linhas"], visao))
+            if not a or not a.get("p95_ms") or not d.get("p95_ms"): continue
+            print(f"  {r['linhas']:>8} {visao:<26} p95 {a['p95_ms']:8.0f}ms -> {d['p95_ms']:8.0f}ms ({d['p95_ms'] / a['p95_ms']:5.2f}x)  "
+                  f"frio {a['frio_ms']:8.0f}ms -> {d['frio_ms']:8.0f}ms")
+
+
+def bench_visoes(args):
+    if args.interno: return _medir_visoes_isoladas(args)
+    resultado = {"metadados": {**_metadados_execucao(), "repeticoes": args.repeticoes}, "resultados": []}
+    print(f"Painel completo no AppTest: {args.repeticoes} volta(s) pelas {len(VISOES_SESSAO)} visões com filtros")
+    for linhas in args.linhas:
+        r = _rodar_painel(["visoes", "--interno", linhas, "--repeticoes", args.repeticoes])
+        resultado["resultados"].append(r)
+        print(f"{linhas} linhas por planilha (RSS ao final +{r['rss_final_mb']:.0f}MB)")
+        for visao, d in r["visoes"].items():
+            quente = f"p50={d['p50_ms']:7.0f}ms p95={d['p95_ms']:7.0f}ms" if d["p95_ms"] is not None else "-"
+            print(f"  {visao:<26} frio={d['frio_ms']:8.0f}ms  {quente}  pico RSS +{d['pico_rss_mb']:.0f}MB")
+        for erro in r["erros"]: print(f"  ! {erro}")
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"Resultados salvos em {args.saida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            _comparar_visoes(json.load(f), resultado)
+
+
+def _medir_sessoes_isoladas(args):
+    # Executado num subprocesso por número de sessões: o RSS de uma rodada
+    # não contamina a próxima. Uma sessão de aquecimento carrega as planilhas
+    # e os derivados; depois as N sessões ficam vivas e navegam em rodízio
+    # (o AppTest troca o Runtime global a cada run, então não dá para rodar
+    # as sessões em threads paralelas).
+    import carregamento
+    with ServidorPlanilhas(_planilhas_painel(args.linhas)) as servidor:
+        carregamento.URL_BASE = servidor.url_base
+        aquecimento = _sessao_logada()
+        for visao in VISOES_SESSAO:
+            aquecimento.sidebar.radio[0].set_value(visao)
+            aquecimento.run()
+        base = _rss_atual_mb()
+        sessoes = [_sessao_logada() for _ in range(args.interno)]
+        tempos = []
+        for _ in range(args.voltas):
+            for visao in VISOES_SESSAO:
+                for at in sessoes:
+                    at.sidebar.radio[0].set_value(visao)
+                    inicio = time.perf_counter()
+                    at.run()
+                    tempos.append(time.perf_counter() - inicio)
+        ms = np.array(tempos) * 1000
+        delta = _rss_atual_mb() - base
+    print(json.dumps({"rss_mb": delta, "rss_por_sessao_mb": delta / args.interno, "reruns": len(ms),
+                      "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95))}))
+
+
+# Um diretor montando a análise: em cada visão, os filtros são escolhidos um
+# valor por vez, como no navegador. (visão, rótulo do widget, quantos valores)
+ROTEIRO_FILTROS = [
+    ("Orçamento de Benefícios", "Filtrar por Mês", 3),
+    ("Orçamento de Benefícios", "Filtrar por Benefício", 6),
+    ("Análise Financeira", "🔍", 6),
+    ("Benefits Efficiency Map", "Status da Consulta", 2),
+    ("Benefits Efficiency Map", "Especialidade", 4),
+]
+
+
+def _medir_filtros_isolados(args):
+    # Reproduz o que o navegador envia: widget fora de formulário dispara um
+    # rerun a cada clique; dentro de formulário, só o "Aplicar" dispara. As
+    # execuções completas do script são contadas pelas amostras "total" da
+    # telemetria (o AppTest sempre roda o script inteiro, então um rerun que
+    # no navegador seria só de fragmento também conta aqui).
+    import carregamento
+    import telemetria
+    with ServidorPlanilhas(_planilhas_painel(args.linhas)) as servidor:
+        carregamento.URL_BASE = servidor.url_base
+        at = _sessao_logada()
+        visoes = {}
+        for visao in dict.fromkeys(v for v, _, _ in ROTEIRO_FILTROS):
+            at.sidebar.radio[0].set_value(visao)
+            at.run()
+            antes = len(telemetria.amostras(visao, "total"))
+            cliques, tempos, formularios = 0, [], set()
+            for _, rotulo, quantidade in (p for p in ROTEIRO_FILTROS if p[0] == visao):
+                for _ in range(quantidade):
+                    w = _widget(at.multiselect, rotulo)
+                    livres = [o for o in w.options if o not in w.value] if w is not None else []
+                    if not livres: break
+                    w.set_value(list(w.value) + livres[:1])
+                    cliques += 1
+                    if w.proto.form_id:
+                        formularios.add(w.proto.form_id)
+                        continue
+                    inicio = time.perf_counter(); at.run(); tempos.append(time.perf_counter() - inicio)
+            for form_id in formularios:
+                enviar = next(b for b in at.button if b.proto.form_id == form_id)
+                enviar.click()
+                inicio = time.perf_counter(); at.run(); tempos.append(time.perf_counter() - inicio)
+            visoes[visao] = {"cliques": cliques, "reruns": len(tempos), "execucoes_completas": len(telemetria.amostras(visao, "total")) - antes,
+                             "tempo_ms": sum(tempos) * 1000, "erros": [str(e.value).splitlines()[0][:200] for e in at.exception]}
+    print(json.dumps({"linhas": args.linhas, "visoes": visoes}, ensure_ascii=False))
+
+
+def bench_filtros(args):
+    if args.interno: return _medir_filtros_isolados(args)
+    r = _rodar_painel(["filtros", "--interno", 1, "--linhas", args.linhas])
+    print(f"Execuções do pipeline numa sessão que escolhe filtros um a um ({args.linhas} linhas por planilha):")
+    for visao, d in r["visoes"].items():
+        print(f"  {visao:<26} {d['cliques']:>2} cliques -> {d['reruns']:>2} reruns, {d['execucoes_completas']:>2} execuções completas, {d['tempo_ms']:7.0f}ms")
+        for erro in d["erros"]: print(f"    ! {erro}")
+    total = {k: sum(d[k] for d in r["visoes"].values()) for k in ["cliques", "reruns", "execucoes_completas", "tempo_ms"]}
+    print(f"  {'sessão':<26} {total['cliques']:>2} cliques -> {total['reruns']:>2} reruns, {total['execucoes_completas']:>2} execuções completas, {total['tempo_ms']:7.0f}ms")
+
+
+def _replica(args):
+    # Uma réplica do painel: às `--inicio` carrega as planilhas e monta o cubo
+    # do orçamento; às `--revalidar` força a revalidação do orçamento 2026
+    # (que o processo pai trocou no servidor entre os dois instantes).
+    import agregados
+    import carregamento
+    from normalizacao import PAPEIS_ORCAMENTO, resolver_papeis
+    montagens = []
+    montar = agregados._montar_cubo_orcamento
+    agregados._montar_cubo_orcamento = lambda *a: montagens.append(1) or montar(*a)
+    gids = list(GIDS_SINTETICOS.values())
+    gid = GIDS_SINTETICOS["DASHBOARD_GID_2026"]
+
+    def estado():
+        return {g: [carregamento._cache[g].versao, carregamento._cache[g].hash_conteudo] for g in gids}
+
+    time.sleep(max(0.0, args.inicio - time.time()))
+    inicio = time.perf_counter()
+    planilhas = carregamento.load_many_folhas(gids)
+    agregados.cubo_orcamento(planilhas[gid], resolver_papeis(planilhas[gid].df, PAPEIS_ORCAMENTO))
+    carga = {"s": time.perf_counter() - inicio, "estado": estado()}
+    time.sleep(max(0.0, args.revalidar - time.time()))
+    inicio = time.perf_counter()
+    carregamento.atualizar([gid])
+    folha = carregamento.load_folha(gid)
+    agregados.cubo_orcamento(folha, resolver_papeis(folha.df, PAPEIS_ORCAMENTO))
+    revalidacao = {"s": time.perf_counter() - inicio, "estado": estado()}
+    print(json.dumps({"carga": carga, "revalidacao": revalidacao, "cubos_montados": len(montagens)}))
+
+
+def bench_replicas(args):
+    if args.interno: return _replica(args)
+    # Réplicas são processos de verdade, iniciados juntos e sincronizados por
+    # relógio; o "servidor do Google" conta quantas planilhas foram baixadas.
+    gid = GIDS_SINTETICOS["DASHBOARD_GID_2026"]
+    print(f"{args.replicas} réplicas, {len(GIDS_SINTETICOS)} planilhas de {args.linhas} linhas; no meio, o orçamento 2026 muda e todas revalidam")
+    with ServidorPlanilhas(_planilhas_painel(args.linhas)) as servidor:
+        for modo in args.modos:
+            with tempfile.TemporaryDirectory(prefix="cache_replicas_") as pasta:
+                ambiente = {**os.environ, "DASHBOARD_TELEMETRIA_LOG": "WARNING", "DASHBOARD_SNAPSHOTS": pasta,
+                            "DASHBOARD_CACHE": modo, "PLANILHA_URL_BASE": servidor.url_base}
+                inicio = time.time() + args.partida
+                revalidar = inicio + args.intervalo
+                downloads = servidor.downloads
+                processos = [subprocess.Popen([sys.executable, __file__, "replicas", "--interno", str(i + 1), "--inicio", str(inicio),
+                                               "--revalidar", str(revalidar)], stdout=subprocess.PIPE, text=True, env=ambiente,
+                                              cwd=os.path.dirname(os.path.abspath(__file__))) for i in range(args.replicas)]
+                time.sleep(max(0.0, (inicio + revalidar) / 2 - time.time()))
+                downloads_carga = servidor.downloads - downloads
+                original = servidor.planilhas[gid]
+                servidor.planilhas[gid] = gerar_orcamento(args.linhas, seed=99).to_csv(index=False).encode()
+                saidas = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in processos]
+                servidor.planilhas[gid] = original
+                downloads_revalidacao = servidor.downloads - downloads - downloads_carga
+            for fase, baixadas in (("carga", downloads_carga), ("revalidacao", downloads_revalidacao)):
+                estados = {json.dumps(s[fase]["estado"], sort_keys=True) for s in saidas}
+                tempos = [s[fase]["s"] * 1000 for s in saidas]
+                print(f"  {modo:<9} {fase:<12} {baixadas:>3} downloads  {len(estados)} estado(s) distinto(s) entre réplicas  "
+                      f"p50={np.percentile(tempos, 50):6.0f}ms máx={max(tempos):6.0f}ms")
+                assert len(estados) == 1, f"{modo}: réplicas divergem na {fase}"
+            montados = sum(s['cubos_montados'] for s in saidas)
+            print(f"  {modo:<9} cubos do orçamento montados: {montados}")
+            # Com cache compartilhado, cada planilha é baixada e cada cubo montado
+            # uma vez para todas as réplicas; por processo, uma vez por réplica.
+            copias = args.replicas if modo == "processo" else 1
+            assert downloads_carga == len(GIDS_SINTETICOS) * copias, f"{modo}: {downloads_carga} downloads na carga"
+            assert downloads_revalidacao == copias, f"{modo}: {downloads_revalidacao} downloads na revalidação"
+            assert montados == 2 * copias, f"{modo}: {montados} cubos montados"
+            # Só o orçamento 2026 ganha versão (e conteúdo) nova; o resto fica igual.
+            for s in saidas:
+                carga, revalidacao = s["carga"]["estado"], s["revalidacao"]["estado"]
+                assert revalidacao[gid][0] == carga[gid][0] + 1 and revalidacao[gid][1] != carga[gid][1], (modo, carga[gid], revalidacao[gid])
+                assert all(revalidacao[g] == carga[g] for g in carga if g != gid), modo
+
+
+MODULOS_PESADOS = ["pandas", "numpy", "plotly.express", "pyarrow", "matplotlib"]
+# Roda num "python -c" e não importa este arquivo: benchmark.py já traz pandas
+# e numpy, o que esconderia o que o app importa por conta própria.
+SCRIPT_PARTIDA = """
+import json, os, sys, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(os.path.join(sys.argv[1], "app.py"), default_timeout=600)
+t = time.perf_counter(); at.run(); login_ms = (time.perf_counter() - t) * 1000
+carregados = [m for m in sys.argv[2].split(",") if m in sys.modules]
+at.text_input(key="username").input("Admin Opers")
+at.text_input(key="password").input("BenefitsV4Company")
+at.button[0].click()
+t = time.perf_counter(); at.run(); inicio_ms = (time.perf_counter() - t) * 1000
+at.sidebar.radio[0].set_value("Orçamento de Benefícios")
+t = time.perf_counter(); at.run(); orcamento_ms = (time.perf_counter() - t) * 1000
+print(json.dumps({"login_ms": login_ms, "inicio_ms": inicio_ms, "orcamento_ms": orcamento_ms,
+                  "total_ms": (time.perf_counter() - inicio) * 1000, "modulos_no_login": carregados}))
+"""
+
+
+def bench_partida(args):
+    # Processo novo a cada medição: nada importado, nenhuma planilha em cache.
+    pasta_app = os.path.dirname(os.path.abspath(__file__))
+    medidas = []
+    with ServidorPlanilhas(_planilhas_painel(args.linhas)) as servidor:
+        for _ in range(args.repeticoes):
+            conexoes = servidor.conexoes
+            with tempfile.TemporaryDirectory(prefix="snapshots_bench_") as pasta:
+                ambiente = {**os.environ, **GIDS_SINTETICOS, "DASHBOARD_CONTRATOS": "1", "DASHBOARD_TELEMETRIA_LOG": "WARNING",
+                            "DASHBOARD_SNAPSHOTS": pasta, "PLANILHA_URL_BASE": servidor.url_base}
+                saida = subprocess.run([sys.executable, "-c", SCRIPT_PARTIDA, pasta_app, ",".join(MODULOS_PESADOS)],
+                                       capture_output=True, text=True, check=True, cwd=pasta_app, env=ambiente)
+            medidas.append({**json.loads(saida.stdout.strip().splitlines()[-1]), "downloads": servidor.conexoes - conexoes})
+    mediana = {k: float(np.median([m[k] for m in medidas])) for k in ["login_ms", "inicio_ms", "orcamento_ms", "total_ms"]}
+    print(f"Partida a frio ({args.repeticoes} processos novos, mediana; planilhas com {args.linhas} linhas):")
+    print(f"  tela de login (1º run):       {mediana['login_ms']:7.0f}ms  módulos pesados já importados: {', '.join(medidas[0]['modulos_no_login']) or 'nenhum'}")
+    print(f"  login -> Início:              {mediana['inicio_ms']:7.0f}ms")
+    print(f"  Início -> Orçamento (frio):   {mediana['orcamento_ms']:7.0f}ms  ({medidas[0]['downloads']} planilhas baixadas)")
+    print(f"  processo inteiro:             {mediana['total_ms']:7.0f}ms")
+
+
+def bench_sessoes(args):
+    if args.interno: return _medir_sessoes_isoladas(args)
+    print(f"Sessões vivas no mesmo processo: {args.voltas} volta(s) pelas {len(VISOES_SESSAO)} visões cada")
+    for n in args.sessoes:
+        r = _rodar_painel(["sessoes", "--interno", n, "--linhas", args.linhas, "--voltas", args.voltas])
+        print(f"  {n:>3} sessões: RSS +{r['rss_mb']:6.1f}MB ({r['rss_por_sessao_mb']:5.2f}MB/sessão)  "
+              f"rerun p50={r['p50_ms']:6.0f}ms p95={r['p95_ms']:6.0f}ms  ({r['reruns']} reruns)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cenario", required=True)
+
+    p = sub.add_parser("carga", help="download sequencial x load_many em paralelo")
+    p.add_argument("--latencia", type=float, default=0.3)
+    p.add_argument("--linhas", type=int, default=2000)
+    p.add_argument("--sessoes", type=int, default=8)
+    p.set_defaults(func=bench_carga)
+
+    p = sub.add_parser("moeda", help="conversão de colunas R$ original x vetorizada")
+    p.add_argument("--tamanhos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    p.set_defaults(func=bench_moeda)
+
+    p = sub.add_parser("meses", help="filtros/groupby por mês com apply x ordinal int8 e Categoricals")
+    p.add_argument("--anos", type=int, default=5)
+    p.add_argument("--linhas-por-ano", type=int, default=200_000)
+    p.set_defaults(func=bench_meses)
+
+    p = sub.add_parser("memoria", help="pico de RSS: carga completa + padronizar_colunas x ingestão em lotes")
+    p.add_argument("--linhas", type=int, default=500_000)
+    p.add_argument("--interno", choices=["original", "lotes"], help=argparse.SUPPRESS)
+    p.add_argument("--arquivo", help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_memoria)
+
+    p = sub.add_parser("ativos", help="CSS do login: base64 a cada rerun x variante reduzida memorizada/estática")
+    p.add_argument("--repeticoes", type=int, default=20)
+    p.set_defaults(func=bench_ativos)
+
+    p = sub.add_parser("matriz", help="Visão Matricial: Styler.background_gradient x gradiente/R$ vetorizados")
+    p.add_argument("--beneficios", type=int, default=60)
+    p.set_defaults(func=bench_matriz)
+
+    p = sub.add_parser("formatacao", help="rótulos R$/%% por célula x formatação vetorizada")
+    p.add_argument("--tamanhos", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    p.set_defaults(func=bench_formatacao)
+
+    p = sub.add_parser("vidas", help="filtros de vidas por varredura de texto x bitmaps da BaseVidas")
+    p.add_argument("--linhas", type=int, default=500_000)
+    p.set_defaults(func=bench_vidas)
+
+    p = sub.add_parser("consultas", help="filtros de consultas por cópia + groupby x somas no cubo empresa/status/especialidade")
+    p.add_argument("--linhas", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000])
+    p.set_defaults(func=bench_consultas)
+
+    p = sub.add_parser("anual", help="Análise Financeira: filtros por ano + groupby x índice (ano, mês, benefício)")
+    p.add_argument("--anos", type=int, nargs="+", default=[2, 5])
+    p.add_argument("--linhas-por-ano", type=int, default=200_000)
+    p.set_defaults(func=bench_anual)
+
+    p = sub.add_parser("tendencia", help="KPIs do Início: groupby no razão a cada rerun x visão materializada por período")
+    p.add_argument("--linhas", type=int, nargs="+", default=[10_000, 1_000_000])
+    p.set_defaults(func=bench_tendencia)
+
+    p = sub.add_parser("exportacao", help="exportação CSV/XLSX/Parquet gerada no rerun x no pool de exportação")
+    p.add_argument("--linhas", type=int, default=500_000)
+    p.set_defaults(func=bench_exportacao)
+
+    p = sub.add_parser("contratos", help="leitura da planilha: detecção heurística x contrato tipado, e quarentena de linhas ruins")
+    p.add_argument("--linhas", type=int, nargs="+", default=[100_000, 1_000_000])
+    p.set_defaults(func=bench_contratos)
+
+    p = sub.add_parser("visoes", help="latência por visão/filtro e pico de memória do painel inteiro no AppTest (JSON)")
+    p.add_argument("--linhas", type=int, nargs="+", default=[1_000, 100_000])
+    p.add_argument("--repeticoes", type=int, default=3)
+    p.add_argument("--saida", default="benchmark_visoes.json")
+    p.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    p.add_argument("--interno", type=int, help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_visoes)
+
+    p = sub.add_parser("partida", help="partida a frio: tela de login, login -> Início e primeira abertura do Orçamento")
+    p.add_argument("--linhas", type=int, default=20_000)
+    p.add_argument("--repeticoes", type=int, default=5)
+    p.set_defaults(func=bench_partida)
+
+    p = sub.add_parser("sessoes", help="RSS e p95 do rerun com 1, 10 e 50 sessões simultâneas no mesmo processo")
+    p.add_argument("--sessoes", type=int, nargs="+", default=[1, 10, 50])
+    p.add_argument("--linhas", type=int, default=2000)
+    p.add_argument("--voltas", type=int, default=2)
+    p.add_argument("--interno", type=int, help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_sessoes)
+
+    p = sub.add_parser("filtros", help="execuções do pipeline por sessão ao escolher filtros um a um (formulários x rerun por clique)")
+    p.add_argument("--linhas", type=int, default=20_000)
+    p.add_argument("--interno", type=int, help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_filtros)
+
+    p = sub.add_parser("replicas", help="várias réplicas em processos: downloads e versões com cache por processo x disco/SQLite compartilhado")
+    p.add_argument("--replicas", type=int, default=4)
+    p.add_argument("--linhas", type=int, default=20_000)
+    p.add_argument("--modos", nargs="+", default=["processo", "disco", "sqlite"])
+    p.add_argument("--partida", type=float, default=4.0, help="segundos até a carga (tempo de import das réplicas)")
+    p.add_argument("--intervalo", type=float, default=6.0, help="segundos entre a carga e a revalidação")
+    p.add_argument("--interno", type=int, help=argparse.SUPPRESS)
+    p.add_argument("--inicio", type=float, help=argparse.SUPPRESS)
+    p.add_argument("--revalidar", type=float, help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_replicas)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+import argparse
+import dataclasses
+import hashlib
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from armazenamento import criar_armazem
+from contratos import CONTRATOS, Quarentena, ler_com_contrato
+from normalizacao import (
+    COLUNAS_TEXTO_BENEFICIARIOS, PAPEIS_BENEFICIARIOS, PAPEIS_LIDOS_BENEFICIARIOS, juntar_lotes_beneficiarios, padronizar_beneficiarios,
+    preparar_dimensoes, resolvedor_para, tratar_colunas_financeiras,
+)
+from telemetria import registrar_cache, registrar_contrato
+
+# Os DataFrames servidos são os mesmos para todas as sessões e nunca são
+# alterados no lugar. Com Copy-on-Write (sempre ligado no pandas 3), fatias e
+# colunas derivadas são vistas: uma sessão que altera o que recebeu ganha cópia
+# só do que tocou, sem afetar as outras.
+if int(pd.__version__.split(".")[0]) < 3:
+    try:
+        pd.set_option("mode.copy_on_write", True)
+    except (KeyError, pd.errors.OptionError):
+        pass
+
+# ==============================================================================
+# Carregamento das planilhas publicadas (Google Sheets -> CSV)
+# ==============================================================================
+# O estado deste módulo é do processo: o Streamlit reexecuta o app.py a cada
+# interação, mas módulos importados ficam em sys.modules e são compartilhados
+# entre todas as sessões.
+PUB_ID = "2PACX-1vRDOYmkYSNo7Ttbw0GM5YhDH3nYafq-Jg2o-fk1LaFOYjRw9oKQhwVe8YvBTdrmtOdzVsQdw-koM2oz"
+URL_BASE = os.environ.get("PLANILHA_URL_BASE", f"https://docs.google.com/spreadsheets/d/e/{PUB_ID}/pub")
+TTL_SEGUNDOS = 600
+# A revalidação em segundo plano começa antes do TTL vencer, para que nenhum
+# usuário espere um download síncrono.
+MARGEM_SEGUNDOS = 120
+INTERVALO_AGENDADOR = 30
+MAX_CONEXOES = 8
+TIMEOUT_SEGUNDOS = 30
+TAMANHO_LOTE = 20_000
+# Snapshot colunar (Feather/Arrow) de cada planilha já normalizada: serve a
+# partida a frio na hora e permite rodar só com os arquivos locais.
+PASTA_SNAPSHOTS = os.environ.get("DASHBOARD_SNAPSHOTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache_planilhas"))
+MODO_OFFLINE = os.environ.get("DASHBOARD_OFFLINE", "").lower() in ("1", "true", "sim")
+# Com várias réplicas (DASHBOARD_CACHE=disco ou sqlite), cada processo confere
+# no armazenamento compartilhado, no máximo a cada INTERVALO_SINCRONIA, se
+# outra réplica (ou o sidecar: python carregamento.py) gravou versão nova.
+ARMAZEM = criar_armazem(os.environ.get("DASHBOARD_CACHE"), PASTA_SNAPSHOTS)
+INTERVALO_SINCRONIA = 5
+
+
+@dataclass
+class Folha:
+    chave: str
+    df: pd.DataFrame | None
+    carregado_em: float
+    verificado_em: float
+    versao: int = 0
+    etag: str | None = None
+    last_modified: str | None = None
+    hash_conteudo: str | None = None
+    sincronizado_em: float = 0.0
+
+
+# Cada entrada do cache é uma "chave": o próprio GID para a planilha bruta
+# (load_data) ou GID + processamento para leituras especializadas, como a
+# ingestão em lotes das bases de beneficiários.
+_fontes = {}
+_cache = {}
+_travas = {}
+_em_atualizacao = set()
+_trava_global = threading.Lock()
+_sessao = None
+_agendador = None
+_executor = ThreadPoolExecutor(max_workers=MAX_CONEXOES, thread_name_prefix="planilhas")
+
+# Tempos da última verificação de cada chave (download, processamento, total), em segundos.
+TEMPOS = {}
+# Caminho de leitura e linhas em quarentena da versão servida de cada chave.
+QUARENTENA = {}
+# Contrato de esquema de cada GID (contratos.py), definido pelo app.
+_contratos = {}
+
+
+def montar_url(gid):
+    return f"{URL_BASE}?gid={gid}&single=true&output=csv"
+
+
+def obter_sessao():
+    # Uma única sessão keep-alive para todas as planilhas: a conexão TLS com o
+    # Google é reaproveitada entre GIDs e entre recargas.
+    global _sessao
+    with _trava_global:
+        if _sessao is None:
+            sessao = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=MAX_CONEXOES, pool_maxsize=MAX_CONEXOES)
+            sessao.mount("https://", adaptador)
+            sessao.mount("http://", adaptador)
+            _sessao = sessao
+        return _sessao
+
+
+def _trava_da_chave(chave):
+    with _trava_global:
+        return _travas.setdefault(chave, threading.Lock())
+
+
+def _registrar(chave, gid, processar):
+    with _trava_global:
+        _fontes.setdefault(chave, (gid, processar))
+
+
+def definir_contratos(contratos):
+    # {gid: Contrato}; vale a partir da próxima vez que cada planilha for processada.
+    _contratos.update({gid: contrato for gid, contrato in contratos.items() if gid})
+
+
+def _contrato_da_chave(chave):
+    if chave in _contratos: return _contratos[chave]
+    return CONTRATOS.get((_ler_meta(chave) or {}).get("contrato"))
+
+
+def _processar_planilha(chave):
+    return lambda conteudo, quarentena: processar_csv(conteudo, _contrato_da_chave(chave), quarentena)
+
+
+def _processar_beneficiarios(nome_beneficio):
+    return lambda conteudo, quarentena: processar_beneficiarios(conteudo, nome_beneficio)
+
+
+def _fonte(chave):
+    # Chaves que este processo ainda não registrou (ex.: o sidecar, que só
+    # conhece as chaves do armazenamento) são reconstruídas pelo formato.
+    if chave in _fontes: return _fontes[chave]
+    gid, _, nome_beneficio = str(chave).partition("~beneficiarios~")
+    if nome_beneficio: return gid, _processar_beneficiarios(nome_beneficio)
+    return chave, _processar_planilha(chave)
+
+
+def _vencida(folha, margem=0):
+    return time.time() - folha.verificado_em >= TTL_SEGUNDOS - margem
+
+
+def baixar_csv(gid, folha=None):
+    # Requisição condicional: com ETag/Last-Modified da última versão boa, o
+    # servidor pode responder 304 e nada é baixado nem processado.
+    cabecalhos = {}
+    if folha is not None and folha.df is not None:
+        if folha.etag: cabecalhos["If-None-Match"] = folha.etag
+        if folha.last_modified: cabecalhos["If-Modified-Since"] = folha.last_modified
+    resposta = obter_sessao().get(montar_url(gid), headers=cabecalhos, timeout=TIMEOUT_SEGUNDOS)
+    if resposta.status_code == 304: return resposta, None
+    resposta.raise_for_status()
+    return resposta, resposta.content
+
+
+def ler_csv_tolerante(conteudo, quarentena):
+    try:
+        return pd.read_csv(io.BytesIO(conteudo))
+    except pd.errors.ParserError:
+        # Linha com campos a mais: em vez de derrubar a planilha inteira, o
+        # motor python relê e cada linha malformada vai para a quarentena.
+        ruins = []
+        df = pd.read_csv(io.BytesIO(conteudo), engine="python", on_bad_lines=ruins.append)
+        quarentena.recusar("colunas_a_mais", len(ruins), [{"valor": ",".join(map(str, linha))[:200]} for linha in ruins])
+        return df
+
+
+def processar_csv(conteudo, contrato=None, quarentena=None):
+    # Com contrato e cabeçalho conferido: leitura tipada. Senão, detecção
+    # heurística das colunas financeiras e das dimensões.
+    quarentena = quarentena if quarentena is not None else Quarentena()
+    if contrato is not None:
+        df = ler_com_contrato(conteudo, contrato, quarentena)
+        if df is not None: return df
+    df = ler_csv_tolerante(conteudo, quarentena)
+    return preparar_dimensoes(tratar_colunas_financeiras(df))
+
+
+def processar_beneficiarios(conteudo, nome_beneficio):
+    # O cabeçalho é lido primeiro para resolver os papéis: só as colunas usadas
+    # são lidas, e cada lote é padronizado e reduzido (códigos, float32 e
+    # marcações Ativo/Titular) antes do próximo, sem o DataFrame bruto inteiro.
+    cabecalho = pd.read_csv(io.BytesIO(conteudo), nrows=0).columns
+    papeis = resolvedor_para(tuple(cabecalho)).resolver(PAPEIS_BENEFICIARIOS)
+    if not papeis["razao"]: return None
+    usecols = list(dict.fromkeys(papeis[p] for p in PAPEIS_LIDOS_BENEFICIARIOS if papeis[p]))
+    texto = {papeis[p]: str for p in COLUNAS_TEXTO_BENEFICIARIOS if papeis[p]}
+    leitor = pd.read_csv(io.BytesIO(conteudo), usecols=usecols, dtype=texto, chunksize=TAMANHO_LOTE)
+    return juntar_lotes_beneficiarios([padronizar_beneficiarios(lote, papeis, nome_beneficio) for lote in leitor])
+
+
+def salvar_snapshot(folha, com_dados=True):
+    if folha.df is None: return
+    contrato, quarentena = _contratos.get(folha.chave), QUARENTENA.get(folha.chave)
+    meta = {"chave": folha.chave, "versao": folha.versao, "carregado_em": folha.carregado_em, "verificado_em": folha.verificado_em,
+            "etag": folha.etag, "last_modified": folha.last_modified, "hash_conteudo": folha.hash_conteudo,
+            "contrato": contrato.nome if contrato else None, "quarentena": dataclasses.asdict(quarentena) if quarentena else None}
+    try:
+        ARMAZEM.gravar(folha.chave, meta, folha.df if com_dados else None)
+    except Exception:
+        pass
+
+
+def _ler_meta(chave):
+    try:
+        return ARMAZEM.ler_meta(chave)
+    except Exception:
+        return None
+
+
+def ler_snapshot(chave, meta=None):
+    meta = meta or _ler_meta(chave)
+    if meta is None: return None
+    try:
+        df = ARMAZEM.ler_dados(chave, meta["versao"])
+    except Exception:
+        df = None
+    if df is None: return None
+    # Snapshot local: a versão é servida já marcada para revalidação
+    # (verificado_em=0). Compartilhado: vale a última verificação de qualquer réplica.
+    verificado_em = meta["verificado_em"] if ARMAZEM.compartilhado else 0.0
+    if meta.get("quarentena"): QUARENTENA[chave] = Quarentena(**meta["quarentena"])
+    return Folha(chave, df, meta["carregado_em"], verificado_em, meta["versao"], meta["etag"], meta["last_modified"],
+                 meta["hash_conteudo"], sincronizado_em=time.time())
+
+
+def _adotar(chave, folha, meta):
+    # Troca a folha do processo pela versão mais nova do armazenamento
+    # compartilhado; na mesma versão, só herda a hora da última verificação.
+    if meta is None: return folha
+    if folha is None or folha.df is None or meta["versao"] > folha.versao:
+        nova = ler_snapshot(chave, meta)
+        if nova is not None:
+            _cache[chave] = nova
+            return nova
+    elif meta["versao"] == folha.versao:
+        folha.verificado_em = max(folha.verificado_em, meta["verificado_em"])
+    if folha is not None: folha.sincronizado_em = time.time()
+    return folha
+
+
+def _sincronizar(chave, folha):
+    if not ARMAZEM.compartilhado or time.time() - folha.sincronizado_em < INTERVALO_SINCRONIA: return folha
+    trava = _trava_da_chave(chave)
+    # Revalidação em andamento neste processo: ela mesma adota o que achar.
+    if not trava.acquire(blocking=False): return folha
+    try:
+        return _adotar(chave, _cache.get(chave, folha), _ler_meta(chave))
+    finally:
+        trava.release()
+
+
+def _folha_inicial(chave):
+    folha = _cache.get(chave)
+    if folha is None:
+        with _trava_da_chave(chave):
+            folha = _cache.get(chave)
+            if folha is None:
+                folha = ler_snapshot(chave)
+                if folha is not None:
+                    _cache[chave] = folha
+                    TEMPOS[chave] = {"resultado": "snapshot"}
+    return folha
+
+
+def _consultar_cache(chave):
+    # Situação da chave antes de servir: em memória, recuperada do snapshot ou ausente.
+    folha = _cache.get(chave)
+    if folha is not None: return _sincronizar(chave, folha), "memoria"
+    folha = _folha_inicial(chave)
+    return folha, "snapshot" if folha is not None else "falta"
+
+
+def _atualizar(chave, forcar=False):
+    # Uma trava por chave evita que duas sessões baixem a mesma planilha ao
+    # mesmo tempo; no armazenamento compartilhado, a trava vale entre réplicas.
+    gid, processar = _fonte(chave)
+    pedido_em = time.time()
+    with _trava_da_chave(chave), ARMAZEM.trava(chave):
+        folha = _cache.get(chave)
+        meta = _ler_meta(chave) if ARMAZEM.compartilhado else None
+        if meta is not None:
+            # Outra réplica pode ter revalidado enquanto esta esperava a trava.
+            folha = _adotar(chave, folha, meta)
+            if forcar and folha is not None and folha.verificado_em >= pedido_em: return folha
+        if folha is not None and not forcar and not _vencida(folha): return folha
+        if MODO_OFFLINE:
+            if folha is None: folha = _cache.setdefault(chave, Folha(chave, None, time.time(), time.time()))
+            return folha
+
+        inicio = time.perf_counter()
+        tempos = {"download_s": 0.0, "processamento_s": 0.0, "bytes": 0}
+        try:
+            resposta, conteudo = baixar_csv(gid, folha)
+            tempos["download_s"] = time.perf_counter() - inicio
+            agora = time.time()
+            salvar_dados = False
+            if conteudo is None:
+                tempos["resultado"] = "nao_modificado"
+                folha.verificado_em = agora
+            else:
+                tempos["bytes"] = len(conteudo)
+                hash_conteudo = hashlib.sha1(conteudo).hexdigest()
+                if folha is not None and folha.df is not None and folha.hash_conteudo == hash_conteudo:
+                    tempos["resultado"] = "inalterado"
+                    folha.verificado_em = agora
+                else:
+                    quarentena = Quarentena()
+                    df = processar(conteudo, quarentena)
+                    quarentena.linhas = len(df) if df is not None else 0
+                    QUARENTENA[chave] = quarentena
+                    registrar_contrato(chave, quarentena.resumo())
+                    tempos["processamento_s"] = time.perf_counter() - inicio - tempos["download_s"]
+                    tempos["resultado"] = "novo"
+                    versao = max(folha.versao if folha is not None else 0, meta["versao"] if meta else 0) + 1
+                    folha = Folha(chave, df, agora, agora, versao, hash_conteudo=hash_conteudo)
+                    salvar_dados = True
+                if resposta.headers.get("ETag"): folha.etag = resposta.headers["ETag"]
+                if resposta.headers.get("Last-Modified"): folha.last_modified = resposta.headers["Last-Modified"]
+            salvar_snapshot(folha, com_dados=salvar_dados)
+        except Exception as e:
+            # Falhou a revalidação: continua servindo a última versão boa.
+            tempos["resultado"] = "erro"
+            tempos["erro"] = f"{type(e).__name__}: {e}"[:300]
+            if folha is None: folha = Folha(chave, None, time.time(), time.time())
+            else: folha.verificado_em = time.time()
+        tempos["total_s"] = time.perf_counter() - inicio
+        TEMPOS[chave] = tempos
+        _cache[chave] = folha
+        return folha
+
+
+def _atualizar_em_segundo_plano(chave):
+    try:
+        _atualizar(chave)
+    finally:
+        with _trava_global:
+            _em_atualizacao.discard(chave)
+
+
+def agendar_atualizacao(chave):
+    if MODO_OFFLINE: return
+    with _trava_global:
+        if chave in _em_atualizacao: return
+        _em_atualizacao.add(chave)
+    _executor.submit(_atualizar_em_segundo_plano, chave)
+
+
+def _laco_agendador():
+    while True:
+        time.sleep(INTERVALO_AGENDADOR)
+        for chave, folha in list(_cache.items()):
+            if _vencida(folha, MARGEM_SEGUNDOS): agendar_atualizacao(chave)
+
+
+def iniciar_agendador():
+    global _agendador
+    if MODO_OFFLINE: return
+    with _trava_global:
+        if _agendador is None:
+            _agendador = threading.Thread(target=_laco_agendador, name="agendador-planilhas", daemon=True)
+            _agendador.start()
+
+
+def _servir(chave, resultado=None):
+    iniciar_agendador()
+    folha, situacao = _consultar_cache(chave)
+    registrar_cache(chave, resultado or situacao)
+    if folha is None: return _atualizar(chave)
+    # Stale-while-revalidate: a versão em cache é servida na hora e, se estiver
+    # perto de vencer, a revalidação vai para o pool em segundo plano.
+    if _vencida(folha, MARGEM_SEGUNDOS): agendar_atualizacao(chave)
+    return folha
+
+
+def _carregar_em_paralelo(chaves):
+    # Devolve a situação de cada chave antes da carga, para a telemetria não
+    # contar como acerto o que acabou de ser baixado aqui.
+    situacoes = {c: _consultar_cache(c)[1] for c in chaves}
+    pendentes = [c for c, situacao in situacoes.items() if situacao == "falta"]
+    if pendentes:
+        list(_executor.map(_atualizar, pendentes))
+    return situacoes
+
+
+# As funções load_folha* devolvem a Folha servida (df + versão): agregados e
+# figuras são memorizados pela versão do DataFrame de fato usado, não pela que
+# estiver no cache quando forem montados (uma revalidação pode ter trocado).
+def load_folha(gid):
+    if not gid: return None
+    _registrar(gid, gid, _processar_planilha(gid))
+    return _servir(gid)
+
+
+def load_many_folhas(gids):
+    gids = list(dict.fromkeys(g for g in gids if g))
+    for gid in gids: _registrar(gid, gid, _processar_planilha(gid))
+    situacoes = _carregar_em_paralelo(gids)
+    return {g: _servir(g, situacoes[g]) for g in gids}
+
+
+def load_data(gid):
+    folha = load_folha(gid)
+    return folha.df if folha is not None else None
+
+
+def load_many(gids):
+    return {g: folha.df for g, folha in load_many_folhas(gids).items()}
+
+
+def chave_beneficiarios(gid, nome_beneficio):
+    return f"{gid}~beneficiarios~{nome_beneficio}"
+
+
+def _registrar_beneficiarios(gid, nome_beneficio):
+    chave = chave_beneficiarios(gid, nome_beneficio)
+    _registrar(chave, gid, _processar_beneficiarios(nome_beneficio))
+    return chave
+
+
+def load_many_beneficiarios(fontes):
+    # fontes: (gid, nome do benefício) -> {gid: Folha}. Bases de vidas já
+    # padronizadas (normalizacao.COLUNAS_BENEFICIARIOS), lidas em lotes direto do CSV.
+    chaves = {gid: _registrar_beneficiarios(gid, nome) for gid, nome in fontes if gid}
+    situacoes = _carregar_em_paralelo(list(chaves.values()))
+    return {gid: _servir(chave, situacoes[chave]) for gid, chave in chaves.items()}
+
+
+def _chaves_dos_gids(pedidos):
+    # Cada pedido é um GID (todas as chaves já registradas dele) ou uma chave de
+    # base de vidas (chave_beneficiarios). GID sem chave registrada fica de fora:
+    # não se sabe se é planilha bruta ou base de vidas, e ninguém o leu ainda.
+    with _trava_global:
+        registradas = {c: g for c, (g, _) in _fontes.items()}
+    chaves = []
+    for pedido in pedidos:
+        chaves += [c for c, g in registradas.items() if pedido in (c, g)]
+        if "~beneficiarios~" in pedido: chaves.append(pedido)
+    return list(dict.fromkeys(chaves))
+
+
+def atualizar(gids):
+    # Revalidação direcionada (botão "Atualizar Dados"): só os GIDs (ou chaves de
+    # bases de vidas) pedidos, ainda condicional — planilhas sem mudança não são
+    # reprocessadas.
+    chaves = _chaves_dos_gids([g for g in dict.fromkeys(gids) if g])
+    list(_executor.map(lambda c: _atualizar(c, forcar=True), chaves))
+    return {c: TEMPOS.get(c, {}).get("resultado") for c in chaves}
+
+
+def limpar_cache():
+    with _trava_global:
+        _cache.clear()
+        TEMPOS.clear()
+        QUARENTENA.clear()
+
+
+# ==============================================================================
+# Sidecar: mantém o armazenamento compartilhado atualizado para as réplicas
+# ==============================================================================
+def sincronizar_armazem(gids=(), uma_vez=False, intervalo=INTERVALO_AGENDADOR):
+    # Revalida as chaves já presentes no armazenamento (e os GIDs pedidos)
+    # antes do TTL vencer; as réplicas só adotam as versões gravadas aqui.
+    while True:
+        for chave in dict.fromkeys([*gids, *ARMAZEM.chaves()]):
+            folha = _cache.get(chave)
+            if folha is not None: folha = _sincronizar(chave, folha)
+            if folha is None or _vencida(folha, MARGEM_SEGUNDOS): _atualizar(chave, forcar=folha is not None)
+        if uma_vez: return {c: TEMPOS.get(c, {}).get("resultado") or "em dia" for c in _cache}
+        time.sleep(intervalo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sidecar do cache compartilhado (DASHBOARD_CACHE=disco ou sqlite).")
+    parser.add_argument("gids", nargs="*", help="GIDs a manter além das chaves já gravadas")
+    parser.add_argument("--uma-vez", action="store_true", help="uma passada e sai (ex.: cron)")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_AGENDADOR)
+    args = parser.parse_args()
+    if not ARMAZEM.compartilhado: parser.error("defina DASHBOARD_CACHE=disco ou DASHBOARD_CACHE=sqlite")
+    print(sincronizar_armazem(args.gids, args.uma_vez, args.intervalo))
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# Cubo de consultas (Razão Social x Status x Especialidade)
+# ==============================================================================
+def _posicoes(categorias, valores):
+    posicoes = categorias.get_indexer(list(valores))
+    return posicoes[posicoes >= 0]
+
+
+class CuboConsultas:
+    # Contagens montadas uma vez por versão da planilha de consultas, com um
+    # único np.bincount sobre os códigos das três dimensões. Status e
+    # especialidade vazios (NaN) ficam numa posição extra no fim do eixo: entram
+    # no total sem filtro, mas nunca numa seleção, como acontecia com isin().
+    # Os filtros da tela viram somas sobre fatias do cubo, sem varrer as linhas.
+    def __init__(self, df):
+        df = df if df is not None else pd.DataFrame(columns=['Razão Social', 'Status_Consulta', 'Especialidade'])
+        dimensoes = [df[col] if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].astype("category")
+                     for col in ['Razão Social', 'Status_Consulta', 'Especialidade']]
+        self.razoes, self.status, self.especialidades = (d.cat.categories for d in dimensoes)
+        r, s, e = (d.cat.codes.to_numpy().astype(np.int64) for d in dimensoes)
+        forma = (len(self.razoes), len(self.status) + 1, len(self.especialidades) + 1)
+        s[s < 0], e[e < 0] = forma[1] - 1, forma[2] - 1
+        validas = r >= 0
+        linear = (r[validas] * forma[1] + s[validas]) * forma[2] + e[validas]
+        self.contagens = np.bincount(linear, minlength=int(np.prod(forma))).reshape(forma)
+
+    def estado(self):
+        # Arrays para o cache compartilhado entre réplicas (agregados.derivado).
+        textos = lambda indice: np.array([str(v) for v in indice], dtype=str)
+        return {"razoes": textos(self.razoes), "status": textos(self.status), "especialidades": textos(self.especialidades), "contagens": self.contagens}
+
+    @classmethod
+    def do_estado(cls, estado):
+        cubo = cls.__new__(cls)
+        cubo.razoes, cubo.status, cubo.especialidades = (pd.Index(estado[n].astype(object), dtype=object) for n in ("razoes", "status", "especialidades"))
+        cubo.contagens = estado["contagens"]
+        return cubo
+
+    def vazio(self):
+        return len(self.razoes) == 0
+
+    def status_opcoes(self):
+        return list(self.status)
+
+    def especialidade_opcoes(self):
+        return list(self.especialidades)
+
+    def _fatia(self, status=None, especialidades=None):
+        cubo = self.contagens
+        if status: cubo = cubo[:, _posicoes(self.status, status), :]
+        if especialidades: cubo = cubo[:, :, _posicoes(self.especialidades, especialidades)]
+        return cubo
+
+    def por_empresa(self, status=None, especialidades=None):
+        # Total de consultas por Razão Social dentro da seleção (só > 0).
+        total = self._fatia(status, especialidades).sum(axis=(1, 2))
+        presentes = np.flatnonzero(total)
+        return pd.DataFrame({'Razão Social': self.razoes[presentes].astype(str), 'Total_Consultas': total[presentes]})
+
+    def especialidades_de(self, razao):
+        # Consultas da empresa por especialidade (todos os status), da maior
+        # para a menor.
+        posicao = self.razoes.get_indexer([razao])[0]
+        if posicao < 0: return pd.Series(dtype=np.int64, name='Qtd')
+        total = self.contagens[posicao, :, :-1].sum(axis=0)
+        serie = pd.Series(total, index=self.especialidades.astype(str), name='Qtd')
+        return serie[serie > 0].sort_values(ascending=False, kind="stable")
@@ -0,0 +1,172 @@
+import io
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from normalizacao import COLUNA_ORDEM_MES, PAPEIS_CONSULTAS, PAPEIS_ORCAMENTO, moeda_para_float, ordem_dos_meses, resolvedor_para
+
+# ==============================================================================
+# Contratos de esquema por planilha e quarentena de linhas inválidas
+# ==============================================================================
+# Um contrato declara as colunas esperadas, o tipo de cada uma e o formato de
+# moeda e de mês. Cabeçalho conferido, a planilha é lida já tipada (pyarrow,
+# só as colunas do contrato) e cada linha que não cumpre o contrato vai para a
+# quarentena, com contagem por motivo; o resto da planilha é servido. Sem
+# contrato, com cabeçalho diferente ou com uma coluna sem nenhum valor no
+# formato do contrato, vale a detecção heurística de sempre.
+MAX_AMOSTRA_QUARENTENA = 20
+
+
+@dataclass
+class Contrato:
+    nome: str
+    colunas: dict  # coluna -> "categoria" | "texto" | "moeda" | "mes"
+    moeda: str = "brl"  # "brl": R$ 1.234,56 | "decimal": 1234.56
+    mes: str = "nome"  # "nome": Janeiro/jan | "numero": 1-12
+    # coluna -> termos aceitos no cabeçalho quando o nome exato não está lá: os
+    # mesmos papéis que a detecção heurística resolve (ex.: "Mes", "Beneficio").
+    termos: dict = field(default_factory=dict)
+
+    def localizar(self, cabecalho):
+        # Coluna do contrato -> coluna da planilha (None se ausente). Nomes
+        # exatos primeiro; cada coluna da planilha atende a uma só do contrato.
+        resolvedor = resolvedor_para(tuple(cabecalho))
+        achadas = {col: col for col in self.colunas if col in set(cabecalho)}
+        for col in self.colunas:
+            if col in achadas: continue
+            real = resolvedor.achar(self.termos.get(col, [col]))
+            achadas[col] = real if real not in achadas.values() else None
+        return {col: achadas[col] for col in self.colunas}
+
+
+@dataclass
+class Quarentena:
+    contrato: str | None = None
+    caminho: str = "heuristico"  # "contrato" quando a leitura tipada foi usada
+    divergencia: list = field(default_factory=list)  # colunas do contrato ausentes ou sem valor válido
+    linhas: int = 0  # linhas servidas
+    motivos: dict = field(default_factory=dict)
+    amostra: list = field(default_factory=list)
+
+    @property
+    def total(self):
+        return sum(self.motivos.values())
+
+    def recusar(self, motivo, quantidade, exemplos=()):
+        if not quantidade: return
+        self.motivos[motivo] = self.motivos.get(motivo, 0) + int(quantidade)
+        for exemplo in exemplos:
+            if len(self.amostra) >= MAX_AMOSTRA_QUARENTENA: break
+            self.amostra.append({"motivo": motivo, **exemplo})
+
+    def resumo(self):
+        return {"contrato": self.contrato, "caminho": self.caminho, "divergencia": self.divergencia,
+                "linhas": self.linhas, "em_quarentena": self.total, "motivos": dict(self.motivos)}
+
+
+CONTRATO_ORCAMENTO = Contrato("orcamento", {"Mês": "mes", "Benefício": "categoria", "Custo Orçado": "moeda", "Custo Realizado": "moeda"},
+                               termos={"Mês": PAPEIS_ORCAMENTO["mes"], "Benefício": PAPEIS_ORCAMENTO["beneficio"],
+                                       "Custo Orçado": PAPEIS_ORCAMENTO["orcado"], "Custo Realizado": PAPEIS_ORCAMENTO["realizado"]})
+CONTRATO_CONSULTAS = Contrato("consultas", {"Razão Social": "categoria", "Status Consulta": "categoria", "Especialidade": "categoria"},
+                              termos={"Razão Social": PAPEIS_CONSULTAS["razao"], "Status Consulta": PAPEIS_CONSULTAS["status"],
+                                      "Especialidade": PAPEIS_CONSULTAS["especialidade"]})
+# Pelo nome gravado nos metadados, quem só conhece a chave (ex.: o sidecar do
+# cache compartilhado) reencontra o contrato.
+CONTRATOS = {c.nome: c for c in (CONTRATO_ORCAMENTO, CONTRATO_CONSULTAS)}
+
+
+def _ordem_numerica(serie):
+    categorica = serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype("category")
+    numeros = pd.to_numeric(pd.Series(categorica.cat.categories.astype(str)), errors="coerce").to_numpy()
+    ordens = np.append(np.where((numeros >= 1) & (numeros <= 12), np.nan_to_num(numeros), 99), 99).astype(np.int8)
+    return pd.Series(ordens[categorica.cat.codes.to_numpy()], index=serie.index, name=COLUNA_ORDEM_MES)
+
+
+def _numeros_das_linhas(conteudo, textos):
+    # Número (a partir de 1, cabeçalho incluído) de cada linha descartada pela
+    # leitura: o pyarrow lê em paralelo e não informa o número, então cada texto
+    # é procurado no arquivo, inteiro entre quebras de linha.
+    numeros, inicio_por_texto = [], {}
+    for texto in textos:
+        alvo = texto.encode()
+        posicao = inicio_por_texto.get(texto, 0)
+        while (posicao := conteudo.find(alvo, posicao)) >= 0:
+            fim = posicao + len(alvo)
+            if (posicao == 0 or conteudo[posicao - 1:posicao] == b"\n") and conteudo[fim:fim + 1] in (b"", b"\r", b"\n"): break
+            posicao += 1
+        if posicao < 0:
+            numeros.append(None)
+            continue
+        inicio_por_texto[texto] = posicao + 1
+        numeros.append(conteudo.count(b"\n", 0, posicao) + 1)
+    return numeros
+
+
+def _exemplos(df, mascara, coluna, descartadas):
+    # descartadas: números das linhas puladas na leitura, em ordem. A posição p
+    # no DataFrame é a linha p + 2 do arquivo (cabeçalho e numeração a partir
+    # de 1) somada às descartadas que vêm antes dela.
+    posicoes = np.flatnonzero(mascara)[:MAX_AMOSTRA_QUARENTENA]
+    antes = np.asarray(descartadas, dtype=np.int64) - 2 - np.arange(len(descartadas))
+    linhas = posicoes + 2 + np.searchsorted(antes, posicoes, side="right")
+    return [{"linha": int(n), "coluna": coluna, "valor": str(df[coluna].iat[p])} for p, n in zip(posicoes, linhas)]
+
+
+def ler_com_contrato(conteudo, contrato, quarentena):
+    # Devolve None (e registra a divergência) se o cabeçalho não bate.
+    quarentena.contrato = contrato.nome
+    cabecalho = pd.read_csv(io.BytesIO(conteudo), nrows=0).columns
+    achadas = contrato.localizar(cabecalho)
+    quarentena.divergencia = [col for col, real in achadas.items() if real is None]
+    if quarentena.divergencia: return None
+    # Tipos pelos nomes da planilha: o DataFrame servido mantém o cabeçalho
+    # original, como na detecção heurística.
+    colunas = {real: contrato.colunas[col] for col, real in achadas.items()}
+
+    malformadas = []
+
+    def linha_malformada(linha):
+        malformadas.append(linha.text)
+        return "skip"
+
+    tipos = {col: "category" if tipo in ("categoria", "mes") else str for col, tipo in colunas.items()}
+    df = pd.read_csv(io.BytesIO(conteudo), engine="pyarrow", usecols=list(colunas), dtype=tipos, on_bad_lines=linha_malformada)
+    numeros = _numeros_das_linhas(conteudo, malformadas) if malformadas else []
+    quarentena.recusar("colunas_a_mais", len(malformadas), sorted(({"linha": n, "valor": t[:200]} for n, t in zip(numeros, malformadas)),
+                                                                 key=lambda e: e["linha"] or 0))
+    descartadas = sorted(n for n in numeros if n is not None)
+    recusadas = np.zeros(len(df), dtype=bool)
+    convertidas = {}
+    for (nome, col), tipo in zip(achadas.items(), colunas.values()):
+        presentes = df[col].notna().to_numpy()
+        if tipo == "moeda":
+            if contrato.moeda == "brl": valores = moeda_para_float(df[col])
+            else: valores = pd.to_numeric(df[col], errors="coerce").to_numpy(np.float64)
+            invalidas = np.isnan(valores) & presentes
+            convertidas[col] = np.nan_to_num(valores, nan=0.0)
+        elif tipo == "mes":
+            ordem = ordem_dos_meses(df[col]) if contrato.mes == "nome" else _ordem_numerica(df[col])
+            invalidas = (ordem.to_numpy() == 99) & presentes
+            convertidas[COLUNA_ORDEM_MES] = ordem
+        else:
+            continue
+        if presentes.any() and invalidas.sum() == presentes.sum():
+            # Nenhum valor no formato do contrato (ex.: datas onde se esperava o
+            # nome do mês): a coluna não é a do contrato e a planilha inteira
+            # iria para a quarentena.
+            quarentena.divergencia.append(nome)
+            continue
+        quarentena.recusar(f"{tipo}_invalido", invalidas.sum(), _exemplos(df, invalidas, col, descartadas) if invalidas.any() else ())
+        recusadas |= invalidas
+    if quarentena.divergencia:
+        quarentena.motivos.clear()
+        quarentena.amostra.clear()
+        return None
+    df = df.assign(**convertidas)
+    if recusadas.any():
+        df = df[~recusadas].reset_index(drop=True)
+        for col, tipo in colunas.items():
+            if tipo in ("categoria", "mes"): df[col] = df[col].cat.remove_unused_categories()
+    quarentena.caminho = "contrato"
+    return df
@@ -0,0 +1,174 @@
+import importlib.util
+import io
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import pandas as pd
+
+# ==============================================================================
+# Exportações (CSV / XLSX / Parquet) geradas fora do rerun
+# ==============================================================================
+# Cada pedido vira um trabalho num pool próprio de threads: o rerun só agenda e
+# lê o progresso, e um arquivo grande nunca segura o script de outra sessão.
+# Trabalhos são identificados pela chave (dados + versão + filtros + formato):
+# o mesmo relatório pedido por várias sessões é gerado uma vez só.
+MAX_EXPORTACOES = 2
+MAX_RESULTADOS = 16
+# Arquivos prontos ficam em memória até serem baixados; além da contagem, o
+# total guardado tem teto em bytes (os mais antigos saem primeiro).
+MAX_BYTES_RESULTADOS = 256 * 1024 * 1024
+LINHAS_POR_BLOCO = 50_000
+
+# XLSX depende de openpyxl ou xlsxwriter; sem nenhum dos dois o formato não é
+# oferecido. CSV e Parquet usam o pyarrow, que já é dependência do carregamento.
+MOTOR_XLSX = next((m for m in ("xlsxwriter", "openpyxl") if importlib.util.find_spec(m)), None)
+FORMATOS = {
+    "CSV": (".csv", "text/csv"),
+    "XLSX": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+
+@dataclass
+class Trabalho:
+    id: str
+    chave: tuple
+    nome_arquivo: str
+    formato: str
+    estado: str = "fila"  # fila -> gerando -> pronto | erro
+    progresso: float = 0.0
+    dados: bytes | None = None
+    erro: str | None = None
+    linhas: int = 0
+    segundos: float = 0.0
+
+    @property
+    def mime(self):
+        return FORMATOS[self.formato][1]
+
+    def concluido(self):
+        return self.estado in ("pronto", "erro")
+
+
+_trabalhos = OrderedDict()
+_por_id = {}
+_trava = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=MAX_EXPORTACOES, thread_name_prefix="exportacao")
+
+
+def formatos_disponiveis():
+    return [f for f in FORMATOS if f != "XLSX" or MOTOR_XLSX]
+
+
+def _texto_em_listas(df):
+    # Colunas com listas (ex.: Lista_Beneficios) viram texto em CSV/XLSX.
+    colunas = [c for c in df.columns if df[c].dtype == object and df[c].map(lambda v: isinstance(v, (list, tuple))).any()]
+    return df.assign(**{c: df[c].map(lambda v: ", ".join(map(str, v)) if isinstance(v, (list, tuple)) else v) for c in colunas}) if colunas else df
+
+
+def _blocos(df):
+    for inicio in range(0, max(len(df), 1), LINHAS_POR_BLOCO):
+        yield inicio, df.iloc[inicio:inicio + LINHAS_POR_BLOCO]
+
+
+def _csv(df, trabalho):
+    # Escritor CSV do pyarrow: é C++ e solta o GIL, então gerar um arquivo
+    # grande quase não atrasa o rerun das outras sessões (o to_csv do pandas
+    # segura o GIL bloco a bloco).
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    df = _texto_em_listas(df).rename(columns=str)
+    esquema = pa.Schema.from_pandas(df, preserve_index=False)
+    saida = io.BytesIO()
+    # BOM para o Excel abrir os acentos corretamente.
+    saida.write("\ufeff".encode("utf-8"))
+    with pa_csv.CSVWriter(saida, esquema, write_options=pa_csv.WriteOptions(quoting_style="needed")) as escritor:
+        for inicio, bloco in _blocos(df):
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+            trabalho.progresso = min(1.0, (inicio + len(bloco)) / max(len(df), 1))
+    return saida.getvalue()
+
+
+def _xlsx(df, trabalho):
+    df = _texto_em_listas(df)
+    saida = io.BytesIO()
+    with pd.ExcelWriter(saida, engine=MOTOR_XLSX) as escritor:
+        for inicio, bloco in _blocos(df):
+            bloco.to_excel(escritor, index=False, header=inicio == 0, startrow=inicio + (inicio > 0), sheet_name="Dados")
+            trabalho.progresso = min(1.0, (inicio + len(bloco)) / max(len(df), 1))
+    return saida.getvalue()
+
+
+def _parquet(df, trabalho):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    saida = io.BytesIO()
+    df = df.rename(columns=str)
+    esquema = pa.Schema.from_pandas(df, preserve_index=False)
+    with pq.ParquetWriter(saida, esquema) as escritor:
+        for inicio, bloco in _blocos(df):
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+            trabalho.progresso = min(1.0, (inicio + len(bloco)) / max(len(df), 1))
+    return saida.getvalue()
+
+
+ESCRITORES = {"CSV": _csv, "XLSX": _xlsx, "Parquet": _parquet}
+
+
+def _podar(manter=None):
+    # Chamada com _trava. Só resultados concluídos saem do cache (os em
+    # andamento ficam), e nunca o que acabou de ficar pronto (`manter`).
+    def excedeu():
+        guardados = sum(len(t.dados or b"") for t in _trabalhos.values())
+        return len(_trabalhos) > MAX_RESULTADOS or guardados > MAX_BYTES_RESULTADOS
+    while excedeu():
+        antigo = next((k for k, t in _trabalhos.items() if t.concluido() and t is not manter), None)
+        if antigo is None: break
+        _por_id.pop(_trabalhos.pop(antigo).id, None)
+
+
+def _executar(trabalho, construir):
+    inicio = time.perf_counter()
+    trabalho.estado = "gerando"
+    try:
+        df = construir()
+        df = pd.DataFrame() if df is None else df
+        trabalho.linhas = len(df)
+        trabalho.dados = ESCRITORES[trabalho.formato](df, trabalho)
+        trabalho.progresso = 1.0
+        trabalho.estado = "pronto"
+    except Exception as e:
+        trabalho.erro = f"{type(e).__name__}: {e}"
+        trabalho.estado = "erro"
+    trabalho.segundos = time.perf_counter() - inicio
+    with _trava: _podar(manter=trabalho)
+
+
+def solicitar(chave, nome_arquivo, formato, construir):
+    # construir: função que devolve o DataFrame (normalmente lido de um
+    # agregado em cache); roda na thread de exportação, não no rerun.
+    chave = (chave, formato)
+    with _trava:
+        trabalho = _trabalhos.get(chave)
+        if trabalho is not None and trabalho.estado != "erro":
+            _trabalhos.move_to_end(chave)
+            return trabalho
+        extensao = FORMATOS[formato][0]
+        nome_arquivo = re.sub(r"[^\w.-]+", "_", str(nome_arquivo)).strip("_") or "exportacao"
+        trabalho = Trabalho(id=uuid.uuid4().hex, chave=chave, nome_arquivo=f"{nome_arquivo}{extensao}", formato=formato)
+        _trabalhos[chave] = trabalho
+        _por_id[trabalho.id] = trabalho
+        _podar()
+    _executor.submit(_executar, trabalho, construir)
+    return trabalho
+
+
+def obter(id_trabalho):
+    with _trava:
+        return _por_id.get(id_trabalho)
+
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# ==============================================================================
+# Formatação vetorizada (R$) e gradientes de cor para as tabelas
+# ==============================================================================
+# "1,234.56" -> "1.234,56": a troca dos separadores é feita num único
+# str.translate sobre a coluna inteira já concatenada.
+TROCA_SEPARADORES = str.maketrans({",": ".", ".": ","})
+
+# Âncoras da paleta "Reds" (ColorBrewer, a mesma do matplotlib), igualmente
+# espaçadas de 0 a 1.
+PALETA_REDS = ["#fff5f0", "#fee0d2", "#fcbba1", "#fc9272", "#fb6a4a", "#ef3b2c", "#cb181d", "#a50f15", "#67000d"]
+NIVEIS_GRADIENTE = 256
+# Fundo escuro ganha texto claro (mesmo limiar de luminância do Styler).
+LIMIAR_LUMINANCIA = 0.408
+ESTILO_TOTAL = "background-color: #f0f2f6; color: black; font-weight: bold;"
+
+
+def _como_float(valores):
+    if isinstance(valores, np.ndarray) and valores.dtype.kind == "f": return np.nan_to_num(valores, nan=0.0, posinf=np.inf, neginf=-np.inf)
+    return pd.to_numeric(pd.Series(valores), errors="coerce").fillna(0).to_numpy(np.float64)
+
+
+def formatar_moeda(valor):
+    try:
+        if pd.isna(valor): return "R$ 0,00"
+        return f"R$ {float(valor):,.2f}".translate(TROCA_SEPARADORES)
+    except:
+        return "R$ 0,00"
+
+
+def rotulos(valores, modelo, brl=True):
+    # Aplica um str.format a todos os valores numa passada; a troca de
+    # separadores (brl=True) também é uma só, sobre o texto concatenado.
+    numeros = _como_float(valores)
+    if len(numeros) == 0: return []
+    texto = "\n".join(map(modelo.format, numeros.tolist()))
+    return (texto.translate(TROCA_SEPARADORES) if brl else texto).split("\n")
+
+
+def _como_saida(textos, valores):
+    if isinstance(valores, pd.Series): return pd.Series(textos, index=valores.index, name=valores.name, dtype=object)
+    return np.array(textos, dtype=object)
+
+
+def moeda_brl(valores, casas=2):
+    # Mesmo texto do formatar_moeda ("R$ 1.234,56"; vazio/inválido -> "R$ 0,00")
+    # para uma Series/array inteira de uma vez.
+    return _como_saida(rotulos(valores, f"R$ {{:,.{casas}f}}"), valores)
+
+
+def percentual(valores, casas=1):
+    # Fração -> "12.3%" (mesmo texto dos rótulos f"{x*100:.1f}%").
+    return _como_saida(rotulos(_como_float(valores) * 100, f"{{:.{casas}f}}%", brl=False), valores)
+
+
+def tabela_moeda_brl(df):
+    # DataFrame numérico inteiro em uma passada (não coluna a coluna).
+    textos = moeda_brl(df.to_numpy(np.float64).ravel()).reshape(df.shape)
+    return pd.DataFrame(textos, index=df.index, columns=df.columns)
+
+
+def _tabela_cores(paleta, niveis):
+    ancoras = np.array([[int(cor[i:i + 2], 16) for i in (1, 3, 5)] for cor in paleta], dtype=np.float64) / 255
+    posicoes = np.linspace(0, 1, len(paleta))
+    pontos = np.linspace(0, 1, niveis)
+    rgb = np.column_stack([np.interp(pontos, posicoes, ancoras[:, canal]) for canal in range(3)])
+    linear = np.where(rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    luminancia = linear @ np.array([0.2126, 0.7152, 0.0722])
+    return np.array([f"background-color: #{r:02x}{g:02x}{b:02x};color: {'#f1f1f1' if l < LIMIAR_LUMINANCIA else '#000000'};"
+                     for (r, g, b), l in zip(np.round(rgb * 255).astype(int), luminancia)], dtype=object)
+
+
+# Uma string CSS por nível da paleta, montada uma única vez no import.
+CSS_REDS = _tabela_cores(PALETA_REDS, NIVEIS_GRADIENTE)
+
+
+def gradiente(valores, vmin=None, vmax=None, eixo=0, tabela=CSS_REDS):
+    # Equivalente ao background_gradient sem matplotlib: normaliza (por coluna
+    # com eixo=0, como o Styler; eixo=None usa a tabela toda), quantiza nos
+    # níveis da paleta e indexa a tabela de CSS. NaN fica sem estilo.
+    numeros = np.asarray(valores, dtype=np.float64)
+    saida = np.full(numeros.shape, "", dtype=object)
+    validos = ~np.isnan(numeros)
+    if not validos.any(): return saida
+    eixo = eixo if numeros.ndim > 1 else None
+    inferior = np.nanmin(numeros, axis=eixo, keepdims=True) if vmin is None else np.float64(vmin)
+    superior = np.nanmax(numeros, axis=eixo, keepdims=True) if vmax is None else np.float64(vmax)
+    amplitude = superior - inferior
+    with np.errstate(divide="ignore", invalid="ignore"):
+        escala = np.where(amplitude > 0, (numeros - inferior) / amplitude, 0.0)
+    niveis = np.clip(np.nan_to_num(escala * len(tabela)).astype(np.int64), 0, len(tabela) - 1)
+    saida[validos] = tabela[niveis[validos]]
+    return saida
@@ -0,0 +1,230 @@
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# ==============================================================================
+# Normalização de textos e colunas das planilhas
+# ==============================================================================
+TERMOS_FINANCEIROS = ["custo", "valor", "total", "orçado", "realizado", "budget", "soma", "mensalidade", "preço"]
+
+# Papéis semânticos de cada tipo de planilha -> termos procurados no cabeçalho,
+# em ordem de prioridade.
+PAPEIS_ORCAMENTO = {
+    "mes": ["mês", "mes", "data"],
+    "beneficio": ["beneficio", "benefício"],
+    "realizado": ["realizado", "executado", "soma", "custo", "valor"],
+    "orcado": ["orçado", "orcado", "budget"],
+}
+PAPEIS_BENEFICIARIOS = {
+    "razao": ["razão social", "razao social", "empresa", "cliente", "nome fantasia", "unidade"],
+    "status": ["status", "situacao"],
+    "plano": ["plano", "produto"],
+    "tipo_usuario": ["usuário", "usuario", "tipo"],
+    "nome": ["nome", "beneficiario", "colaborador"],
+    "valor_titular": ["valor titular", "custo titular"],
+    "valor_dependente": ["valor dependente", "custo dependente"],
+    "valor_unico": ["valor", "custo", "preço", "mensalidade"],
+    "regional": ["regional", "região", "estado"],
+}
+PAPEIS_CONSULTAS = {
+    "razao": ["razão social", "razao social", "empresa"],
+    "status": ["status consulta", "status"],
+    "especialidade": ["especialidade", "tipo consulta"],
+}
+TODOS_PAPEIS = [PAPEIS_ORCAMENTO, PAPEIS_BENEFICIARIOS, PAPEIS_CONSULTAS]
+# Papéis das bases de vidas lidos do CSV (sempre como texto, exceto valores).
+COLUNAS_TEXTO_BENEFICIARIOS = ["razao", "status", "plano", "tipo_usuario", "regional"]
+PAPEIS_LIDOS_BENEFICIARIOS = COLUNAS_TEXTO_BENEFICIARIOS + ["valor_titular", "valor_dependente", "valor_unico"]
+# Base de vidas padronizada: dimensões como Categoricals (códigos inteiros),
+# custo float32 e as marcações Ativo/Titular já calculadas.
+CATEGORICAS_BENEFICIARIOS = ['Razão Social', 'Benefício', 'Status', 'Tipo de Usuário', 'Regional']
+COLUNAS_BENEFICIARIOS = CATEGORICAS_BENEFICIARIOS + ['Custo_Calculado', 'Ativo', 'Titular']
+
+MAPA_MESES = {'jan': 1, 'fev': 2, 'mar': 3, 'abr': 4, 'mai': 5, 'jun': 6,
+              'jul': 7, 'ago': 8, 'set': 9, 'out': 10, 'nov': 11, 'dez': 12}
+# Ordinal do mês (1-12, 99 = desconhecido) calculado na carga da planilha.
+COLUNA_ORDEM_MES = "Mes_Ordem"
+
+# "R$ 1.234,56" -> "1234.56": str.translate remove o símbolo, os espaços e o
+# separador de milhar e troca a vírgula decimal.
+TABELA_MOEDA = str.maketrans({"R": None, "$": None, " ": None, "\xa0": None, ".": None, ",": "."})
+
+# Decisão "quais colunas são financeiras" por assinatura de cabeçalho: a mesma
+# planilha recarregada não passa de novo pela heurística.
+_colunas_financeiras_por_cabecalho = {}
+
+
+def remover_acentos(texto):
+    try:
+        nfkd = unicodedata.normalize('NFKD', str(texto))
+        return "".join([c for c in nfkd if not unicodedata.combining(c)]).lower()
+    except:
+        return str(texto).lower()
+
+
+class ResolvedorColunas:
+    # Índice de um cabeçalho: os nomes são normalizados uma única vez e cada
+    # lista de termos já procurada fica memorizada.
+    def __init__(self, colunas):
+        self.colunas = tuple(colunas)
+        self._normalizadas = [(col, remover_acentos(col)) for col in self.colunas]
+        self._memo = {}
+
+    def achar(self, termos):
+        chave = tuple(termos)
+        if chave not in self._memo:
+            self._memo[chave] = self._procurar(chave)
+        return self._memo[chave]
+
+    def _procurar(self, termos):
+        for termo in termos:
+            termo_limpo = remover_acentos(termo)
+            for col_original, col_limpa in self._normalizadas:
+                if termo_limpo in col_limpa:
+                    return col_original
+        return None
+
+    def resolver(self, papeis):
+        return {papel: self.achar(termos) for papel, termos in papeis.items()}
+
+
+@lru_cache(maxsize=256)
+def resolvedor_para(colunas):
+    resolvedor = ResolvedorColunas(colunas)
+    for papeis in TODOS_PAPEIS: resolvedor.resolver(papeis)
+    return resolvedor
+
+
+def achar_coluna(df, termos):
+    return resolvedor_para(tuple(df.columns)).achar(termos)
+
+
+def resolver_papeis(df, papeis):
+    return resolvedor_para(tuple(df.columns)).resolver(papeis)
+
+
+def get_mes_ordem(nome_mes):
+    return MAPA_MESES.get(str(nome_mes).lower()[:3], 99)
+
+
+def ordem_dos_meses(serie):
+    # O get_mes_ordem roda só nas categorias (no máximo algumas dezenas de
+    # rótulos); as linhas recebem o ordinal indexando pelos códigos.
+    categorica = serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype("category")
+    ordens = np.array([get_mes_ordem(c) for c in categorica.cat.categories] + [99], dtype=np.int8)
+    return pd.Series(ordens[categorica.cat.codes.to_numpy()], index=serie.index, name=COLUNA_ORDEM_MES)
+
+
+def preparar_dimensoes(df):
+    # Mês, benefício e razão social viram Categoricals (groupby/isin sobre
+    # códigos inteiros) e o mês ganha a coluna int8 de ordenação.
+    papeis = resolver_papeis(df, PAPEIS_ORCAMENTO)
+    dimensoes = [papeis["mes"], papeis["beneficio"], achar_coluna(df, PAPEIS_BENEFICIARIOS["razao"])]
+    for col in dict.fromkeys(c for c in dimensoes if c):
+        if df[col].dtype.kind in "OUS" or pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype("category")
+    if papeis["mes"] and COLUNA_ORDEM_MES not in df.columns:
+        df[COLUNA_ORDEM_MES] = ordem_dos_meses(df[papeis["mes"]])
+    return df
+
+
+def _tem_cifrao(serie):
+    if serie.dtype.kind in "biufc": return False
+    validos = serie.notna().to_numpy()
+    if not validos.any(): return False
+    return "R$" in str(serie.iat[int(validos.argmax())])
+
+
+def colunas_financeiras(df):
+    assinatura = tuple(df.columns)
+    colunas = _colunas_financeiras_por_cabecalho.get(assinatura)
+    if colunas is None:
+        colunas = [col for col in df.columns
+                   if any(t in remover_acentos(col) for t in TERMOS_FINANCEIROS) or _tem_cifrao(df[col])]
+        _colunas_financeiras_por_cabecalho[assinatura] = colunas
+    return colunas
+
+
+def moeda_para_float(serie):
+    # float64 com NaN nas células vazias e nos textos que não são valor; "R$ -"
+    # (zero no formato contábil) vale 0.
+    if serie.dtype.kind in "biuf": return serie.to_numpy(np.float64, na_value=np.nan)
+    # A coluna inteira vira um único texto: o translate e a conversão para float
+    # rodam em C numa passada só, em vez de um replace por célula em Python.
+    partes = "\n".join(map(str, serie.fillna("nan").tolist())).translate(TABELA_MOEDA).split("\n")
+    if len(partes) != len(serie):
+        partes = serie.fillna("nan").astype(str).str.translate(TABELA_MOEDA)
+    try:
+        return np.array(partes, dtype=np.float64)
+    except ValueError:
+        partes = pd.Series(partes)
+        return pd.to_numeric(partes.mask(partes.isin(["", "-"]), "0"), errors="coerce").to_numpy(np.float64)
+
+
+def converter_moeda(serie):
+    return pd.Series(moeda_para_float(serie), index=serie.index, name=serie.name).fillna(0)
+
+
+def centavos(valores):
+    # Custo guardado em float32 (ex.: 1643.96 -> 1643.9599609375) volta a
+    # centavos exatos em float64 antes de somar ou exportar.
+    return np.round(np.asarray(valores, dtype=np.float64), 2)
+
+
+def tratar_colunas_financeiras(df):
+    for col in colunas_financeiras(df):
+        df[col] = converter_moeda(df[col])
+    return df
+
+
+def marcar_categorias(categorica, teste):
+    # O teste de texto roda só nas categorias; cada linha herda a marcação pelo
+    # código (NaN, código -1, fica False).
+    marcas = np.array([teste(str(c)) for c in categorica.cat.categories] + [False], dtype=bool)
+    return marcas[categorica.cat.codes.to_numpy()]
+
+
+def padronizar_beneficiarios(df, papeis, nome_beneficio):
+    # Todas as vidas ficam na base (ativas ou não): status e tipo de usuário
+    # viram códigos e as marcações Ativo/Titular saem das categorias, sem
+    # varrer o texto de cada linha.
+    status = df[papeis["status"]].astype("category") if papeis["status"] else pd.Categorical(np.full(len(df), 'active'))
+    tipo = df[papeis["tipo_usuario"]].astype("category") if papeis["tipo_usuario"] else pd.Categorical(np.full(len(df), 'Titular'))
+    status, tipo = pd.Series(status, index=df.index), pd.Series(tipo, index=df.index)
+    ativo = marcar_categorias(status, lambda s: s.lower() == 'active')
+    titular = marcar_categorias(tipo, lambda t: 'titular' in t.lower())
+
+    custo = np.zeros(len(df))
+    if papeis["tipo_usuario"] and papeis["valor_titular"] and papeis["valor_dependente"]:
+        custo = np.where(titular, converter_moeda(df[papeis["valor_titular"]]), converter_moeda(df[papeis["valor_dependente"]]))
+    elif papeis["valor_unico"]:
+        custo = converter_moeda(df[papeis["valor_unico"]]).to_numpy()
+
+    saida = pd.DataFrame({
+        'Razão Social': df[papeis["razao"]],
+        'Benefício': df[papeis["plano"]] if papeis["plano"] else nome_beneficio,
+        'Status': status,
+        'Tipo de Usuário': tipo,
+        'Regional': df[papeis["regional"]] if papeis["regional"] else 'Geral',
+        'Custo_Calculado': custo.astype(np.float32),
+        'Ativo': ativo,
+        'Titular': titular,
+    }, index=df.index)
+    for col in CATEGORICAS_BENEFICIARIOS:
+        saida[col] = saida[col].astype("category")
+    return saida
+
+
+def juntar_lotes_beneficiarios(lotes):
+    if not lotes: return pd.DataFrame(columns=COLUNAS_BENEFICIARIOS)
+    dados = {}
+    for col in COLUNAS_BENEFICIARIOS:
+        partes = [lote[col] for lote in lotes]
+        if col in CATEGORICAS_BENEFICIARIOS:
+            dados[col] = pd.Series(union_categoricals([p.array for p in partes]))
+        else:
+            dados[col] = pd.concat(partes, ignore_index=True)
+    return pd.DataFrame(dados)
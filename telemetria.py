@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# ==============================================================================
+# Telemetria de renderização (tempos por visão/etapa e cache por GID)
+# ==============================================================================
+# As amostras ficam no processo (compartilhadas entre sessões). Com
+# DASHBOARD_TELEMETRIA_LOG=INFO cada medição também sai como uma linha JSON no
+# logger "dashboard.telemetria" (stderr), para achar regressões em produção sem
+# anexar um profiler; o padrão (WARNING) não registra as medições.
+MAX_AMOSTRAS = 500
+
+logger = logging.getLogger("dashboard.telemetria")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(os.environ.get("DASHBOARD_TELEMETRIA_LOG", "WARNING").upper())
+    logger.propagate = False
+
+_amostras = defaultdict(lambda: deque(maxlen=MAX_AMOSTRAS))
+_cache = defaultdict(lambda: defaultdict(int))
+_execucoes = defaultdict(int)
+_trava = threading.Lock()
+
+
+def _log(evento, **campos):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"ts": round(time.time(), 3), "evento": evento, **campos}, ensure_ascii=False))
+
+
+def registrar(visao, etapa, segundos, erro=None):
+    with _trava:
+        _amostras[(visao, etapa)].append(segundos)
+    _log("etapa", visao=visao, etapa=etapa, ms=round(segundos * 1000, 2), erro=erro)
+
+
+@contextmanager
+def medir(visao, etapa):
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield
+    except Exception as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        registrar(visao, etapa, time.perf_counter() - inicio, erro)
+
+
+def registrar_cache(chave, resultado):
+    # resultado: "memoria" (acerto), "snapshot" (acerto em disco) ou "falta".
+    with _trava:
+        _cache[chave][resultado] += 1
+    _log("cache", chave=chave, resultado=resultado)
+
+
+def registrar_contrato(chave, resumo):
+    # Caminho de leitura da planilha (contrato/heurístico) e linhas em quarentena.
+    _log("contrato", chave=chave, **resumo)
+
+
+def resumo_etapas():
+    with _trava:
+        copia = {k: list(v) for k, v in _amostras.items()}
+    linhas = []
+    for (visao, etapa), valores in sorted(copia.items()):
+        ms = np.array(valores) * 1000
+        linhas.append({"Visão": visao, "Etapa": etapa, "N": len(ms), "p50 (ms)": float(np.percentile(ms, 50)),
+                       "p95 (ms)": float(np.percentile(ms, 95)), "Máx (ms)": float(ms.max())})
+    return linhas
+
+
+def amostras(visao, etapa):
+    with _trava:
+        return [s * 1000 for s in _amostras.get((visao, etapa), ())]
+
+
+def contar(regiao):
+    # Execuções do script inteiro ("completa") ou de um fragmento.
+    with _trava:
+        _execucoes[regiao] += 1
+
+
+def contadores():
+    with _trava:
+        return dict(sorted(_execucoes.items()))
+
+
+def resumo_cache():
+    with _trava:
+        return [{"Chave": chave, **contagens} for chave, contagens in sorted(_cache.items())]
+
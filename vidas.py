@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+from normalizacao import CATEGORICAS_BENEFICIARIOS
+
+# ==============================================================================
+# Base colunar de vidas (uma por versão de planilha)
+# ==============================================================================
+class BaseVidas:
+    # Códigos inteiros de cada dimensão (Razão Social, Benefício, Status, Tipo
+    # de Usuário, Regional), custo float32 contíguo e os bitmaps Ativo/Titular.
+    # Os arrays são vistas dos Categoricals do DataFrame carregado (sem cópia),
+    # e os filtros viram comparações de inteiros combinadas com AND.
+    def __init__(self, df):
+        df = df if df is not None else pd.DataFrame()
+        self.tamanho = len(df)
+        self.codigos, self.categorias = {}, {}
+        for col in CATEGORICAS_BENEFICIARIOS:
+            if col not in df.columns: continue
+            serie = df[col] if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].astype("category")
+            self.codigos[col] = serie.cat.codes.to_numpy()
+            self.categorias[col] = serie.cat.categories
+        self.custo = df['Custo_Calculado'].to_numpy(np.float32) if 'Custo_Calculado' in df.columns else np.zeros(self.tamanho, np.float32)
+        # Snapshots antigos só traziam vidas ativas e não têm as marcações.
+        self.ativo = df['Ativo'].to_numpy(bool) if 'Ativo' in df.columns else np.ones(self.tamanho, bool)
+        self.titular = df['Titular'].to_numpy(bool) if 'Titular' in df.columns else np.ones(self.tamanho, bool)
+
+    def codigos_de(self, coluna, valores):
+        if isinstance(valores, (str, int, float)) or valores is None: valores = [valores]
+        posicoes = self.categorias[coluna].get_indexer(list(valores))
+        return posicoes[posicoes >= 0]
+
+    def mascara(self, ativo=True, titular=None, **filtros):
+        # filtros: coluna -> valor ou lista de valores, ex.
+        # mascara(**{'Benefício': ['V4 - Starbem'], 'Razão Social': 'EMPRESA X'}).
+        m = self.ativo.copy() if ativo else np.ones(self.tamanho, bool)
+        if titular is not None: m &= self.titular if titular else ~self.titular
+        for coluna, valores in filtros.items():
+            if coluna not in self.codigos: return np.zeros(self.tamanho, bool)
+            codigos = self.codigos_de(coluna, valores)
+            m &= (self.codigos[coluna] == codigos[0]) if len(codigos) == 1 else np.isin(self.codigos[coluna], codigos)
+        return m